@@ -0,0 +1,110 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+import sys
+import argparse
+import time
+import numpy as np
+
+from pipelines.pdf2html import Document2Html
+from utilities.spatial_index import GridIndex
+
+def random_page(rng, num_spans, num_regions, width = 1224.0, height = 1584.0):
+    # text spans (a few of them degenerate: inverted on one or both axes, zero-area, zero-width) and layout regions
+    x_min = rng.uniform(0, width, num_spans)
+    y_min = rng.uniform(0, height, num_spans)
+    spans = np.stack([x_min, y_min, x_min + rng.uniform(5, 300, num_spans), y_min + rng.uniform(5, 30, num_spans)], axis = 1)
+    degenerate = rng.choice(num_spans, num_spans // 10, replace = False)
+    for k, i in enumerate(degenerate):
+        if k % 4 == 0:
+            spans[i, [0, 2]] = spans[i, [2, 0]]  # inverted on x
+        elif k % 4 == 1:
+            spans[i, [1, 3]] = spans[i, [3, 1]]  # inverted on y
+        elif k % 4 == 2:
+            spans[i, 2:4] = spans[i, 0:2]  # zero-area
+        else:
+            spans[i, 2] = spans[i, 0]  # zero-width
+
+    x_min = rng.uniform(0, width, num_regions)
+    y_min = rng.uniform(0, height, num_regions)
+    regions = np.stack([x_min, y_min, x_min + rng.uniform(20, 600, num_regions), y_min + rng.uniform(20, 400, num_regions)], axis = 1)
+
+    return spans, regions
+
+def to_quad(region):
+    return [(region[0], region[1]), (region[2], region[1]), (region[2], region[3]), (region[0], region[3])]
+
+def check(assembler, spans, regions):
+    """
+    Description:
+      compare the indexed assignment of spans (boxes and centers) to regions with the per-box tests of Document2Html
+      return: number of mismatching regions, seconds for the per-box tests, seconds for the indexed tests
+    """
+
+    mismatches = 0
+    centers = np.stack([(spans[:, 0] + spans[:, 2]) / 2.0, (spans[:, 1] + spans[:, 3]) / 2.0], axis = 1)
+
+    start = time.time()
+    reference = []
+    for region in regions:
+        layout_box = to_quad(region)
+        reference.append(([j for j in range(len(spans)) if assembler._is_box_inside(spans[j], layout_box)],
+                          [j for j in range(len(spans)) if assembler._point_in_box(layout_box, centers[j])]))
+    per_box_time = time.time() - start
+
+    start = time.time()
+    span_index = GridIndex(spans)
+    span_center_index = GridIndex(centers)
+    indexed = []
+    for region in regions:
+        layout_box = to_quad(region)
+        candidates = span_index.query(layout_box[0][0], layout_box[0][1], layout_box[2][0], layout_box[2][1])
+        indexed.append((candidates[assembler._boxes_inside(spans[candidates], layout_box)].tolist(),
+                        assembler._points_in_box_indexed(layout_box, centers, span_center_index).tolist()))
+    indexed_time = time.time() - start
+
+    for (boxes, points), (reference_boxes, reference_points) in zip(indexed, reference):
+        if boxes != reference_boxes or points != reference_points:
+            mismatches += 1
+
+    return mismatches, per_box_time, indexed_time
+
+def main():
+    """
+    Description:
+      equivalence and speed of the grid index used to assign text spans to layout regions, w.r.t. the per-box tests
+      usage: python benchmark_spatial_index.py [--num_pages 20] [--num_spans 3000] [--num_regions 150]
+    """
+
+    # parse parameters
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_pages", help = "specify the number of random pages", type = int, default = 20)
+    parser.add_argument("--num_spans", help = "specify the maximum number of text spans per page", type = int, default = 3000)
+    parser.add_argument("--num_regions", help = "specify the maximum number of layout regions per page", type = int, default = 150)
+    parser.add_argument("--seed", help = "specify the random seed", type = int, default = 0)
+    args = parser.parse_args()
+
+    # only the box tests of the pipeline are used, hence no models are loaded
+    assembler = object.__new__(Document2Html)
+    rng = np.random.RandomState(args.seed)
+    failed = False
+
+    # regression: boxes inverted on one axis and zero-area boxes must neither crash the index nor be matched
+    spans = np.array([[0, 0, 10, 10], [80, 0, 20, 10], [30, 40, 50, 20], [60, 60, 60, 60], [70, 0, 70, 10], [100, 100, 110, 110]], dtype = np.float64)
+    regions = np.array([[0, 0, 120, 120], [15, 0, 85, 15], [25, 15, 55, 45], [55, 55, 65, 65], [105, 105, 115, 115]], dtype = np.float64)
+    mismatches, _, _ = check(assembler, spans, regions)
+    print ('degenerate boxes: %d mismatches' % (mismatches))
+    failed = failed or mismatches > 0
+
+    # random pages
+    for page in range(args.num_pages):
+        spans, regions = random_page(rng, rng.randint(1, args.num_spans + 1), rng.randint(1, args.num_regions + 1))
+        mismatches, per_box_time, indexed_time = check(assembler, spans, regions)
+        print ('page %d (%d spans, %d regions): %d mismatches, per-box %.3f s, indexed %.3f s' % (page, len(spans), len(regions), mismatches, per_box_time, indexed_time))
+        failed = failed or mismatches > 0
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    # execute only if run as a script
+    sys.exit(main())
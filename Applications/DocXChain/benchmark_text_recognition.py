@@ -0,0 +1,59 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+import sys
+import argparse
+import time
+
+from modules.file_loading import load_document
+from modules.text_detection import TextDetection
+from modules.text_recognition import TextRecognition
+
+def main():
+    """
+    Description:
+      throughput (text lines per second) of text recognition on a dense page, one by one vs. in batches, and the number of text lines recognized differently in batches
+      usage: python benchmark_text_recognition.py <document_file_path> [--batch_sizes 1 8 16 32] [--model_path <recognition_model>]
+    """
+
+    # parse parameters
+    parser = argparse.ArgumentParser()
+    parser.add_argument("document_path", help = "specify the path of a dense page (supported formats: JPG, PNG, and PDF, of which the first page is used)", type = str)
+    parser.add_argument("--batch_sizes", help = "specify the batch sizes to be compared (1: one by one)", type = int, nargs = '+', default = [1, 8, 16, 32])
+    parser.add_argument("--model_path", help = "specify the text recognition model to be checked", type = str, default = 'damo/cv_convnextTiny_ocr-recognition-document_damo')
+    parser.add_argument("--num_workers", help = "specify the number of threads for cropping", type = int, default = 4)
+    parser.add_argument("--repeats", help = "specify the number of timed runs for each batch size", type = int, default = 3)
+    args = parser.parse_args()
+
+    # load document and detect text lines (once, the detections are shared by all runs)
+    image = load_document(args.document_path)
+    text_detector = TextDetection({'from_modelscope_flag': True, 'model_path': 'damo/cv_resnet18_ocr-detection-line-level_damo'})
+    det_result = text_detector(image)
+    text_detector.release()
+    print ('Number of text lines: ', det_result.shape[0])
+
+    # recognize with different batch sizes
+    reference = None
+    for batch_size in args.batch_sizes:
+        text_recognizer = TextRecognition({'from_modelscope_flag': True, 'model_path': args.model_path,
+                                           'batch_size': batch_size, 'num_workers': args.num_workers})
+        rec_result = text_recognizer(image, det_result)  # warm up
+
+        start = time.time()
+        for _ in range(args.repeats):
+            rec_result = text_recognizer(image, det_result)
+        elapsed = (time.time() - start) / args.repeats
+
+        texts = [rec['text'] for rec in rec_result]
+        if reference is None:
+            reference = texts
+        mismatches = sum([1 for text, reference_text in zip(texts, reference) if text != reference_text]) + abs(len(texts) - len(reference))
+        print ('batch size %d: %.1f lines/s (%.3f s per page), %d mismatches w.r.t. batch size %d' % (batch_size, det_result.shape[0] / elapsed, elapsed, mismatches, args.batch_sizes[0]))
+
+        text_recognizer.release()
+
+    return
+
+if __name__ == "__main__":
+    # execute only if run as a script
+    main()
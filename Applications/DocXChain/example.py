@@ -10,13 +10,14 @@ import datetime
 import time
 import pytz
 import json
-import fitz
 
-from modules.file_loading import load_document, load_whole_pdf_shin
+from modules.file_loading import load_document, enable_page_cache, DocumentSource
 from modules.formula_recognition import FormulaRecognition
+from modules.output_formatting import JsonStreamWriter
 from pipelines.general_text_reading import GeneralTextReading
 from pipelines.table_parsing import TableParsing
 from pipelines.document_structurization import DocumentStructurization
+from pipelines.whole_pdf_conversion import WholePDFConversion
 from pipelines.pdf2html import Document2Html
 from utilities.visualization import *
 
@@ -163,7 +164,7 @@ def document_structurization_example(image):
 
     return final_result, output_image
 
-def whole_pdf_conversion_example(image_list):
+def whole_pdf_conversion_example(pdf_path, output_path):
 
     # configure
     configs = dict()
@@ -191,29 +192,33 @@ def whole_pdf_conversion_example(image_list):
     formula_recognition_configs['tokenizer_json'] = '/home/LaTeX-OCR_tokenizer.json'
     configs['formula_recognition_configs'] = formula_recognition_configs
 
-    # initialize
-    document_structurizer = DocumentStructurization(configs)
+    configs['queue_size'] = 2  # maximal number of pages buffered between two successive stages (rasterization, layout analysis, formula recognition)
+    configs['resolution'] = 150  # resolution (DPI) for rendering PDF pages
 
-    # run
-    final_result = []
-    page_index = 0
-    for image in image_list:
-        result = document_structurizer(image)
-
-        page_info = {'page': page_index, 'information': result}
-        final_result.append(page_info)
-
-        page_index = page_index + 1
+    # initialize
+    pdf_converter = WholePDFConversion(configs)
+
+    # run (pages are rendered, analyzed and dumped one by one, so memory usage does not grow with the page count)
+    page_count = 0
+    if output_path.lower().endswith('.json'):
+        with JsonStreamWriter(output_path) as json_writer:
+            for page_info in pdf_converter(pdf_path):
+                json_writer.write(page_info)
+                page_count = page_count + 1
+    else:
+        for page_info in pdf_converter(pdf_path):
+            print (page_info)
+            page_count = page_count + 1
 
     if True:
-        print (final_result)
+        print ('Number of converted pages: ', page_count)
 
     # release
-    document_structurizer.release()
+    pdf_converter.release()
 
-    return final_result
+    return
 
-def pdf2html(image_list, pdf_path):
+def pdf2html(pdf_path):
 
     # configure
     configs = dict()
@@ -252,16 +257,16 @@ def pdf2html(image_list, pdf_path):
     document_structurizer = Document2Html(configs)
 
 
-    # run
+    # run (the PDF file is opened once; pages are rendered lazily, at the input resolution of the layout analysis model)
     final_result = []
     page_index = 0
-    # args.document_path
-    pdf = fitz.open(pdf_path)
-    for page_num, image in enumerate(image_list):
-        page = pdf.load_page(page_num)
-        html_output, output = document_structurizer(image, page)
-        print(html_output)
-        break
+    with DocumentSource(pdf_path) as source:
+        for page_num in range(len(source)):
+            page = source.page(page_num)
+            image = source.image(page_num, page)
+            html_output, output = document_structurizer(image, page)
+            print(html_output)
+            break
     output_image = document_structurization_visualization(output, image)
     # release
     document_structurizer.release()
@@ -280,8 +285,14 @@ def main():
     parser.add_argument("task", choices = ['general_text_reading', 'table_parsing', 'formula_recognition', 'document_structurization', 'whole_pdf_conversion', 'pdf2html'], help = "specify the task to be performed", type = str)
     parser.add_argument("document_path", help = "specify the path of the document (supported formats: JPG, PNG, and PDF) to be processed", type = str)
     parser.add_argument("output_path", help = "specify the path of the image with visulization or the json file for storage", type = str)
+    parser.add_argument("--page_cache_dir", help = "specify a directory for caching rendered PDF pages across runs (disabled by default)", type = str, default = None)
+    parser.add_argument("--page_cache_size", help = "specify the maximal size (in GB) of the page cache", type = float, default = 8)
     args = parser.parse_args()
 
+    # enable the page cache, so that re-running on the same documents skips rasterization
+    if args.page_cache_dir is not None:
+        enable_page_cache(args.page_cache_dir, int(args.page_cache_size * 1024 ** 3))
+
     # start
     tz = pytz.timezone('Asia/Shanghai')
     now = datetime.datetime.now(tz)
@@ -290,34 +301,36 @@ def main():
 
     # load document
     image = None
-    image_list = None
     if args.task == 'whole_pdf_conversion':
         name = args.document_path.lower()
         if name.endswith('.pdf'):
-            image_list = load_document(args.document_path, whole_flag = True)
+            # pages are loaded lazily and the results are dumped incrementally by the conversion pipeline itself
+            whole_pdf_conversion_example(args.document_path, args.output_path)
         else:
             print ('For the whole PDF conversion task, only PDF files are supported!')
     elif args.task == 'pdf2html':
-        image_list = load_whole_pdf_shin(args.document_path)
+        if not args.document_path.lower().endswith('.pdf'):
+            print ('For the PDF to HTML conversion task, only PDF files are supported!')
     else:
         image = load_document(args.document_path)
     
     # process
     final_result = None
     output_image = None
-    if image is not None or image_list is not None:
+    if args.task == 'whole_pdf_conversion':
+        pass  # already processed and dumped
+    elif args.task == 'pdf2html':
+        if args.document_path.lower().endswith('.pdf'):
+            final_result, output_image = pdf2html(args.document_path)  # pages are loaded lazily by the pipeline itself
+    elif image is not None:
         if args.task == 'general_text_reading':
             final_result, output_image = general_text_reading_example(image)
         elif args.task == 'table_parsing':
             final_result, output_image = table_parsing_example(image)
         elif args.task == 'formula_recognition':
             final_result = formula_recognition_example(image)
-        elif args.task == 'document_structurization':
+        else:  # args.task == 'document_structurization'
             final_result, output_image = document_structurization_example(image)
-        elif args.task == 'pdf2html':
-            final_result, output_image = pdf2html(image_list, args.document_path)
-        else:  # args.task == 'whole_pdf_conversion'
-            final_result = whole_pdf_conversion_example(image_list)
     else:
         print ("Failed to load the document file!")
 
@@ -5,9 +5,167 @@ import sys
 import numpy as np
 import cv2
 
-import pdfplumber
 import fitz
 
+from modules.page_cache import PageCache
+
+# persistent cache of rendered pages, shared by all the loaders (disabled by default, see enable_page_cache)
+page_cache = None
+
+def enable_page_cache(cache_dir, max_bytes = 8 * 1024 ** 3):
+    """
+    Description:
+      make all the PDF loaders below store rendered pages in (and load them from) an on-disk cache, so that re-running on the same documents skips rasterization
+
+    Parameters:
+      cache_dir: directory of the cache
+      max_bytes: maximal total size of the cached pages (default: 8 GB)
+    """
+
+    global page_cache
+    page_cache = PageCache(cache_dir, max_bytes) if cache_dir else None
+
+    return page_cache
+
+class DocumentSource(object):
+    """
+    Description:
+      class definition of DocumentSource:
+      (1) single entry point for reading PDF files (PyMuPDF backend): the file is opened once, page objects and page images are handed out lazily
+      (2) pixmaps are converted to BGR images straight from their sample buffer, without intermediate PIL images or byte copies
+      (3) the resolution is either fixed (DPI) or chosen per page such that the longer side of the image equals the input size of the layout analysis model, hence no more pixels are rendered than the detector consumes
+      (4) rendered pages are stored in and loaded from the page cache, if enabled (see enable_page_cache); fully cached documents are never opened
+
+    Caution:
+      text detection and recognition need higher resolutions than layout analysis, so the pipelines relying on OCR keep a fixed resolution (150 DPI by default)
+    """
+
+    def __init__(self, pdf_path, resolution = None, target_size = 768):
+        """
+        Description:
+          initialize the class instance
+
+        Parameters:
+          pdf_path: path to the PDF file
+          resolution: image resolution in DPI (None: chosen per page from target_size)
+          target_size: length of the longer side of the page images when resolution is None (default: 768, the input resolution of the layout analysis model)
+        """
+
+        self.pdf_path = pdf_path
+        self.resolution = resolution
+        self.target_size = target_size
+        self.document = None
+        self.document_key = None
+        self.page_count = None
+
+        # the page count is cached along with the pages, otherwise open the file right away
+        if page_cache is not None:
+            self.document_key = page_cache.document_key(pdf_path)
+            self.page_count = page_cache.page_count(self.document_key)
+        if self.page_count is None:
+            self._open()
+
+    def __len__(self):
+        return self.page_count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def page(self, page_index):
+        """
+        Description:
+          return the fitz.Page object of the specified page
+        """
+
+        return self._open().load_page(page_index)
+
+    def page_resolution(self, page_index, page = None):
+        """
+        Description:
+          return the resolution (DPI) at which the specified page is rendered
+        """
+
+        if self.resolution is not None:
+            return self.resolution
+
+        if page is None:
+            page = self.page(page_index)
+        rect = page.rect  # in points (1/72 inch), rotation taken into account
+
+        return 72.0 * self.target_size / max(rect.width, rect.height)
+
+    def image(self, page_index, page = None):
+        """
+        Description:
+          return the image of the specified page
+
+        Parameters:
+          page_index: index of the page
+          page: the fitz.Page object of the page, if already loaded
+
+        Return:
+          image: OpenCV image (BGR format)
+        """
+
+        # pages rendered for a target size are keyed by that size, so that cache hits do not need the page geometry
+        cache_resolution = self.resolution if self.resolution is not None else 'fit%d' % self.target_size
+        if page_cache is not None:
+            image = page_cache.get(self.document_key, 'pymupdf', cache_resolution, page_index)
+            if image is not None:
+                return image
+
+        if page is None:
+            page = self.page(page_index)
+        zoom = self.page_resolution(page_index, page) / 72.0  # 72 DPI is the default
+        pix = page.get_pixmap(matrix = fitz.Matrix(zoom, zoom), alpha = False)  # no transparency
+        image = pixmap_to_bgr(pix)
+
+        if page_cache is not None:
+            page_cache.put(self.document_key, 'pymupdf', cache_resolution, page_index, image)
+
+        return image
+
+    def close(self):
+        """
+        Description:
+          close the PDF file
+        """
+
+        if self.document is not None:
+            self.document.close()
+            self.document = None
+
+        return
+
+    def _open(self):
+        if self.document is None:
+            self.document = fitz.open(self.pdf_path)
+            self.page_count = len(self.document)
+            if page_cache is not None:
+                page_cache.set_page_count(self.document_key, self.page_count)
+
+        return self.document
+
+def pixmap_to_bgr(pix):
+    """
+    Description:
+      convert a fitz.Pixmap to an OpenCV image (BGR format), reading the sample buffer in place (a single copy is made, by the color conversion)
+    """
+
+    samples = pix.samples_mv if hasattr(pix, 'samples_mv') else pix.samples  # samples_mv: memoryview, without copy (PyMuPDF >= 1.18.17)
+    image = np.frombuffer(samples, dtype = np.uint8).reshape(pix.height, pix.stride)[:, :pix.width * pix.n].reshape(pix.height, pix.width, pix.n)
+    if pix.n == 4:  # RGBA -> BGR
+        image = cv2.cvtColor(image, cv2.COLOR_RGBA2BGR)
+    elif pix.n == 3:  # RGB -> BGR
+        image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+    else:  # GRAY -> BGR
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+
+    return image
+
 def load_image(image_path):
 
     # initialization
@@ -25,19 +183,15 @@ def load_pdf(pdf_path, page_index = 0):
     # initialization
     image = None
 
-    # read PDF file
+    # read PDF file (the page count is cached along with the pages, hence the PDF file is not opened at all on cache hits)
     name = pdf_path.lower()
     if name.endswith('.pdf'):
-        with pdfplumber.open(pdf_path) as pdf:
-            page_count = len(pdf.pages)
+        with DocumentSource(pdf_path, resolution = 150) as source:  # convert the page to image at 150 DPI by default (20230815)
+            page_count = len(source)
             if page_index >= page_count - 1:
                 page_index = page_count - 1
 
-            page = pdf.pages[page_index]  # select the specified page (the first page will be chosen, by default)
-            page_image = page.to_image(resolution=150) # convert the page to image by default (20230815)
-            image = cv2.cvtColor(np.array(page_image.original), cv2.COLOR_RGB2BGR)
-
-            pdf.close()
+            image = source.image(page_index)  # select the specified page (the first page will be chosen, by default)
 
     return image
 
@@ -47,20 +201,30 @@ def load_whole_pdf(pdf_path):
     image_list = []
 
     # read PDF file (load all pages in the PDF file)
-    name = pdf_path.lower()
-    if name.endswith('.pdf'):
-        with pdfplumber.open(pdf_path) as pdf:
-            page_count = len(pdf.pages)
-            for page_index in range(page_count):  # traverse all pages
-                page = pdf.pages[page_index]  # select the current page
-                page_image = page.to_image(resolution=150) # convert the page to image by default (20230815)
-                image = cv2.cvtColor(np.array(page_image.original), cv2.COLOR_RGB2BGR)
+    for image in iterate_whole_pdf(pdf_path):
+        image_list.append(image)
 
-                image_list.append(image)
+    return image_list
 
-            pdf.close()
+def iterate_whole_pdf(pdf_path, resolution = 150):
+    """
+    Description:
+      render the pages of a PDF file one by one (lazily), so that only the current page is held in memory
 
-    return image_list
+    Parameters:
+      pdf_path: path to the PDF file
+      resolution: image resolution (default: 150 DPI, the same as load_pdf and load_whole_pdf; None: chosen per page for the layout analysis model, see DocumentSource)
+
+    Return:
+      a generator of OpenCV images (BGR format), one per page
+    """
+
+    # read PDF file (traverse all pages in the PDF file)
+    name = pdf_path.lower()
+    if name.endswith('.pdf'):
+        with DocumentSource(pdf_path, resolution = resolution) as source:
+            for page_index in range(len(source)):  # traverse all pages
+                yield source.image(page_index)
 
 def load_document(document_path, whole_flag = False):
 
@@ -81,42 +245,21 @@ def load_document(document_path, whole_flag = False):
 
 def load_whole_pdf_shin(pdf_path, resolution=72):
     """
-    Convert all pages of a PDF to images and return both image list and page list.
+    Convert all pages of a PDF to images.
 
     Parameters:
       pdf_path: path to the PDF file
-      resolution: image resolution (default: 150 DPI)
+      resolution: image resolution (default: 72 DPI, i.e., image coordinates equal PDF coordinates)
 
     Return:
       image_list: list of OpenCV images of the PDF pages
-      page_list: list of fitz.Page objects (for further processing if needed)
     """
-    
+
     # initialization
     image_list = []
 
-    # read PDF file
-    name = pdf_path.lower()
-    if name.endswith('.pdf'):
-        pdf_document = fitz.open(pdf_path)
-        page_count = len(pdf_document)
-
-        for page_index in range(page_count):  # traverse all pages
-            page = pdf_document.load_page(page_index)  # load the current page
-
-            # Render page to an image (Pixmap object)
-            zoom = resolution / 72  # adjust the resolution (72 DPI is the default)
-            mat = fitz.Matrix(zoom, zoom)  # create transformation matrix for zooming
-            pix = page.get_pixmap(matrix=mat, alpha=False)  # convert to image, no transparency
-            
-            # Convert Pixmap to a format suitable for OpenCV (BGR format)
-            image = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
-            if pix.n == 4:  # RGBA -> BGR
-                image = cv2.cvtColor(image, cv2.COLOR_RGBA2BGR)
-            elif pix.n == 3:  # RGB -> BGR
-                image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
-
-            image_list.append(image)  # add the image to the list
-
-        pdf_document.close()
-    return image_list
\ No newline at end of file
+    # read PDF file (load all pages in the PDF file; see DocumentSource for accessing the fitz.Page objects as well)
+    for image in iterate_whole_pdf(pdf_path, resolution):
+        image_list.append(image)
+
+    return image_list
@@ -33,6 +33,9 @@ class LayoutAnalysis(object):
                 'model_file': configs['model_path'],
                 'debug': 0, # 1: save vis results, 0: don't save
             }
+            for key in ['gpus', 'num_threads', 'num_interop_threads', 'backend', 'onnx_path']:  # optional: '-1' for CPU inference, CPU thread counts, and the onnxruntime backend
+                if key in configs:
+                    params[key] = configs[key]
 
             # load map information
             map_info = json.load(open(BASE_DIR + '/../../../DocumentUnderstanding/DocXLayout/map_info.json'))
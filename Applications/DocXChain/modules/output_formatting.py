@@ -3,5 +3,72 @@
 
 import sys
 import numpy as np
+import json
 
-# leave for future work (20230914)
\ No newline at end of file
+class JsonStreamWriter(object):
+    """
+    Description:
+      class definition of JsonStreamWriter:
+      (1) write the items of a JSON list to a file incrementally, one item at a time
+      (2) the resulting file is identical to that produced by json.dump(item_list, json_file, indent = 4)
+
+    Caution:
+      the writer must be closed (or used as a context manager) to terminate the list properly
+    """
+
+    def __init__(self, json_path, indent = 4):
+        """
+        Description:
+          initialize the class instance
+        """
+
+        self.json_file = open(json_path, 'w')
+        self.indent = indent
+        self.item_count = 0
+
+    def write(self, item):
+        """
+        Description:
+          append one item to the list and flush it to the disk
+
+        Parameters:
+          item: a JSON-serializable object
+        """
+
+        prefix = ' ' * self.indent
+        text = json.dumps(item, indent = self.indent)
+        text = '\n'.join([prefix + line for line in text.split('\n')])
+
+        if self.item_count == 0:
+            self.json_file.write('[\n' + text)
+        else:
+            self.json_file.write(',\n' + text)
+        self.json_file.flush()
+
+        self.item_count = self.item_count + 1
+
+        return
+
+    def close(self):
+        """
+        Description:
+          terminate the list and close the file
+        """
+
+        if self.json_file is not None:
+            if self.item_count == 0:
+                self.json_file.write('[]')
+            else:
+                self.json_file.write('\n]')
+            self.json_file.close()
+            self.json_file = None
+
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+        return False
@@ -0,0 +1,167 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+import os
+import sys
+import hashlib
+import threading
+import numpy as np
+
+class PageCache(object):
+    """
+    Description:
+      class definition of PageCache:
+      (1) on-disk, content-addressed cache of rendered PDF pages, keyed by (hash of the PDF file, renderer, resolution, page index)
+      (2) each page is stored as a raw uint8 .npy file and loaded back via np.memmap (copy-on-write), hence without decoding or copying
+      (3) the total size of the cache is bounded, the least recently used pages are evicted first (down to a low-water mark, so that the cache directory is not scanned on every put)
+
+    Caution:
+      several processes may share the same cache directory; eviction is best-effort in that case
+    """
+
+    def __init__(self, cache_dir, max_bytes = 8 * 1024 ** 3, low_water_mark = 0.9):
+        """
+        Description:
+          initialize the class instance
+
+        Parameters:
+          cache_dir: directory of the cache (created if it does not exist)
+          max_bytes: maximal total size of the cached pages (default: 8 GB)
+          low_water_mark: once max_bytes is exceeded, pages are evicted until the cache fits in low_water_mark * max_bytes (default: 0.9)
+        """
+
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.low_water_bytes = int(low_water_mark * max_bytes)
+        self.lock = threading.Lock()
+        self.document_keys = {}  # (path, size, mtime) -> content hash, to hash each file only once
+
+        os.makedirs(self.cache_dir, exist_ok = True)
+        self.total_bytes = sum([os.path.getsize(path) for path, _ in self._list_pages()])
+
+    def document_key(self, pdf_path):
+        """
+        Description:
+          return the content hash (SHA-1) of the given PDF file
+        """
+
+        stat = os.stat(pdf_path)
+        file_id = (os.path.abspath(pdf_path), stat.st_size, stat.st_mtime_ns)
+        if file_id not in self.document_keys:
+            sha1 = hashlib.sha1()
+            with open(pdf_path, 'rb') as pdf_file:
+                for chunk in iter(lambda: pdf_file.read(1 << 20), b''):
+                    sha1.update(chunk)
+            self.document_keys[file_id] = sha1.hexdigest()
+
+        return self.document_keys[file_id]
+
+    def page_count(self, document_key):
+        """
+        Description:
+          return the number of pages of the document (None if unknown)
+        """
+
+        try:
+            with open(os.path.join(self._document_dir(document_key), 'page_count'), 'r') as count_file:
+                return int(count_file.read())
+        except (IOError, ValueError):
+            return None
+
+    def set_page_count(self, document_key, page_count):
+        """
+        Description:
+          record the number of pages of the document
+        """
+
+        os.makedirs(self._document_dir(document_key), exist_ok = True)
+        self._atomic_write(os.path.join(self._document_dir(document_key), 'page_count'), lambda f: f.write(str(page_count).encode()))
+
+        return
+
+    def get(self, document_key, renderer, resolution, page_index):
+        """
+        Description:
+          fetch a rendered page from the cache
+
+        Return:
+          image: memory-mapped image (copy-on-write), or None if the page is not cached
+        """
+
+        path = self._page_path(document_key, renderer, resolution, page_index)
+        try:
+            image = np.load(path, mmap_mode = 'c')
+            os.utime(path)  # mark as recently used
+        except (IOError, ValueError):
+            return None
+
+        return image
+
+    def put(self, document_key, renderer, resolution, page_index, image):
+        """
+        Description:
+          store a rendered page in the cache, evicting the least recently used pages if needed
+        """
+
+        path = self._page_path(document_key, renderer, resolution, page_index)
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        try:
+            old_size = os.path.getsize(path)  # the page may be on disk already (e.g., another worker missed it too), it is replaced, not added
+        except OSError:
+            old_size = 0
+        self._atomic_write(path, lambda f: np.save(f, np.ascontiguousarray(image, dtype = np.uint8)))
+
+        with self.lock:
+            self.total_bytes = self.total_bytes + os.path.getsize(path) - old_size
+            if self.total_bytes > self.max_bytes:
+                self._evict(keep = path)
+
+        return
+
+    def _evict(self, keep = None):
+        # remove the least recently used pages until the cache fits in low_water_bytes, which leaves room for the following pages
+        pages = []
+        for path, stat in self._list_pages():
+            pages.append((stat.st_mtime, stat.st_size, path))
+        pages.sort()
+
+        self.total_bytes = sum([size for _, size, _ in pages])
+        for _, size, path in pages:
+            if self.total_bytes <= self.low_water_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:  # already removed by another process
+                pass
+            self.total_bytes = self.total_bytes - size
+
+        return
+
+    def _list_pages(self):
+        for root, _, file_names in os.walk(self.cache_dir):
+            for file_name in file_names:
+                if file_name.endswith('.npy'):
+                    path = os.path.join(root, file_name)
+                    try:
+                        yield path, os.stat(path)
+                    except OSError:
+                        pass
+
+    def _document_dir(self, document_key):
+        return os.path.join(self.cache_dir, document_key[:2], document_key)
+
+    def _page_path(self, document_key, renderer, resolution, page_index):
+        # resolution: DPI, or a tag for pages rendered at a page-dependent resolution (e.g., 'fit768')
+        resolution_tag = '%gdpi' % resolution if isinstance(resolution, (int, float)) else str(resolution)
+        return os.path.join(self._document_dir(document_key), '%s_%s_%05d.npy' % (renderer, resolution_tag, page_index))
+
+    def _atomic_write(self, path, write):
+        # write to a temporary file first, so that readers never see partially written files
+        tmp_path = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+        with open(tmp_path, 'wb') as tmp_file:
+            write(tmp_file)
+        os.replace(tmp_path, path)
+
+        return
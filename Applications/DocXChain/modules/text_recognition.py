@@ -7,6 +7,8 @@ import sys
 import numpy as np
 import math
 import cv2
+import torch
+from concurrent.futures import ThreadPoolExecutor
 
 from modelscope.pipelines import pipeline
 from modelscope.utils.constant import Tasks
@@ -32,6 +34,11 @@ class TextRecognition(object):
         else:
             self.text_recognizer = None  # (20230811) currently we only support models from modelscope
 
+        # batched recognition: number of text instances per forward pass (1: recognize them one by one) and number of threads for cropping
+        # (one by one by default, since the batched path drives the internals of the modelscope pipeline; check it with benchmark_text_recognition.py before enabling it)
+        self.batch_size = configs.get('batch_size', 1)
+        self.num_workers = configs.get('num_workers', 4)
+
     def __call__(self, image, detections):
         """
         Description:
@@ -49,13 +56,28 @@ class TextRecognition(object):
         
         # perform text recognition
         if self.text_recognizer is not None:
-            # recognize the text instances one by one
-            result = []
-            for i in range(detections.shape[0]):  # this part can be largely accelerated via parallelization (leave for future work)
-                pts = self.order_point(detections[i])
-                image_crop = self.crop_image(image, pts)
-                rec = self.text_recognizer(image_crop)
-                result.append(rec)
+            if self.batch_size > 1:
+                # recognize the text instances in batches (results are in the same order as the detections)
+                result = self._recognize_in_batches(image, detections)
+            else:
+                # recognize the text instances one by one
+                result = []
+                for i in range(detections.shape[0]):
+                    pts = self.order_point(detections[i])
+                    image_crop = self.crop_image(image, pts)
+                    rec = self.text_recognizer(image_crop)
+                    result.append(rec)
+
+        return result
+
+    def _recognize_in_batches(self, image, detections):
+        # crop the text instances batch by batch in a thread pool (OpenCV releases the GIL while warping), in the background of the recognition of previous batches
+        quads = order_quads(detections)
+        result = []
+        with ThreadPoolExecutor(max_workers = self.num_workers) as executor:
+            batches = executor.map(lambda start: crop_quads(image, quads[start:start + self.batch_size], ordered = True), range(0, quads.shape[0], self.batch_size))
+            for batch in batches:  # batches are yielded in detection order
+                result.extend(self.recognize_cropped_images(batch))
 
         return result
 
@@ -81,6 +103,31 @@ class TextRecognition(object):
 
         return result
 
+    def recognize_cropped_images(self, cropped_images):
+        """
+        Description:
+          recognize the text instances within a batch of cropped images in a single forward pass
+
+        Parameters:
+          cropped_images: list of *cropped* images
+
+        Return:
+          result: list of recognition results (the same as those of recognize_cropped_image), in the same order as the cropped images
+        """
+
+        # initialize
+        result = None
+
+        # perform text recognition
+        if self.text_recognizer is not None:
+            # the preprocessor resizes (keeping the aspect ratio) and pads every image to the same fixed size, hence the images can be stacked directly
+            inputs = self.text_recognizer.preprocess(cropped_images)
+            with torch.no_grad():
+                outputs = self.text_recognizer.forward({'image': inputs['image'].to(self.text_recognizer.device)})
+            result = [self.text_recognizer.postprocess({'preds': [pred]}) for pred in outputs['preds']]
+
+        return result
+
     def order_point(self, coor):
 
         arr = np.array(coor).reshape([4, 2])
@@ -153,4 +200,103 @@ class TextRecognition(object):
         if self.text_recognizer is not None:
             del self.text_recognizer
 
-        return 
\ No newline at end of file
+        return 
+
+def order_quads(quads):
+    """
+    Description:
+      vectorized version of TextRecognition.order_point, for many quadrangles at once
+
+    Parameters:
+      quads: quadrangles, N x 8 or N x 4 x 2
+
+    Return:
+      ordered: quadrangles with ordered corners, N x 4 x 2 (float32)
+    """
+
+    arr = np.asarray(quads).reshape([-1, 4, 2])
+    centroid = np.sum(arr, 1) / 4
+    theta = np.arctan2(arr[:, :, 1] - centroid[:, 1:2], arr[:, :, 0] - centroid[:, 0:1])
+    sort_points = np.take_along_axis(arr, np.argsort(theta, axis = 1)[:, :, None], axis = 1)
+
+    # start from the corner on the left of the centroid
+    shift = sort_points[:, 0, 0] > centroid[:, 0]
+    sort_points[shift] = np.roll(sort_points[shift], 1, axis = 1)
+
+    return sort_points.astype('float32')
+
+def crop_quads(image, quads, ordered = False, tolerance = 1.0):
+    """
+    Description:
+      crop many quadrangles from the image at once (bulk version of TextRecognition.crop_image):
+      (1) the corners of all quadrangles are ordered and the output sizes and perspective transforms are computed in NumPy, for the whole batch
+      (2) quadrangles that are axis-aligned up to the tolerance (the common case for document text) are returned as slicing views of the image, without any warping
+
+    Parameters:
+      image: the *full* image
+      quads: quadrangles, N x 8 or N x 4 x 2
+      ordered: whether the corners are already ordered by order_point / order_quads
+      tolerance: maximal deviation (in pixels) of the corners from an axis-aligned rectangle for slicing instead of warping
+
+    Return:
+      crops: list of N cropped images (views of the image for axis-aligned quadrangles, do not modify them in place)
+    """
+
+    p = np.asarray(quads, dtype = np.float32).reshape([-1, 4, 2]) if ordered else order_quads(quads)
+    p = p.astype(np.float64)
+    if p.shape[0] == 0:
+        return []
+
+    # sort the corners by x, then the left and the right pairs by y (same procedure as in crop_image)
+    def swap(mask, i, j):
+        tmp = p[mask, i].copy()
+        p[mask, i] = p[mask, j]
+        p[mask, j] = tmp
+
+    for i in range(4):
+        for j in range(i + 1, 4):
+            swap(p[:, i, 0] > p[:, j, 0], i, j)
+    swap(p[:, 0, 1] > p[:, 1, 1], 0, 1)
+    swap(p[:, 2, 1] > p[:, 3, 1], 2, 3)
+
+    top_left, bottom_left, top_right, bottom_right = p[:, 0], p[:, 1], p[:, 2], p[:, 3]
+    widths = np.sqrt(np.sum(((top_left + bottom_left) / 2 - (top_right + bottom_right) / 2) ** 2, axis = 1))
+    heights = np.sqrt(np.sum(((top_left + top_right) / 2 - (bottom_left + bottom_right) / 2) ** 2, axis = 1))
+
+    # axis-aligned quadrangles that lie within the image: slicing
+    x0 = np.round(top_left[:, 0]).astype(np.int64)
+    y0 = np.round(top_left[:, 1]).astype(np.int64)
+    sizes = np.stack([widths.astype(np.int64), heights.astype(np.int64)], axis = 1)
+    axis_aligned = (np.abs(top_left[:, 0] - bottom_left[:, 0]) <= tolerance) & (np.abs(top_right[:, 0] - bottom_right[:, 0]) <= tolerance) & \
+                   (np.abs(top_left[:, 1] - top_right[:, 1]) <= tolerance) & (np.abs(bottom_left[:, 1] - bottom_right[:, 1]) <= tolerance) & \
+                   (sizes > 0).all(axis = 1) & \
+                   (x0 >= 0) & (y0 >= 0) & (x0 + sizes[:, 0] <= image.shape[1]) & (y0 + sizes[:, 1] <= image.shape[0])
+
+    # the others: perspective transforms of the whole batch, from the corners to the target rectangles (8 x 8 linear systems, as in cv2.getPerspectiveTransform)
+    warped = np.nonzero(~axis_aligned)[0]
+    transforms = None
+    if warped.shape[0] > 0:
+        src = np.stack([top_left, top_right, bottom_left, bottom_right], axis = 1)[warped].astype(np.float32).astype(np.float64)
+        dst = np.zeros_like(src)
+        dst[:, [1, 3], 0] = (widths[warped] - 1).astype(np.float32)[:, None]
+        dst[:, [2, 3], 1] = (heights[warped] - 1).astype(np.float32)[:, None]
+        A = np.zeros([warped.shape[0], 8, 8])
+        A[:, 0:4, 0:2] = src
+        A[:, 0:4, 2] = 1
+        A[:, 0:4, 6:8] = -src * dst[:, :, 0:1]
+        A[:, 4:8, 3:5] = src
+        A[:, 4:8, 5] = 1
+        A[:, 4:8, 6:8] = -src * dst[:, :, 1:2]
+        b = np.concatenate([dst[:, :, 0], dst[:, :, 1]], axis = 1)
+        try:
+            transforms = np.concatenate([np.linalg.solve(A, b[:, :, None])[:, :, 0], np.ones([warped.shape[0], 1])], axis = 1).reshape([-1, 3, 3])
+        except np.linalg.LinAlgError:  # degenerate quadrangles, let OpenCV handle them one by one
+            transforms = np.stack([cv2.getPerspectiveTransform(src[k].astype(np.float32), dst[k].astype(np.float32)) for k in range(warped.shape[0])])
+
+    crops = [None] * p.shape[0]
+    for i in np.nonzero(axis_aligned)[0]:
+        crops[i] = image[y0[i]:y0[i] + sizes[i, 1], x0[i]:x0[i] + sizes[i, 0]]
+    for k, i in enumerate(warped):
+        crops[i] = cv2.warpPerspective(image, transforms[k], (int(sizes[i, 0]), int(sizes[i, 1])))
+
+    return crops
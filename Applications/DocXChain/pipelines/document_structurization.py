@@ -8,7 +8,7 @@ import numpy as np
 
 from modules.layout_analysis import LayoutAnalysis
 from modules.text_detection import TextDetection
-from modules.text_recognition import TextRecognition
+from modules.text_recognition import TextRecognition, order_quads, crop_quads
 from modules.table_structure_recognition import TableStructureRecognition
 from modules.formula_recognition import FormulaRecognition
 
@@ -83,6 +83,13 @@ class DocumentStructurization(object):
 
         # assemble all the intermediate results to make the final output
         layout_dets = la_result['layout_dets']
+
+        # crop all equation regions at once, and order the corners of all text instances at once
+        equation_indices = [i for i in range(0, len(layout_dets)) if self.layout_analysis_module.mapping(layout_dets[i]['category_id']) == 'equation']
+        equation_crops = crop_quads(image, np.round([layout_dets[i]['poly'][:8] for i in equation_indices]).reshape([-1, 8]))
+        equation_crops = dict(zip(equation_indices, equation_crops))
+        det_pts = order_quads(det_result)
+
         for i in range(0, len(layout_dets)):
             # fetch each layout region
             category_index = layout_dets[i]['category_id']
@@ -104,9 +111,8 @@ class DocumentStructurization(object):
             layout_region['text_list'] = []  # one region may contain multiple text instances
 
             if layout_region['category_name'] == 'equation':  # special is treatment needed for equations/formulas
-                # crop sub image and perform formula recognition
-                pts = self.text_recognition_module.order_point(region_poly)
-                image_crop = self.text_recognition_module.crop_image(image, pts)
+                # perform formula recognition on the cropped sub image
+                image_crop = equation_crops[i]
                 fr_result = self.formula_recognition_module(image_crop)
 
                 #print ('formua recognition: ', fr_result)
@@ -121,7 +127,7 @@ class DocumentStructurization(object):
                 # match and assign
                 for j in range(det_result.shape[0]):
                     # fetch each text instance
-                    pts = self.text_recognition_module.order_point(det_result[j])
+                    pts = det_pts[j]
                     rec = rec_result[j]
 
                     # check
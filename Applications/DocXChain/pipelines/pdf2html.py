@@ -5,6 +5,7 @@ from modules.layout_analysis import LayoutAnalysis
 from modules.table_structure_recognition import TableStructureRecognition
 from modules.formula_recognition import FormulaRecognition
 from utilities.visualization import *
+from utilities.spatial_index import GridIndex
 class Document2Html(object):
     def __init__(self, configs):
         """
@@ -28,13 +29,16 @@ class Document2Html(object):
         """
         final_result = []
 
+        # The page may be rendered at any resolution: text boxes (in PDF points) are mapped to image coordinates
+        zoom = image.shape[1] / page.rect.width
+
         # Perform layout analysis
         la_result = self.layout_analysis_module(image)
         # Perform text detection and recognition on the page
-        det_result, rec_result = self.text_detection_module(page)
+        det_result, rec_result = self.text_detection_module(page, zoom)
         tsr_result = self.table_structure_recognition_module(image)
         # table_output = self._table_recognize(tsr_result, det_result, rec_result)
-        final_result = self._assemble(page, la_result, det_result, rec_result, tsr_result)
+        final_result = self._assemble(page, la_result, det_result, rec_result, tsr_result, zoom)
 
         return final_result
     
@@ -53,21 +57,43 @@ class Document2Html(object):
         else :
             return False
 
-    def _table_recognize(self, layout_box, tsr_result, det_result, rec_result):
+    def _points_in_box(self, box, points):
+        # vectorized version of _point_in_box (same arithmetic), points: N x 2 array
+        x1,y1 = box[0][0],box[0][1]
+        x2,y2 = box[1][0],box[1][1]
+        x3,y3 = box[2][0],box[2][1]
+        x4,y4 = box[3][0],box[3][1]
+        ctx,cty = points[:, 0],points[:, 1]
+        a = (x2 - x1)*(cty - y1) - (y2 - y1)*(ctx - x1) 
+        b = (x3 - x2)*(cty - y2) - (y3 - y2)*(ctx - x2) 
+        c = (x4 - x3)*(cty - y3) - (y4 - y3)*(ctx - x3) 
+        d = (x1 - x4)*(cty - y4) - (y1 - y4)*(ctx - x4) 
+        return ((a > 0) & (b > 0) & (c > 0) & (d > 0)) | ((a < 0) & (b < 0) & (c < 0) & (d < 0))
+
+    def _points_in_box_indexed(self, box, points, point_index):
+        # indices (ascending) of the points strictly inside the quadrangle box;
+        # such points always lie within the bounding rectangle of the box, so only the candidates from the index are tested
+        box = np.asarray(box)
+        candidates = point_index.query(box[:, 0].min(), box[:, 1].min(), box[:, 0].max(), box[:, 1].max())
+        return candidates[self._points_in_box(box, points[candidates])]
+
+    def _table_recognize(self, layout_box, tsr_result, det_result, rec_result, span_center_index=None):
         # initialize
         output = []
         tsr_result = np.array(tsr_result).reshape([len(tsr_result), 4, 2])
         
         # First, find tsr_result (table regions) that are inside the layout_box
-        filtered_tsr_result = []
-        for j in range(len(tsr_result)):
-            # Check if the entire tsr_result (table cell) is inside the layout_box
-            cell_center_x = (tsr_result[j][0][0] + tsr_result[j][2][0]) / 2
-            cell_center_y = (tsr_result[j][0][1] + tsr_result[j][2][1]) / 2
-            if self._point_in_box(layout_box, [cell_center_x, cell_center_y]):
-                filtered_tsr_result.append(tsr_result[j])
+        # (the center of each table cell is tested against the layout_box, for all cells at once)
+        cell_centers = np.stack([(tsr_result[:, 0, 0] + tsr_result[:, 2, 0]) / 2,
+                                 (tsr_result[:, 0, 1] + tsr_result[:, 2, 1]) / 2], axis=1)
+        filtered_tsr_result = tsr_result[self._points_in_box(layout_box, cell_centers)]
 
         # Next, match det_result (detection results) with filtered tsr_result
+        det_result = np.asarray(det_result, dtype=np.float64).reshape(-1, 4)
+        span_centers = np.stack([(det_result[:, 0] + det_result[:, 2]) / 2.0,
+                                 (det_result[:, 1] + det_result[:, 3]) / 2.0], axis=1)
+        if span_center_index is None:
+            span_center_index = GridIndex(span_centers)
         for tsr in filtered_tsr_result:
             combined_text = ""  # Initialize combined text for this table cell
             cell_poly = np.array([round(tsr[0][0]), round(tsr[0][1]),
@@ -75,18 +101,10 @@ class Document2Html(object):
                                 round(tsr[2][0]), round(tsr[2][1]),
                                 round(tsr[3][0]), round(tsr[3][1])])
 
-            for i in range(len(det_result)):
-                pts = det_result[i]
+            # Check which detected text boxes are inside the current tsr_result (table region), in their original order
+            for i in self._points_in_box_indexed(tsr, span_centers, span_center_index):
                 rec_text = rec_result[i]["text"]  # pre-extracted recognition result
 
-                p0, p1, p2, p3 = pts
-                ctx = (p0 + p2) / 2.0
-                cty = (p1 + p3) / 2.0
-
-                # Check if the detected text box is inside the current tsr_result (table region)
-                if not self._point_in_box(tsr, [ctx, cty]):
-                    continue
-
                 # Combine all text in the same cell
                 combined_text += " " + rec_text
 
@@ -102,12 +120,13 @@ class Document2Html(object):
         return output
 
 
-    def text_detection_and_recognition(self, page):
+    def text_detection_and_recognition(self, page, zoom=1.0):
         """
         Use PyMuPDF to detect and recognize text in the PDF page.
 
         Parameters:
           page: a loaded PyMuPDF page object.
+          zoom: scale from PDF points to image pixels (resolution / 72).
 
         Return:
           det_result: detected text boxes.
@@ -121,7 +140,7 @@ class Document2Html(object):
             for line in block["lines"]:
                 for span in line["spans"]:
                     text = span["text"]  # Recognized text
-                    bbox = span["bbox"]  # Text bounding box (coordinates)
+                    bbox = [coord * zoom for coord in span["bbox"]]  # Text bounding box (image coordinates)
                     font_size = span["size"]  # Font size
                     indent = span["origin"][0]  # Horizontal position to calculate indent
                     det_result.append(bbox)
@@ -179,11 +198,29 @@ class Document2Html(object):
         # Return True if the overlap percentage is greater than or equal to the threshold
         return overlap_percentage >= threshold
 
-    def reading_sort(self, page, layout_dets):      
+    def _boxes_inside(self, bboxes, layout_box, threshold=0.4):
+        """
+        Vectorized version of _is_box_inside (same arithmetic), for an N x 4 array of bboxes.
+
+        Return:
+        Boolean mask of the bboxes that are inside layout_box.
+        """
+        x_min = np.maximum(bboxes[:, 0], layout_box[0][0])
+        y_min = np.maximum(bboxes[:, 1], layout_box[0][1])
+        x_max = np.minimum(bboxes[:, 2], layout_box[2][0])
+        y_max = np.minimum(bboxes[:, 3], layout_box[2][1])
+        overlap_area = np.maximum(0, x_max - x_min) * np.maximum(0, y_max - y_min)
+
+        bbox_area = (bboxes[:, 2] - bboxes[:, 0]) * (bboxes[:, 3] - bboxes[:, 1])
+        overlap_percentage = np.divide(overlap_area, bbox_area, out=np.zeros_like(overlap_area), where=bbox_area > 0)
+
+        return overlap_percentage >= threshold
+
+    def reading_sort(self, page, layout_dets, zoom=1.0):      
         # 페이지 너비의 절반을 기준으로 왼쪽 열과 오른쪽 열을 나눔
         page_rect = page.rect
-        page_width = page_rect.width
-        page_height = page_rect.height
+        page_width = page_rect.width * zoom
+        page_height = page_rect.height * zoom
         mid_x = page_width / 2
 
         # 왼쪽 열에 속하는 layout_dets와 오른쪽 열에 속하는 layout_dets로 나눔
@@ -205,12 +242,18 @@ class Document2Html(object):
         # 두 열을 결합하여, 왼쪽 열을 먼저 처리하고 오른쪽 열을 나중에 처리
         return left_column_sorted + right_column_sorted
 
-    def _assemble(self, page, la_result, det_result, rec_result, tsr_result):
+    def _assemble(self, page, la_result, det_result, rec_result, tsr_result, zoom=1.0):
         output = []
-        layout_dets = self.reading_sort(page, la_result['layout_dets'])
+        layout_dets = self.reading_sort(page, la_result['layout_dets'], zoom)
 
         html_output = ""
 
+        # Spatial indices over the text spans, shared by all the regions: each region only tests the spans near it
+        det_boxes = np.asarray(det_result, dtype=np.float64).reshape(-1, 4)
+        span_index = GridIndex(det_boxes)
+        span_center_index = GridIndex(np.stack([(det_boxes[:, 0] + det_boxes[:, 2]) / 2.0,
+                                                (det_boxes[:, 1] + det_boxes[:, 3]) / 2.0], axis=1))
+
         for i in range(len(layout_dets)):
             category_index = layout_dets[i]['category_id']
             category_name = self.layout_analysis_module.mapping(category_index)
@@ -239,7 +282,7 @@ class Document2Html(object):
                 html_output += f"  $$ {formula_recognition} $$\n"
             elif category_name == 'table':
                 # Handle tables within the layout_box
-                table_output = self._table_recognize(layout_box, tsr_result, det_result, rec_result)
+                table_output = self._table_recognize(layout_box, tsr_result, det_boxes, rec_result, span_center_index)
                 for item in table_output:
                     cell_content = item['content']
                     cell_position = item['position']
@@ -252,11 +295,10 @@ class Document2Html(object):
                 combined_text = ""
                 indent = None  # To keep track of the last indent value
 
-                for j in range(len(det_result)):
-                    bbox = det_result[j]
-                    if not self._is_box_inside(bbox, layout_box):
-                        continue
-                    
+                # Candidate spans overlap the layout_box; the exact test keeps their original order
+                candidates = span_index.query(layout_box[0][0], layout_box[0][1], layout_box[2][0], layout_box[2][1])
+                candidates = candidates[self._boxes_inside(det_boxes[candidates], layout_box)]
+                for j in candidates:
                     text_content = rec_result[j]['text']
                     font_size = rec_result[j]['font_size']
                     current_indent = rec_result[j]['indent']
@@ -75,12 +75,13 @@ class TableParsing(object):
         output = []
         tsr_result = np.array(tsr_result).reshape([len(tsr_result), 4, 2])
 
-        # perform recognition and assembling
+        # recognize the text contents within all the text instances (in batches)
+        rec_result = self.text_recognition_module(image, det_result)
+
+        # perform assembling
         for i in range(det_result.shape[0]):
-            # crop sub image and recognize the text content within it
             pts = self.text_recognition_module.order_point(det_result[i])
-            cropped_image = self.text_recognition_module.crop_image(image, pts)
-            rec = self.text_recognition_module.recognize_cropped_image(cropped_image)
+            rec = rec_result[i]
 
             find_cell = 0
             p0, p1, p2, p3 = pts
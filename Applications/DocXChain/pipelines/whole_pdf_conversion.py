@@ -0,0 +1,149 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+import sys
+import threading
+import queue
+import numpy as np
+
+from modules.file_loading import iterate_whole_pdf
+from pipelines.document_structurization import DocumentStructurization
+
+class WholePDFConversion(object):
+    """
+    Description:
+      class definition of WholePDFConversion pipeline:
+      (1) streaming conversion of whole PDF files (page rasterization + layout analysis + formula recognition)
+      (2) the three stages run concurrently and are connected by bounded queues, hence only a few pages are held in memory at any time and the first page is available after a single page's latency
+
+    Caution:
+      the layout analysis model and the formula recognition model are each used by a single thread only
+    """
+
+    def __init__(self, configs):
+        """
+        Description:
+          initialize the class instance
+        """
+
+        # initialize and launch pipiline
+        self.document_structurizer = DocumentStructurization(configs)
+
+        # maximal number of pages waiting between two successive stages
+        self.queue_size = configs.get('queue_size', 2)
+        # resolution (DPI) for rendering PDF pages (None: the longer side of each page is rendered at the input size of the layout analysis model)
+        self.resolution = configs.get('resolution', 150)
+
+    def __call__(self, pdf_path):
+        """
+        Description:
+          convert the given PDF file page by page
+
+        Parameters:
+          pdf_path: path to the PDF file
+
+        Return:
+          a generator of page results ({'page': page_index, 'information': result}), in page order
+        """
+
+        stop_event = threading.Event()
+        image_queue = queue.Queue(maxsize = self.queue_size)
+        layout_queue = queue.Queue(maxsize = self.queue_size)
+
+        workers = [threading.Thread(target = self._rasterize, args = (pdf_path, image_queue, stop_event), daemon = True),
+                   threading.Thread(target = self._analyze_layout, args = (image_queue, layout_queue, stop_event), daemon = True)]
+        for worker in workers:
+            worker.start()
+
+        try:
+            while True:
+                item = layout_queue.get()
+                if item is None:  # end of document
+                    break
+                if isinstance(item, BaseException):  # failure in one of the upstream stages
+                    raise item
+
+                # perform formula recognition and assembling in the current thread
+                page_index, image, la_result = item
+                det_result = np.array([])
+                rec_result = np.array([])
+                result = self.document_structurizer._assemble(image, la_result, det_result, rec_result)
+
+                yield {'page': page_index, 'information': result}
+        finally:
+            # unblock and stop the upstream stages (e.g., the consumer quit early)
+            stop_event.set()
+            for worker in workers:
+                worker.join()
+
+    def _rasterize(self, pdf_path, output_queue, stop_event):
+        """
+        Description:
+          stage 1: render the pages of the PDF file one by one
+        """
+
+        try:
+            for page_index, image in enumerate(iterate_whole_pdf(pdf_path, self.resolution)):
+                if not self._put(output_queue, (page_index, image), stop_event):
+                    return
+        except BaseException as e:
+            self._put(output_queue, e, stop_event)
+            return
+
+        self._put(output_queue, None, stop_event)
+
+        return
+
+    def _analyze_layout(self, input_queue, output_queue, stop_event):
+        """
+        Description:
+          stage 2: perform layout analysis on the rendered pages
+        """
+
+        while True:
+            item = self._get(input_queue, stop_event)
+            if item is None or isinstance(item, BaseException):  # forward the end of document or the failure
+                self._put(output_queue, item, stop_event)
+                return
+
+            try:
+                page_index, image = item
+                la_result = self.document_structurizer.layout_analysis_module(image)
+            except BaseException as e:
+                self._put(output_queue, e, stop_event)
+                return
+
+            if not self._put(output_queue, (page_index, image, la_result), stop_event):
+                return
+
+    def _put(self, target_queue, item, stop_event):
+        # wait for a free slot, unless the pipeline has been stopped
+        while not stop_event.is_set():
+            try:
+                target_queue.put(item, timeout = 0.1)
+                return True
+            except queue.Full:
+                pass
+
+        return False
+
+    def _get(self, source_queue, stop_event):
+        # wait for an item, unless the pipeline has been stopped (regarded as the end of document)
+        while not stop_event.is_set():
+            try:
+                return source_queue.get(timeout = 0.1)
+            except queue.Empty:
+                pass
+
+        return None
+
+    def release(self):
+        """
+        Description:
+          release all the resources
+        """
+
+        if self.document_structurizer is not None:
+            self.document_structurizer.release()
+
+        return
@@ -0,0 +1,101 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+import sys
+import numpy as np
+
+class GridIndex(object):
+    """
+    Description:
+      class definition of GridIndex:
+      (1) uniform grid over axis-aligned boxes (or points, i.e., boxes of zero size), stored as NumPy arrays in CSR layout (box indices sorted by grid cell)
+      (2) answers rectangle queries with the indices of the candidate boxes, i.e., a superset of the boxes intersecting the query rectangle, in ascending order
+      (3) exact tests are then carried out on the candidates only, hence assigning N boxes to M regions costs about O(N + M) instead of O(N x M)
+
+    Caution:
+      a box is registered in every grid cell it overlaps, so the grid cells should not be much smaller than the boxes (see the default cell size)
+    """
+
+    def __init__(self, boxes, cell_size = None):
+        """
+        Description:
+          initialize the class instance
+
+        Parameters:
+          boxes: array of boxes, N x 4 ([x_min, y_min, x_max, y_max], inverted corners are allowed), or of points, N x 2 ([x, y])
+          cell_size: side length of the grid cells (default: twice the median box size, at least 1/64 of the extent)
+        """
+
+        boxes = np.asarray(boxes, dtype = np.float64)
+        if boxes.size > 0 and boxes.shape[-1] == 2:  # points
+            boxes = np.concatenate([boxes, boxes], axis = 1)
+        boxes = boxes.reshape(-1, 4)
+        # boxes inverted on either axis (e.g., malformed PDF spans) are registered under their normalized extent,
+        # which only adds candidates: the exact tests never match such boxes anyway
+        boxes = np.concatenate([np.minimum(boxes[:, 0:2], boxes[:, 2:4]), np.maximum(boxes[:, 0:2], boxes[:, 2:4])], axis = 1)
+        self.count = boxes.shape[0]
+
+        if self.count == 0:
+            self.origin = np.zeros(2)
+            self.cell_size = 1.0
+            self.grid_shape = (1, 1)
+            self.starts = np.zeros(2, dtype = np.int64)
+            self.indices = np.zeros(0, dtype = np.int64)
+            return
+
+        # grid geometry
+        self.origin = boxes[:, 0:2].min(axis = 0)
+        extent = np.maximum(boxes[:, 2:4].max(axis = 0) - self.origin, 1e-6)
+        if cell_size is None:
+            sizes = np.maximum(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1])
+            cell_size = max(2.0 * np.median(sizes), extent.max() / 64.0)
+        self.cell_size = float(cell_size)
+        self.grid_shape = (int(extent[1] // self.cell_size) + 1, int(extent[0] // self.cell_size) + 1)  # rows, columns
+
+        # grid cells covered by each box
+        col_min, row_min, col_max, row_max = self._cell_range(boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3])
+        cols_per_box = col_max - col_min + 1
+        cells_per_box = (row_max - row_min + 1) * cols_per_box
+        box_ids = np.repeat(np.arange(self.count), cells_per_box)
+        offsets = np.arange(box_ids.shape[0]) - np.repeat(np.cumsum(cells_per_box) - cells_per_box, cells_per_box)
+        rows = row_min[box_ids] + offsets // cols_per_box[box_ids]
+        cols = col_min[box_ids] + offsets % cols_per_box[box_ids]
+        cell_ids = rows * self.grid_shape[1] + cols
+
+        # CSR layout: the boxes of grid cell k are indices[starts[k]:starts[k + 1]], in ascending order
+        order = np.argsort(cell_ids, kind = 'stable')
+        self.indices = box_ids[order]
+        self.starts = np.zeros(self.grid_shape[0] * self.grid_shape[1] + 1, dtype = np.int64)
+        np.cumsum(np.bincount(cell_ids, minlength = self.grid_shape[0] * self.grid_shape[1]), out = self.starts[1:])
+
+    def query(self, x_min, y_min, x_max, y_max):
+        """
+        Description:
+          return the indices (ascending, without duplicates) of the boxes that may intersect the given rectangle (boundaries included)
+        """
+
+        if self.count == 0 or x_max < x_min or y_max < y_min:
+            return np.zeros(0, dtype = np.int64)
+
+        col_min, row_min, col_max, row_max = self._cell_range(np.array([x_min]), np.array([y_min]), np.array([x_max]), np.array([y_max]))
+        col_min, row_min, col_max, row_max = col_min[0], row_min[0], col_max[0], row_max[0]
+
+        # the grid cells of a row are contiguous in the CSR layout, so one slice per row
+        chunks = []
+        for row in range(row_min, row_max + 1):
+            begin = self.starts[row * self.grid_shape[1] + col_min]
+            end = self.starts[row * self.grid_shape[1] + col_max + 1]
+            if end > begin:
+                chunks.append(self.indices[begin:end])
+        if len(chunks) == 0:
+            return np.zeros(0, dtype = np.int64)
+
+        return np.unique(np.concatenate(chunks))
+
+    def _cell_range(self, x_min, y_min, x_max, y_max):
+        # grid cells (clipped to the grid) covered by the given boxes, boundaries included
+        def to_cell(value, origin, count):
+            return np.clip(np.floor((value - origin) / self.cell_size), 0, count - 1).astype(np.int64)
+
+        return (to_cell(x_min, self.origin[0], self.grid_shape[1]), to_cell(y_min, self.origin[1], self.grid_shape[0]),
+                to_cell(x_max, self.origin[0], self.grid_shape[1]), to_cell(y_max, self.origin[1], self.grid_shape[0]))
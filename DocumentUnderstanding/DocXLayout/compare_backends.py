@@ -0,0 +1,73 @@
+# equivalence and latency check of the onnxruntime backend against the pytorch backend
+# 1. export the model:  python compare_backends.py --model_file model_path/DocX_dla34_230829.pth --onnx_path docx_layout.onnx --export
+# 2. compare:           python compare_backends.py --model_file model_path/DocX_dla34_230829.pth --onnx_path docx_layout.onnx demo_images/*.png
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from main import DocXLayoutPredictor
+
+
+def export(args):
+    predictor = DocXLayoutPredictor({'model_file': args.model_file, 'debug': 0, 'gpus': '-1',
+                                     'convert_onnx': 1, 'onnx_path': args.onnx_path})
+    # the graph is exported during the forward pass
+    predictor(np.zeros((args.input_res, args.input_res, 3), dtype=np.uint8))
+
+
+def same_dets(dets_a, dets_b, tol):
+    if len(dets_a) != len(dets_b):
+        return False
+    for det_a, det_b in zip(dets_a, dets_b):
+        if det_a['category_id'] != det_b['category_id']:
+            return False
+        if np.abs(np.array(det_a['poly']) - np.array(det_b['poly'])).max() > tol:
+            return False
+        if abs(det_a['score'] - det_b['score']) > 0.011:  # scores are rounded to 2 digits
+            return False
+    return True
+
+
+def compare(args):
+    backends = {}
+    for backend in ['pytorch', 'onnxruntime']:
+        start = time.time()
+        backends[backend] = DocXLayoutPredictor({'model_file': args.model_file, 'debug': 0, 'gpus': '-1',
+                                                 'num_threads': args.num_threads, 'backend': backend,
+                                                 'onnx_path': args.onnx_path})
+        print('{}: cold start {:.3f}s'.format(backend, time.time() - start))
+
+    images = [cv2.imread(image_name) for image_name in args.images]
+    mismatches = 0
+    for image_name, image in zip(args.images, images):
+        results = {}
+        for backend, predictor in backends.items():
+            predictor(image)  # warm up
+            start = time.time()
+            results[backend] = predictor(image)
+            print('{}: {} {:.3f}s'.format(backend, image_name, time.time() - start))
+        for key in ['layout_dets', 'subfield_dets']:
+            if not same_dets(results['pytorch'][key], results['onnxruntime'][key], args.tol):
+                mismatches += 1
+                print('--> mismatch: {} {}'.format(image_name, key))
+    print('{} mismatches on {} images'.format(mismatches, len(images)))
+    return mismatches
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('images', nargs='*')
+    parser.add_argument('--model_file', type=str, required=True)
+    parser.add_argument('--onnx_path', type=str, default='docx_layout.onnx')
+    parser.add_argument('--export', action='store_true')
+    parser.add_argument('--input_res', type=int, default=768)
+    parser.add_argument('--num_threads', type=int, default=0)
+    parser.add_argument('--tol', type=float, default=1.0, help='tolerance on polygon coordinates (pixels)')
+    args = parser.parse_args()
+
+    if args.export:
+        export(args)
+    else:
+        exit(1 if compare(args) > 0 else 0)
@@ -8,8 +8,11 @@ import time
 
 import cv2
 import numpy as np
-import torch
-from models.model import create_model, load_model, save_model
+try:
+    import torch
+    from models.model import create_model, load_model, save_model
+except ImportError:  # PyTorch is not needed when serving with the ONNX Runtime backend
+    torch = None
 
 BASE_DIR = os.path.dirname(__file__)
 sys.path.append(BASE_DIR + '/../utils')
@@ -17,17 +20,21 @@ from debugger import Debugger
 from image import get_affine_transform
 
 
+def set_cpu_threads(opt):
+    # intra-op (num_threads) and inter-op (num_interop_threads) parallelism of CPU inference, 0 keeps the PyTorch default
+    if opt.num_threads > 0:
+        torch.set_num_threads(opt.num_threads)
+    if opt.num_interop_threads > 0:
+        try:
+            torch.set_num_interop_threads(opt.num_interop_threads)
+        except RuntimeError:  # can only be set once, before any inter-op parallel work has started
+            print('--> warning: the number of inter-op threads has already been set, keep {}'.format(
+                torch.get_num_interop_threads()))
+
+
 class BaseDetector(object):
     def __init__(self, opt):
-        if opt.gpus[0] >= 0:
-            opt.device = torch.device('cuda')
-        else:
-            opt.device = torch.device('cpu')
-
-        self.model = create_model(opt.arch, opt.heads, opt.head_conv, opt.convert_onnx, {})
-        self.model = load_model(self.model, opt.load_model)
-        self.model = self.model.to(opt.device)
-        self.model.eval()
+        self.load_network(opt)
 
         self.mean = np.array(opt.mean, dtype=np.float32).reshape(1, 1, 3)
         self.std = np.array(opt.std, dtype=np.float32).reshape(1, 1, 3)
@@ -37,6 +44,20 @@ class BaseDetector(object):
         self.opt = opt
         self.pause = True
 
+    def load_network(self, opt):
+        if opt.gpus[0] >= 0 and torch.cuda.is_available():
+            opt.device = torch.device('cuda')
+        else:
+            if opt.gpus[0] >= 0:
+                print('--> warning: CUDA is not available, running on CPU')
+            opt.device = torch.device('cpu')
+            set_cpu_threads(opt)
+
+        self.model = create_model(opt.arch, opt.heads, opt.head_conv, opt.convert_onnx, {})
+        self.model = load_model(self.model, opt.load_model)
+        self.model = self.model.to(opt.device)
+        self.model.eval()
+
     def pre_process(self, image, scale, meta=None):
         height, width = image.shape[0:2]
         new_height = int(height * scale)
@@ -63,7 +84,7 @@ class BaseDetector(object):
         images = inp_image.transpose(2, 0, 1).reshape(1, 3, inp_height, inp_width)
         if self.opt.flip_test:
             images = np.concatenate((images, images[:, :, :, ::-1]), axis=0)
-        images = torch.from_numpy(images)
+        images = self.from_numpy(images)
         meta = {'c': c, 's': s,
                 'input_height': inp_height,
                 'input_width': inp_width,
@@ -72,6 +93,17 @@ class BaseDetector(object):
                 'out_width': inp_width // self.opt.down_ratio}
         return images, meta
 
+    def from_numpy(self, images):
+        return torch.from_numpy(images)
+
+    def to_device(self, images):
+        return images.to(self.opt.device)
+
+    def synchronize(self):
+        # timing fence, only needed when kernels run asynchronously on the GPU
+        if self.opt.device.type == 'cuda':
+            torch.cuda.synchronize()
+
     def resize(self, image):
         h, w, _ = image.shape
         scale = self.opt.input_h / (max(w, h) + 1e-4)
@@ -127,6 +159,99 @@ class BaseDetector(object):
         else:
             return np.array([[0] * 12])
 
+    def post_process_scale(self, dets, dets_sub, corner, meta, scale=1):
+        dets, corner = self.post_process(dets, corner, meta, scale)
+        for j in range(1, self.num_classes + 1):
+            dets[j] = self.Duplicate_removal(dets[j])
+            
+        # add sub
+        dets_sub, corner = self.post_process(dets_sub, corner, meta, scale)
+        for j in range(1, self.num_classes + 1):
+            dets_sub[j] = self.Duplicate_removal(dets_sub[j])
+
+        dets[12] = dets_sub[12]
+        dets[13] = dets_sub[13]
+
+        return dets, corner
+
+    def stack_images(self, images_list):
+        # pad the pre-processed images (bottom/right) to a common size, filling with normalized black as the letterbox border does;
+        # with fixed-resolution testing (the default) all the images already share the same size, hence no padding happens
+        inp_height = max([images.shape[2] for images in images_list])
+        inp_width = max([images.shape[3] for images in images_list])
+        pad_value = ((0. - self.mean) / self.std).astype(np.float32).reshape(1, 3, 1, 1)
+        batch = np.empty((len(images_list), 3, inp_height, inp_width), dtype=np.float32)
+        batch[:] = pad_value
+        for i, images in enumerate(images_list):
+            batch[i, :, :images.shape[2], :images.shape[3]] = np.asarray(images[0])
+        return self.from_numpy(batch)
+
+    def run_batch(self, images_or_paths):
+        # run the detector on several images with a single forward pass per scale;
+        # the returned list holds one result per image, identical to that of run()
+        if self.opt.flip_test or self.opt.debug >= 2:
+            # flip testing and heatmap debugging only handle a single image per forward pass
+            return [self.run(image_or_path) for image_or_path in images_or_paths]
+
+        load_time, pre_time, net_time, dec_time, post_time = 0, 0, 0, 0, 0
+        merge_time, tot_time = 0, 0
+        start_time = time.time()
+        images = []
+        for image_or_path in images_or_paths:
+            if isinstance(image_or_path, np.ndarray):
+                images.append(image_or_path)
+            else:
+                images.append(cv2.imread(image_or_path))
+
+        loaded_time = time.time()
+        load_time += (loaded_time - start_time)
+
+        detections = [[] for _ in images]
+        corner = 0
+        output = None
+        for scale in self.scales:
+            scale_start_time = time.time()
+            images_list, metas = [], []
+            for image in images:
+                inp, meta = self.pre_process(image, scale)
+                images_list.append(inp)
+                metas.append(meta)
+            batch = self.to_device(self.stack_images(images_list))
+            self.synchronize()
+            pre_process_time = time.time()
+            pre_time += pre_process_time - scale_start_time
+            output, dets, dets_sub, corner, forward_time = self.process(batch, return_time=True)
+            self.synchronize()
+            net_time += forward_time - pre_process_time
+            decode_time = time.time()
+            dec_time += decode_time - forward_time
+
+            for i in range(len(images)):
+                dets_i, corner = self.post_process_scale(dets[i:i + 1], dets_sub[i:i + 1], corner, metas[i], scale)
+                detections[i].append(dets_i)
+            self.synchronize()
+            post_process_time = time.time()
+            post_time += post_process_time - decode_time
+
+        results = [self.merge_outputs(detections_i) for detections_i in detections]
+        end_time = time.time()
+        merge_time += end_time - post_process_time
+        tot_time += end_time - start_time
+
+        if self.opt.debug >= 1:
+            for image_or_path, image, results_i in zip(images_or_paths, images, results):
+                if isinstance(image_or_path, str):
+                    image_name = os.path.basename(image_or_path)
+                else:
+                    image_name = "{}.jpg".format(time.time())
+                debugger = Debugger(dataset=self.opt.dataset, ipynb=(self.opt.debug == 3),
+                                    num_classes=self.opt.num_classes, theme=self.opt.debugger_theme)
+                self.show_results(debugger, image, results_i, corner, image_name)
+
+        return [{'results': results_i, 'tot': tot_time, 'load': load_time,
+                 'pre': pre_time, 'net': net_time, 'dec': dec_time, 'corner': corner,
+                 'post': post_time, 'merge': merge_time, 'output': output} for results_i in results]
+
     def run(self, image_or_path_or_tensor, meta=None):
         load_time, pre_time, net_time, dec_time, post_time = 0, 0, 0, 0, 0
         merge_time, tot_time = 0, 0
@@ -160,12 +285,12 @@ class BaseDetector(object):
             # images = np.load('data.npy').astype(np.float32)
             # images = torch.from_numpy(images)
             
-            images = images.to(self.opt.device)
-            torch.cuda.synchronize()
+            images = self.to_device(images)
+            self.synchronize()
             pre_process_time = time.time()
             pre_time += pre_process_time - scale_start_time
             output, dets, dets_sub, corner, forward_time = self.process(images, return_time=True)
-            torch.cuda.synchronize()
+            self.synchronize()
             net_time += forward_time - pre_process_time
             decode_time = time.time()
             dec_time += decode_time - forward_time
@@ -173,27 +298,16 @@ class BaseDetector(object):
             if self.opt.debug >= 2:
                 self.debug(debugger, images, dets, output, scale)
 
-            dets, corner = self.post_process(dets, corner, meta, scale)
-            for j in range(1, self.num_classes + 1):
-                dets[j] = self.Duplicate_removal(dets[j])
-                
-            # add sub
-            dets_sub, corner = self.post_process(dets_sub, corner, meta, scale)
-            for j in range(1, self.num_classes + 1):
-                dets_sub[j] = self.Duplicate_removal(dets_sub[j])
-                
+            dets, corner = self.post_process_scale(dets, dets_sub, corner, meta, scale)
             # import ipdb;ipdb.set_trace()   
-            torch.cuda.synchronize()
+            self.synchronize()
             post_process_time = time.time()
             post_time += post_process_time - decode_time
             
-            dets[12] = dets_sub[12]
-            dets[13] = dets_sub[13]
-            
             detections.append(dets)
 
         results = self.merge_outputs(detections)
-        torch.cuda.synchronize()
+        self.synchronize()
         end_time = time.time()
         merge_time += end_time - post_process_time
         tot_time += end_time - start_time
@@ -6,11 +6,14 @@ import os
 import time
 import sys
 import numpy as np
-import torch
+try:
+    import torch
+    from models.decode import ctdet_4ps_decode, ctdet_cls_decode
+    from models.utils import flip_tensor
+except ImportError:  # PyTorch is not needed when serving with the ONNX Runtime backend
+    torch = None
 # from external.nms import soft_nms
 from external.shapelyNMS import pnms
-from models.decode import ctdet_4ps_decode, ctdet_cls_decode
-from models.utils import flip_tensor
 
 BASE_DIR = os.path.dirname(__file__)
 sys.path.append(BASE_DIR + '/../utils')
@@ -28,22 +31,19 @@ class CtdetDetector_Subfield(BaseDetector):
         with torch.no_grad():
             output = self.model(images)[-1]
             if self.opt.convert_onnx == 1:
-                torch.cuda.synchronize()
+                self.synchronize()
                 inputs = ['data']
                 outputs = ['hm.0.sigmoid', 'hm.0.maxpool', 'cls.0.sigmoid', 'ftype.0.sigmoid', 'wh.2', 'reg.2', 'hm_sub.0.sigmoid', 'hm_sub.0.maxpool', 'wh_sub.2', 'reg_sub.2' ]
-                dynamic_axes = {'data': {2: 'h', 3: 'w'}, 'hm.0.sigmoid': {2: 'H', 3: 'W'},
-                                'hm.0.maxpool': {2: 'H', 3: 'W'}, 'cls.0.sigmoid': {2: 'H', 3: 'W'},
-                                'ftype.0.sigmoid': {2: 'H', 3: 'W'}, 'wh.2': {2: 'H', 3: 'W'},
-                                'reg.2': {2: 'H', 3: 'W'},
-                                'hm_sub.0.sigmoid': {2: 'H', 3: 'W'},
-                                'hm_sub.0.maxpool': {2: 'H', 3: 'W'}, 
-                                'wh_sub.2': {2: 'H', 3: 'W'},
-                                'reg_sub.2': {2: 'H', 3: 'W'}}
+                dynamic_axes = {'data': {0: 'N', 2: 'h', 3: 'w'}, 'hm.0.sigmoid': {0: 'N', 2: 'H', 3: 'W'},
+                                'hm.0.maxpool': {0: 'N', 2: 'H', 3: 'W'}, 'cls.0.sigmoid': {0: 'N', 2: 'H', 3: 'W'},
+                                'ftype.0.sigmoid': {0: 'N', 2: 'H', 3: 'W'}, 'wh.2': {0: 'N', 2: 'H', 3: 'W'},
+                                'reg.2': {0: 'N', 2: 'H', 3: 'W'},
+                                'hm_sub.0.sigmoid': {0: 'N', 2: 'H', 3: 'W'},
+                                'hm_sub.0.maxpool': {0: 'N', 2: 'H', 3: 'W'}, 
+                                'wh_sub.2': {0: 'N', 2: 'H', 3: 'W'},
+                                'reg_sub.2': {0: 'N', 2: 'H', 3: 'W'}}
 
-                onnx_path = self.opt.onnx_path
-                if self.opt.onnx_path == "auto":
-                    onnx_path = "{}_{}cls_{}ftype.onnx".format(self.opt.dataset, self.opt.num_classes,
-                                                               self.opt.num_secondary_classes)
+                onnx_path = self.onnx_file()
 
                 torch.onnx.export(self.model, images, onnx_path,
                                   input_names=inputs, output_names=outputs,
@@ -76,7 +76,7 @@ class CtdetDetector_Subfield(BaseDetector):
                 hm = (hm[0:1] + flip_tensor(hm[1:2])) / 2
                 wh = (wh[0:1] + flip_tensor(wh[1:2])) / 2
                 reg = reg[0:1] if reg is not None else None
-            torch.cuda.synchronize()
+            self.synchronize()
             forward_time = time.time()
             # return dets [bboxes, scores, clses]
             dets, inds = ctdet_4ps_decode(hm, wh, reg=reg, K=self.opt.K)
@@ -105,6 +105,13 @@ class CtdetDetector_Subfield(BaseDetector):
         else:
             return output, dets, dets_sub
 
+    def onnx_file(self):
+        onnx_path = self.opt.onnx_path
+        if self.opt.onnx_path == "auto":
+            onnx_path = "{}_{}cls_{}ftype.onnx".format(self.opt.dataset, self.opt.num_classes,
+                                                       self.opt.num_secondary_classes)
+        return onnx_path
+
     def post_process(self, dets, corner, meta, scale=1):
         if self.opt.nms:
             detn = pnms(dets[0], self.opt.scores_thresh)
@@ -0,0 +1,101 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+
+import numpy as np
+import onnxruntime as ort
+
+from models.decode_np import ctdet_4ps_decode_np, ctdet_cls_decode_np
+
+from .ctdet_subfield import CtdetDetector_Subfield
+
+
+class CtdetDetector_Subfield_ONNX(CtdetDetector_Subfield):
+    """
+    Runs the graph exported with --convert_onnx 1 in ONNX Runtime (CPU execution provider)
+    and decodes its outputs with NumPy; pre/post-processing is shared with CtdetDetector_Subfield.
+    """
+    output_names = ['hm.0.sigmoid', 'hm.0.maxpool', 'cls.0.sigmoid', 'ftype.0.sigmoid', 'wh.2', 'reg.2',
+                    'hm_sub.0.sigmoid', 'hm_sub.0.maxpool', 'wh_sub.2', 'reg_sub.2']
+
+    def __init__(self, opt):
+        super(CtdetDetector_Subfield_ONNX, self).__init__(opt)
+
+    def load_network(self, opt):
+        opt.device = None
+        self.opt = opt
+        options = ort.SessionOptions()
+        if opt.num_threads > 0:
+            options.intra_op_num_threads = opt.num_threads
+        if opt.num_interop_threads > 0:
+            options.inter_op_num_threads = opt.num_interop_threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        onnx_path = self.onnx_file()
+        self.session = ort.InferenceSession(onnx_path, sess_options=options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        # graphs exported before the batch axis was made dynamic only accept one image per run
+        self.fixed_batch = self.session.get_inputs()[0].shape[0] == 1
+        print('--> info: onnx is loaded from: {}'.format(onnx_path))
+
+    def from_numpy(self, images):
+        return images
+
+    def to_device(self, images):
+        return np.ascontiguousarray(images, dtype=np.float32)
+
+    def synchronize(self):
+        pass
+
+    def forward(self, images):
+        if self.fixed_batch and images.shape[0] > 1:
+            outputs = [self.session.run(self.output_names, {self.input_name: images[i:i + 1]})
+                       for i in range(images.shape[0])]
+            outputs = [np.concatenate(output, axis=0) for output in zip(*outputs)]
+        else:
+            outputs = self.session.run(self.output_names, {self.input_name: images})
+        return dict(zip(self.output_names, outputs))
+
+    def process(self, images, return_time=False):
+        if self.opt.flip_test:
+            print('--> warning: flip testing is not supported by the onnxruntime backend, ignored')
+        output = self.forward(images)
+        hm = output['hm.0.sigmoid']
+        cls = output['cls.0.sigmoid']
+        ftype = output['ftype.0.sigmoid']
+        wh = output['wh.2']
+        reg = output['reg.2'] if self.opt.reg_offset else None
+
+        # add sub
+        hm_sub = output['hm_sub.0.sigmoid']
+        wh_sub = output['wh_sub.2']
+        reg_sub = output['reg_sub.2'] if self.opt.reg_offset else None
+        forward_time = time.time()
+
+        # return dets [bboxes, scores, clses]
+        dets, inds = ctdet_4ps_decode_np(hm, wh, reg=reg, K=self.opt.K, hmax=output['hm.0.maxpool'])
+
+        # add sub
+        dets_sub, inds_sub = ctdet_4ps_decode_np(hm_sub, wh_sub, reg=reg_sub, K=self.opt.K,
+                                                 hmax=output['hm_sub.0.maxpool'])
+
+        box_cls = ctdet_cls_decode_np(cls, inds)
+        box_ftype = ctdet_cls_decode_np(ftype, inds)
+        clses = np.argmax(box_cls, axis=2)[:, :, None]
+        ftypes = np.argmax(box_ftype, axis=2)[:, :, None]
+        dets = np.concatenate((dets, clses, ftypes), axis=2)
+
+        # add subfield
+        dets_sub = np.concatenate((dets_sub, clses, ftypes), axis=2)
+        dets_sub[:, :, -3] += 11
+
+        corner = 0
+
+        if return_time:
+            return output, dets, dets_sub, corner, forward_time
+        else:
+            return output, dets, dets_sub
+
+    def debug(self, debugger, images, dets, output, scale=1):
+        print('--> warning: heatmap debugging is only available with the pytorch backend')
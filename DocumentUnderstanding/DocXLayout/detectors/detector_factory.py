@@ -7,3 +7,11 @@ from .ctdet_subfield import CtdetDetector_Subfield
 detector_factory = {
     'ctdet_subfield': CtdetDetector_Subfield
 }
+
+# detectors for the onnxruntime backend (--backend onnxruntime)
+onnx_detector_factory = {}
+try:
+    from .ctdet_subfield_onnx import CtdetDetector_Subfield_ONNX
+    onnx_detector_factory['ctdet_subfield'] = CtdetDetector_Subfield_ONNX
+except ImportError:  # onnxruntime is not installed
+    pass
@@ -0,0 +1,50 @@
+# micro-benchmark of the vectorized polygon NMS against the reference loop
+# usage: python benchmark_pnms.py [--sizes 100,500,3000] [--repeat 3]
+import argparse
+import time
+
+import numpy as np
+
+from shapelyNMS import pnms, pnms_loop
+
+
+def random_dets(k, size=768, seed=0):
+    # k random quads (clockwise from top-left, slightly skewed) with scores in [0, 1]
+    rng = np.random.RandomState(seed)
+    x0 = rng.uniform(0, size, k)
+    y0 = rng.uniform(0, size, k)
+    w = rng.uniform(10, size / 4, k)
+    h = rng.uniform(5, size / 16, k)
+    skew = rng.uniform(-3, 3, (k, 8))
+    quads = np.stack([x0, y0, x0 + w, y0, x0 + w, y0 + h, x0, y0 + h], axis=1) + skew
+    dets = np.zeros((k, 12), dtype=np.float32)
+    dets[:, :8] = quads
+    dets[:, 8] = rng.uniform(0, 1, k)
+    dets[:, 9] = rng.randint(0, 11, k)
+    return dets
+
+
+def timeit(func, dets, thresh, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(dets, thresh)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=str, default='100,500,3000')
+    parser.add_argument('--thresh', type=float, default=0.3)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print('{:>6} {:>12} {:>12} {:>9}'.format('K', 'loop (ms)', 'vector (ms)', 'speedup'))
+    for k in [int(k) for k in args.sizes.split(',')]:
+        dets = random_dets(k)
+        loop_time, loop_result = timeit(pnms_loop, dets, args.thresh, args.repeat)
+        vector_time, vector_result = timeit(pnms, dets, args.thresh, args.repeat)
+        assert np.array_equal(loop_result, vector_result), 'results differ at K={}'.format(k)
+        print('{:>6} {:>12.2f} {:>12.2f} {:>8.1f}x'.format(k, loop_time * 1e3, vector_time * 1e3,
+                                                          loop_time / vector_time))
@@ -1,8 +1,11 @@
 import numpy as np
-import torch.utils.data as data
+try:
+    from torch.utils.data import Dataset
+except ImportError:  # PyTorch is not needed when serving with the ONNX Runtime backend
+    Dataset = object
 
 
-class Huntie_Subfield(data.Dataset):
+class Huntie_Subfield(Dataset):
     num_classes = 13
     num_secondary_classes = 3
     default_resolution = [768, 768]
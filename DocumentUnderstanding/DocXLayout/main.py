@@ -4,7 +4,7 @@ import random
 
 from opts import opts
 from huntie_subfield import Huntie_Subfield
-from detectors.detector_factory import detector_factory
+from detectors.detector_factory import detector_factory, onnx_detector_factory
 import ipdb
 import numpy as np
 import logging
@@ -39,12 +39,23 @@ class DocXLayoutPredictor:
             'num_classes': 13,
             'load_model': model_file,
             'debug': debug, 
+            'gpus': params.get('gpus', '0'),  # '-1' for CPU
+            'num_threads': params.get('num_threads', 0),
+            'num_interop_threads': params.get('num_interop_threads', 0),
+            'convert_onnx': params.get('convert_onnx', 0),  # 1: export the model to onnx_path during the forward pass
+            'backend': params.get('backend', 'pytorch'),  # 'onnxruntime': run the exported onnx model (onnx_path)
+            'onnx_path': params.get('onnx_path', 'auto'),
         }
 
         opt = opts().parse(new_params)
         opt = opts().update_dataset_info_and_set_heads(opt, Huntie_Subfield)
 
-        Detector = detector_factory[opt.task]
+        if opt.backend == 'onnxruntime':
+            if opt.task not in onnx_detector_factory:
+                raise ImportError('onnxruntime is required by the onnxruntime backend')
+            Detector = onnx_detector_factory[opt.task]
+        else:
+            Detector = detector_factory[opt.task]
         detector = Detector(opt)
         self.detector = detector
         self.opt = opt
@@ -106,6 +117,18 @@ class DocXLayoutPredictor:
         result = {"layout_dets": layout_detection_info, "subfield_dets":subfield_detection_info}
         
         return result
+
+    def predict_batch(self, images, batch_size=8):
+        # run several pages through the network together (batch_size pages per forward pass);
+        # each returned result is identical to that of __call__ on the corresponding page
+        results = []
+        for start in range(0, len(images), batch_size):
+            rets = self.detector.run_batch(images[start:start + batch_size])
+            for ret in rets:
+                layout_detection_info, subfield_detection_info = self.convert_eval_format(ret['results'], self.opt)
+                results.append({"layout_dets": layout_detection_info, "subfield_dets": subfield_detection_info})
+
+        return results
         
         
 if __name__ == '__main__':
@@ -0,0 +1,92 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+
+# NumPy counterparts of ctdet_4ps_decode / ctdet_cls_decode (models/decode.py),
+# used by the ONNX Runtime backend so that PyTorch is not needed at serving time.
+
+
+def _max_pool_3x3(heat):
+    padded = np.pad(heat, ((0, 0), (0, 0), (1, 1), (1, 1)), mode='constant', constant_values=-np.inf)
+    height, width = heat.shape[2:4]
+    hmax = padded[:, :, 0:height, 0:width]
+    for dy in range(3):
+        for dx in range(3):
+            hmax = np.maximum(hmax, padded[:, :, dy:dy + height, dx:dx + width])
+    return hmax
+
+
+def _nms_np(heat, hmax=None):
+    # hmax: 3x3 max pooling of heat (the 'hm.0.maxpool' output of the exported graph)
+    if hmax is None:
+        hmax = _max_pool_3x3(heat)
+    keep = (hmax == heat).astype(heat.dtype)
+    return heat * keep
+
+
+def _topk_desc(scores, K):
+    # indices of the K largest values along the last axis, sorted in descending order
+    part = np.argpartition(-scores, K - 1, axis=-1)[..., :K]
+    part_scores = np.take_along_axis(scores, part, axis=-1)
+    order = np.argsort(-part_scores, axis=-1, kind='stable')
+    return np.take_along_axis(part_scores, order, axis=-1), np.take_along_axis(part, order, axis=-1)
+
+
+def _topk_np(scores, K=40):
+    batch, cat, height, width = scores.shape
+
+    topk_scores, topk_inds = _topk_desc(scores.reshape(batch, cat, -1), K)
+
+    topk_inds = topk_inds % (height * width)
+    topk_ys = (topk_inds // width).astype(np.float32)
+    topk_xs = (topk_inds % width).astype(np.float32)
+
+    topk_score, topk_ind = _topk_desc(topk_scores.reshape(batch, -1), K)
+    topk_clses = (topk_ind // K).astype(np.int32)
+    topk_inds = np.take_along_axis(topk_inds.reshape(batch, -1), topk_ind, axis=1)
+    topk_ys = np.take_along_axis(topk_ys.reshape(batch, -1), topk_ind, axis=1)
+    topk_xs = np.take_along_axis(topk_xs.reshape(batch, -1), topk_ind, axis=1)
+
+    return topk_score, topk_inds, topk_clses, topk_ys, topk_xs
+
+
+def _tranpose_and_gather_feat_np(feat, ind):
+    # feat: batch x channels x h x w, ind: batch x K -> batch x K x channels
+    batch, channels = feat.shape[0:2]
+    feat = feat.reshape(batch, channels, -1).transpose(0, 2, 1)
+    return feat[np.arange(batch)[:, None], ind]
+
+
+def ctdet_4ps_decode_np(heat, wh, reg=None, K=100, hmax=None):
+    batch, cat, height, width = heat.shape
+
+    # perform nms on heatmaps
+    heat = _nms_np(heat, hmax)
+
+    scores, inds, clses, ys, xs = _topk_np(heat, K=K)
+    if reg is not None:
+        reg = _tranpose_and_gather_feat_np(reg, inds)
+        xs = xs.reshape(batch, K, 1) + reg[:, :, 0:1]
+        ys = ys.reshape(batch, K, 1) + reg[:, :, 1:2]
+    else:
+        xs = xs.reshape(batch, K, 1) + 0.5
+        ys = ys.reshape(batch, K, 1) + 0.5
+    wh = _tranpose_and_gather_feat_np(wh, inds).reshape(batch, K, 8)
+    clses = clses.reshape(batch, K, 1).astype(np.float32)
+    scores = scores.reshape(batch, K, 1)
+    bboxes = np.concatenate([xs - wh[..., 0:1],
+                             ys - wh[..., 1:2],
+                             xs - wh[..., 2:3],
+                             ys - wh[..., 3:4],
+                             xs - wh[..., 4:5],
+                             ys - wh[..., 5:6],
+                             xs - wh[..., 6:7],
+                             ys - wh[..., 7:8]], axis=2)
+    detections = np.concatenate([bboxes, scores, clses], axis=2)
+    return detections, inds
+
+
+def ctdet_cls_decode_np(cls, inds):
+    return _tranpose_and_gather_feat_np(cls, inds)
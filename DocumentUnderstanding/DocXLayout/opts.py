@@ -26,7 +26,9 @@ class opts(object):
                                  help='0: donot convert'
                                       '1: convert pytorch model to onnx')
         self.parser.add_argument('--onnx_path', type=str, default="auto",
-                                 help='path of output onnx file.')
+                                 help='path of output onnx file (or of the input onnx file for the onnxruntime backend).')
+        self.parser.add_argument('--backend', type=str, default='pytorch',
+                                 help='inference backend: pytorch | onnxruntime')
         self.parser.add_argument('--debug', type=int, default=0,
                                  help='level of visualization.'
                                       '1: only show the final detection results'
@@ -48,6 +50,10 @@ class opts(object):
                                  help='dataloader threads. 0 for single-thread.')
         self.parser.add_argument('--not_cuda_benchmark', action='store_true',
                                  help='disable when the input size is not fixed.')
+        self.parser.add_argument('--num_threads', type=int, default=0,
+                                 help='intra-op threads for CPU inference. 0 for the PyTorch default.')
+        self.parser.add_argument('--num_interop_threads', type=int, default=0,
+                                 help='inter-op threads for CPU inference. 0 for the PyTorch default.')
         self.parser.add_argument('--seed', type=int, default=317,
                                  help='random seed')  # from CornerNet
 
@@ -10,7 +10,7 @@ from tqdm import tqdm
 from glob import glob
 import cv2
 
-from lightning_modules.data_modules.vie_dataset import VIEDataset
+from lightning_modules.data_modules.vie_dataset import VIEDataset, collate_fn, densify_el_labels
 from model import get_model
 from utils import get_class_names, get_config, get_label_map
 
@@ -63,6 +63,8 @@ def main():
         cfg.dataset_root_path,
         net.tokenizer,
         mode=mode,
+        use_cache=cfg.example_cache.enabled,
+        cache_dir=cfg.example_cache.dir,
     )
 
     data_loader = DataLoader(
@@ -72,6 +74,7 @@ def main():
         num_workers=cfg[mode].num_workers,
         pin_memory=True,
         drop_last=False,
+        collate_fn=collate_fn,
     )
 
     if cfg.model.head == "vie":
@@ -90,6 +93,7 @@ def main():
         for k in batch.keys():
             if isinstance(batch[k], torch.Tensor):
                 batch[k] = batch[k].to(device)
+        densify_el_labels(batch)
 
         with torch.no_grad():
             head_outputs, loss_dict = net(batch)
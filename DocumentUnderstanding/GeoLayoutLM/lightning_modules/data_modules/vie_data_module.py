@@ -8,7 +8,7 @@ from torch.utils.data.dataloader import DataLoader
 import cv2
 import numpy as np
 
-from lightning_modules.data_modules.vie_dataset import VIEDataset
+from lightning_modules.data_modules.vie_dataset import VIEDataset, collate_fn, densify_el_labels
 
 
 class VIEDataModule(pl.LightningDataModule):
@@ -18,7 +18,7 @@ class VIEDataModule(pl.LightningDataModule):
         self.train_loader = None
         self.val_loader = None
         self.tokenizer = tokenizer
-        self.collate_fn = None
+        self.collate_fn = collate_fn
 
         if self.cfg.model.backbone in [
             "alibaba-damo/geolayoutlm-base-uncased",
@@ -58,6 +58,8 @@ class VIEDataModule(pl.LightningDataModule):
             self.cfg.img_h,
             self.cfg.img_w,
             mode="train",
+            use_cache=self.cfg.example_cache.enabled,
+            cache_dir=self.cfg.example_cache.dir,
         )
         data_loader = DataLoader(
             dataset,
@@ -65,6 +67,7 @@ class VIEDataModule(pl.LightningDataModule):
             shuffle=True,
             num_workers=self.cfg.train.num_workers,
             pin_memory=True,
+            collate_fn=self.collate_fn,
         )
 
         elapsed_time = time.time() - start_time
@@ -85,6 +88,8 @@ class VIEDataModule(pl.LightningDataModule):
             self.cfg.img_h,
             self.cfg.img_w,
             mode=mode,
+            use_cache=self.cfg.example_cache.enabled,
+            cache_dir=self.cfg.example_cache.dir,
         )
         # debug_by_visualization(0, dataset)
 
@@ -95,6 +100,7 @@ class VIEDataModule(pl.LightningDataModule):
             num_workers=self.cfg[mode].num_workers,
             pin_memory=True,
             drop_last=False,
+            collate_fn=self.collate_fn,
         )
 
         return data_loader
@@ -104,7 +110,7 @@ class VIEDataModule(pl.LightningDataModule):
         for k in batch.keys():
             if isinstance(batch[k], torch.Tensor):
                 batch[k] = batch[k].to(device)
-        return batch
+        return densify_el_labels(batch)
 
 
 def debug_by_visualization(idx, dataset):
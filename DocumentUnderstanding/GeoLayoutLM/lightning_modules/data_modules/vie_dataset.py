@@ -1,14 +1,21 @@
 # Copyright (c) Alibaba, Inc. and its affiliates.
+import hashlib
 import itertools
 import json
 import os
+import shutil
+import time
 import cv2
 import numpy as np
 import torch
+from torch.utils.data.dataloader import default_collate
 from torch.utils.data.dataset import Dataset
 
 from utils import get_class_names
 
+# bump when the examples built by VIEDataset._build_example change
+CACHE_VERSION = 1
+
 
 class VIEDataset(Dataset):
     def __init__(
@@ -24,6 +31,8 @@ class VIEDataset(Dataset):
         img_h=768,
         img_w=768,
         mode=None,
+        use_cache=False,
+        cache_dir=None,
     ):
         self.dataset = dataset
         self.task = task
@@ -37,6 +46,8 @@ class VIEDataset(Dataset):
         self.img_h = img_h
         self.img_w = img_w
         self.mode = mode
+        self.use_cache = use_cache
+        self.cache_dir = cache_dir
         print(f"data_root: {dataset_root_path}")
 
         if getattr(self.tokenizer, "vocab", None) is not None:
@@ -50,8 +61,6 @@ class VIEDataset(Dataset):
             self.sep_token_id = self.tokenizer.sep_token_id
             self.unk_token_id = self.tokenizer.unk_token_id
 
-        self.examples = self._load_examples()
-
         self.class_names = get_class_names(self.dataset_root_path)
         self.class_idx_dic = dict(
             [(class_name, idx) for idx, class_name in enumerate(self.class_names)]
@@ -68,26 +77,126 @@ class VIEDataset(Dataset):
             ]
         )
 
-    def _load_examples(self):
-        examples = []
+        self.examples, self.cache = None, None
+        if self.use_cache:
+            self.cache = self._load_cache()
+        else:
+            self.examples = self._load_examples()
+
+    def _get_preprocessed_files(self):
         with open(
             os.path.join(self.dataset_root_path, f"preprocessed_files_{self.mode}.txt"),
             "r",
             encoding="utf-8",
         ) as fp:
-            for line in fp.readlines():
-                preprocessed_file = os.path.join(self.dataset_root_path, line.strip())
-                examples.append(
-                    json.load(open(preprocessed_file, "r", encoding="utf-8"))
-                )
+            return [
+                os.path.join(self.dataset_root_path, line.strip()) for line in fp.readlines()
+            ]
+
+    def _load_examples(self):
+        examples = []
+        for preprocessed_file in self._get_preprocessed_files():
+            examples.append(
+                json.load(open(preprocessed_file, "r", encoding="utf-8"))
+            )
 
         return examples
 
+    def _get_cache_path(self):
+        # the preprocessed json files are supposed to change only with their list (delete the cache otherwise)
+        key = [CACHE_VERSION, self.backbone_type, self.max_seq_length, self.max_block_num, self.img_h, self.img_w,
+               self.pad_token_id, self.cls_token_id, self.sep_token_id, self.unk_token_id]
+        for file_name in [f"preprocessed_files_{self.mode}.txt", "class_names.txt"]:
+            path = os.path.abspath(os.path.join(self.dataset_root_path, file_name))
+            stat = os.stat(path)
+            key += [path, stat.st_mtime_ns, stat.st_size]
+        key = hashlib.sha1(json.dumps(key).encode()).hexdigest()[:16]
+        return os.path.join(self.cache_dir or self.dataset_root_path, f"example_cache_{self.mode}_{key}")
+
+    def _load_cache(self):
+        """
+        The examples compiled into fixed-shape arrays (one .npy file per key of the examples, with the images resized,
+        in uint8), which are memory-mapped: an example is read as slices of the mappings.
+        """
+        cache_path = self._get_cache_path()
+        if not os.path.exists(cache_path):
+            self._compile_cache(cache_path)
+
+        cache = {}
+        for file_name in os.listdir(cache_path):
+            key = os.path.splitext(file_name)[0]
+            cache[key] = np.load(os.path.join(cache_path, file_name), mmap_mode="r")
+        return cache
+
+    def _compile_cache(self, cache_path):
+        start_time = time.time()
+        preprocessed_files = self._get_preprocessed_files()
+        num_examples = len(preprocessed_files)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        os.makedirs(tmp_path, exist_ok=True)
+
+        arrays, image_paths, el_pairs_blk = {}, [], []
+        for idx, preprocessed_file in enumerate(preprocessed_files):
+            example = self._build_example(
+                json.load(open(preprocessed_file, "r", encoding="utf-8"))
+            )
+            if idx == 0:
+                for k, v in example.items():
+                    if isinstance(v, np.ndarray) and k != "el_pairs_blk":
+                        arrays[k] = np.lib.format.open_memmap(
+                            os.path.join(tmp_path, f"{k}.npy"), mode="w+", dtype=v.dtype, shape=(num_examples,) + v.shape
+                        )
+            for k, array in arrays.items():
+                array[idx] = example[k]
+            image_paths.append(example["image_path"])
+            el_pairs_blk.append(example["el_pairs_blk"])
+
+        for array in arrays.values():
+            array.flush()
+        np.save(os.path.join(tmp_path, "image_path.npy"), np.array(image_paths, dtype=str))
+        np.save(os.path.join(tmp_path, "el_pairs_blk.npy"),
+                np.concatenate(el_pairs_blk + [np.zeros((0, 2), dtype=np.int64)]))
+        np.save(os.path.join(tmp_path, "el_pairs_blk_offsets.npy"),
+                np.cumsum([0] + [len(pairs) for pairs in el_pairs_blk], dtype=np.int64))
+        try:
+            os.rename(tmp_path, cache_path)
+        except OSError:
+            # compiled by another process in the meantime
+            shutil.rmtree(tmp_path)
+        print(f"Compiled {num_examples} examples into {cache_path} in {time.time() - start_time:.1f}s", flush=True)
+
     def __len__(self):
+        if self.cache is not None:
+            return len(self.cache["image_path"])
         return len(self.examples)
 
+    def _get_cached_example(self, idx):
+        # the slices are copied (the image by the float32 conversion), since the mappings are read-only
+        return_dict = {}
+        for k, array in self.cache.items():
+            if k not in ["image", "image_path", "el_pairs_blk", "el_pairs_blk_offsets"]:
+                return_dict[k] = np.array(array[idx])
+        return_dict["image"] = self.cache["image"][idx]
+        return_dict["image_path"] = str(self.cache["image_path"][idx])
+        start, end = self.cache["el_pairs_blk_offsets"][idx:idx + 2]
+        return_dict["el_pairs_blk"] = np.array(self.cache["el_pairs_blk"][start:end])
+        return_dict["el_num_pairs_blk"] = int(end - start)
+        return return_dict
+
     def _getitem_geo(self, idx):
-        json_obj = self.examples[idx]
+        if self.cache is not None:
+            return_dict = self._get_cached_example(idx)
+        else:
+            return_dict = self._build_example(self.examples[idx])
+        return_dict["image"] = return_dict["image"].astype("float32")
+
+        for k in return_dict.keys():
+            if isinstance(return_dict[k], np.ndarray):
+                return_dict[k] = torch.from_numpy(return_dict[k])
+
+        return return_dict
+
+    def _build_example(self, json_obj):
         return_dict = {}
 
         width = json_obj["meta"]["imageSize"]["width"]
@@ -96,7 +205,7 @@ class VIEDataset(Dataset):
         img_path = os.path.join(self.dataset_root_path, json_obj["meta"]["image_path"])
 
         image = cv2.resize(cv2.imread(img_path, 1), (self.img_w, self.img_h))
-        image = image.astype("float32").transpose(2, 0, 1)
+        image = image.transpose(2, 0, 1)  # uint8, converted to float32 by _getitem_geo
 
         return_dict["image_path"] = img_path
         return_dict["image"] = image
@@ -113,10 +222,6 @@ class VIEDataset(Dataset):
 
         return_dict["are_box_first_tokens"] = np.zeros(self.max_seq_length, dtype=np.bool_)
         return_dict["bio_labels"] = np.zeros(self.max_seq_length, dtype=int)
-        return_dict["el_labels_seq"] = np.zeros((self.max_seq_length, self.max_seq_length), dtype=np.float32)
-        return_dict["el_label_seq_mask"] = np.zeros((self.max_seq_length, self.max_seq_length), dtype=np.float32)
-        return_dict["el_labels_blk"] = np.zeros((self.max_block_num, self.max_block_num), dtype=np.float32)
-        return_dict["el_label_blk_mask"] = np.zeros((self.max_block_num, self.max_block_num), dtype=np.float32)
 
         list_tokens = []
         list_bbs = [] # word boxes
@@ -280,9 +385,14 @@ class VIEDataset(Dataset):
                             ]
         return_dict["bio_labels"][0] = -100
         return_dict["bio_labels"][len_list_tokens:] = -100
-        # Label for linking
+        # Label for linking, as sparse (to, from) pairs of blocks (the blocks starting at the first tokens of the words),
+        # densified on the device by densify_el_labels
         relations = json_obj["parse"]["relations"]
+        token_to_blocks = {}
+        for blk_idx, first_token_idx in enumerate(first_token_idx_list):
+            token_to_blocks.setdefault(first_token_idx, []).append(blk_idx)
 
+        el_pairs_blk = set()
         for relation in relations:
             if relation[0] >= len(box2token_span_map) or relation[1] >= len(box2token_span_map):
                 continue
@@ -294,16 +404,11 @@ class VIEDataset(Dataset):
 
             word_from = box2token_span_map[relation[0]][0]
             word_to = box2token_span_map[relation[1]][0]
-            return_dict["el_labels_seq"][word_to][word_from] = 1.0
-        return_dict["el_label_seq_mask"][1:len_list_tokens, 1:len_list_tokens] = 1.0
-        B_idx_all = np.array(first_token_idx_list)
-        return_dict["el_labels_blk"][:len(first_token_idx_list), :len(first_token_idx_list)] = \
-            return_dict["el_labels_seq"][B_idx_all[:, np.newaxis], B_idx_all[np.newaxis, :]]
-        return_dict["el_label_blk_mask"][:len_blocks, :len_blocks] = 1.0
-
-        for k in return_dict.keys():
-            if isinstance(return_dict[k], np.ndarray):
-                return_dict[k] = torch.from_numpy(return_dict[k])
+            for blk_to in token_to_blocks.get(word_to, []):
+                for blk_from in token_to_blocks.get(word_from, []):
+                    el_pairs_blk.add((blk_to, blk_from))
+        return_dict["el_pairs_blk"] = np.array(sorted(el_pairs_blk), dtype=np.int64).reshape(-1, 2)
+        return_dict["el_num_pairs_blk"] = len(el_pairs_blk)
 
         return return_dict
 
@@ -314,3 +419,38 @@ class VIEDataset(Dataset):
             raise ValueError(f"Unknown self.model_head={self.model_head}")
 
         return return_dict
+
+
+def collate_fn(examples):
+    """
+    default_collate, except for the relation pairs of the examples, which are concatenated with the index of their
+    example: el_pairs_blk is a [num_pairs, 3] tensor of (example, block_to, block_from), and el_num_pairs_blk [batch_size]
+    the number of pairs of every example.
+    """
+    el_pairs_blk = torch.cat(
+        [
+            torch.cat([torch.full((len(example["el_pairs_blk"]), 1), example_idx, dtype=torch.long),
+                       example["el_pairs_blk"]], dim=1)
+            for example_idx, example in enumerate(examples)
+        ]
+    )
+    batch = default_collate(
+        [{k: v for k, v in example.items() if k != "el_pairs_blk"} for example in examples]
+    )
+    batch["el_pairs_blk"] = el_pairs_blk
+    return batch
+
+
+def densify_el_labels(batch):
+    """
+    Add the dense block linking labels and their mask (float, [batch_size, max_block_num, max_block_num]) to a
+    collated batch, on the device of the batch: el_labels_blk[example, block_to, block_from] = 1 for every relation,
+    and el_label_blk_mask = 1 for the pairs of valid blocks.
+    """
+    block_mask = batch["block_mask"].float()
+    el_pairs_blk = batch["el_pairs_blk"].to(block_mask.device)
+    el_labels_blk = block_mask.new_zeros(block_mask.shape + block_mask.shape[1:])
+    el_labels_blk[el_pairs_blk[:, 0], el_pairs_blk[:, 1], el_pairs_blk[:, 2]] = 1.0
+    batch["el_labels_blk"] = el_labels_blk
+    batch["el_label_blk_mask"] = block_mask[:, :, None] * block_mask[:, None, :]
+    return batch
@@ -5,6 +5,7 @@ from __future__ import print_function
 import _init_paths
 
 import os
+import time
 from tqdm import tqdm
 
 import cv2
@@ -62,8 +63,10 @@ def demo(opt):
   if not os.path.exists(opt.demo_dir):
     os.makedirs(opt.demo_dir)
 
+  tot_time = 0
   for i in tqdm(range(len(image_names))):
       image_name = image_names[i]
+      start_time = time.time()
       if not opt.wiz_detect:
         image_anno = image_annos[i]
         ret = detector.run(opt, image_name, image_anno)
@@ -72,6 +75,10 @@ def demo(opt):
         #print(image_name)
       
         ret = detector.run(opt, image_name)
+      tot_time += time.time() - start_time
+
+  if len(image_names) > 0:
+    print('average latency on {}: {:.3f}s per image ({} images)'.format(opt.device, tot_time / len(image_names), len(image_names)))
 
 
 if __name__ == '__main__':
@@ -14,12 +14,25 @@ from utils.image import get_affine_transform, get_affine_transform_upper_left
 
 from utils.debugger import Debugger
 
+def set_cpu_threads(opt):
+  # intra-op (num_threads) and inter-op (num_interop_threads) parallelism of CPU inference, 0 keeps the PyTorch default
+  if opt.num_threads > 0:
+    torch.set_num_threads(opt.num_threads)
+  if opt.num_interop_threads > 0:
+    try:
+      torch.set_num_interop_threads(opt.num_interop_threads)
+    except RuntimeError:  # can only be set once, before any inter-op parallel work has started
+      print('The number of inter-op threads has already been set, keep {}.'.format(torch.get_num_interop_threads()))
+
 class BaseDetector(object):
   def __init__(self, opt):
-    if opt.gpus[0] >= 0:
+    if opt.gpus[0] >= 0 and torch.cuda.is_available():
       opt.device = torch.device('cuda')
     else:
+      if opt.gpus[0] >= 0:
+        print('CUDA is not available, running on CPU.')
       opt.device = torch.device('cpu')
+      set_cpu_threads(opt)
 
     self.model = create_model(opt.arch, opt.heads, opt.head_conv)
     self.model = load_model(self.model, opt.load_model)
@@ -28,7 +41,7 @@ class BaseDetector(object):
 
     self.processor = Processor(opt)
     self.processor = load_model(self.processor, opt.load_processor)
-    self.processor.cuda()
+    self.processor = self.processor.to(opt.device)
 
     self.mean = np.array(opt.mean, dtype=np.float32).reshape(1, 1, 3)
     self.std = np.array(opt.std, dtype=np.float32).reshape(1, 1, 3)
@@ -125,7 +138,7 @@ class BaseDetector(object):
       #print('Error: Number of Detected Boxes Exceed the Model Defaults.')
       #quit()
 
-    return torch.Tensor(slct_logi).cuda(), torch.Tensor(slct_dets).cuda()
+    return torch.Tensor(slct_logi).to(self.opt.device), torch.Tensor(slct_dets).to(self.opt.device)
 
   def process_logi(self, logi):
     logi_floor = logi.floor()
@@ -136,10 +149,15 @@ class BaseDetector(object):
 
   def _normalized_ps(self, ps, vocab_size):
     ps = torch.round(ps).to(torch.int64)
-    ps = torch.where(ps < vocab_size, ps, (vocab_size-1) * torch.ones(ps.shape).to(torch.int64).cuda())
-    ps = torch.where(ps >= 0, ps, torch.zeros(ps.shape).to(torch.int64).cuda())
+    ps = torch.where(ps < vocab_size, ps, (vocab_size-1) * torch.ones(ps.shape).to(torch.int64).to(self.opt.device))
+    ps = torch.where(ps >= 0, ps, torch.zeros(ps.shape).to(torch.int64).to(self.opt.device))
     return ps
 
+  def synchronize(self):
+    # timing fence, only needed when kernels run asynchronously on the GPU
+    if self.opt.device.type == 'cuda':
+      torch.cuda.synchronize()
+
   def resize(self,image):
     h,w,_ = image.shape
     scale = 1024/(max(w,h)+1e-4)
@@ -214,7 +232,7 @@ class BaseDetector(object):
         
       images = images.to(self.opt.device)
      
-      torch.cuda.synchronize()
+      self.synchronize()
 
       if self.opt.wiz_detect:
         outputs, output, dets, corner_st_reg, forward_time, logi, cr, keep = self.process(images, image, return_time=True)
@@ -223,13 +241,13 @@ class BaseDetector(object):
 
       raw_dets = dets
 
-      torch.cuda.synchronize()
+      self.synchronize()
       
       if self.opt.debug >= 2:
         self.debug(debugger, images, dets, output, scale)
 
       dets,corner_st_reg = self.post_process(dets, meta, corner_st_reg, scale)
-      torch.cuda.synchronize()
+      self.synchronize()
 
       detections.append(dets)
       hm.append(keep)
@@ -238,7 +256,7 @@ class BaseDetector(object):
       logi = logi + cr
 
     results = self.merge_outputs(detections)
-    torch.cuda.synchronize()
+    self.synchronize()
   
     slct_logi, slct_dets = self.filter(image_or_path_or_tensor, results, logi, raw_dets[:,:,:8])
     slct_dets = self._normalized_ps(slct_dets, 256)
@@ -53,18 +53,18 @@ class CtdetDetector(BaseDetector):
         
       else:
         print('This results is generated from ground truth detection boxes.')
-        hm = torch.Tensor(batch['hm']).unsqueeze(0).cuda()
+        hm = torch.Tensor(batch['hm']).unsqueeze(0).to(self.opt.device)
 
         wh_ind = torch.tensor(batch['hm_ind']).expand(output['wh'].size(0), output['wh'].size(1), len(batch['hm_ind']))
         batchwh = torch.Tensor(batch['wh']).transpose(0,1).unsqueeze(0)
         wh = torch.zeros(size = output['wh'].size()).view(output['wh'].size(0), output['wh'].size(1), -1).scatter(2, wh_ind, batchwh)
-        wh = wh.view(output['wh'].size(0), output['wh'].size(1), output['wh'].size(2), output['wh'].size(3)).cuda()
+        wh = wh.view(output['wh'].size(0), output['wh'].size(1), output['wh'].size(2), output['wh'].size(3)).to(self.opt.device)
         #wh = wh + 2 * torch.rand(size = wh.shape).cuda()
 
         reg_ind = torch.tensor(batch['reg_ind']).expand(output['reg'].size(0), output['reg'].size(1), len(batch['reg_ind']))
         batchreg = torch.Tensor(batch['reg']).transpose(0,1).unsqueeze(0)
         reg = torch.zeros(size = output['reg'].size()).view(output['reg'].size(0), output['reg'].size(1), -1).scatter(2, reg_ind, batchreg)
-        reg = reg.view(output['reg'].size(0), output['reg'].size(1), output['reg'].size(2), output['reg'].size(3)).cuda()
+        reg = reg.view(output['reg'].size(0), output['reg'].size(1), output['reg'].size(2), output['reg'].size(3)).to(self.opt.device)
       
       st = output['st']
       ax = output['ax']
@@ -75,7 +75,7 @@ class CtdetDetector(BaseDetector):
         wh = (wh[0:1] + flip_tensor(wh[1:2])) / 2
         reg = reg[0:1] if reg is not None else None
 
-      torch.cuda.synchronize()
+      self.synchronize()
       forward_time = time.time()
 
       #return dets [bboxes, scores, clses]
@@ -0,0 +1,54 @@
+# micro-benchmark of the candidate-pruned polygon NMS against the dense reference
+# usage: python benchmark_pnms.py [--sizes 100,500,3000] [--repeat 3]
+import argparse
+import time
+
+import numpy as np
+
+from shapelyNMS import pnms, pnms_dense
+
+
+def random_cells(k, size=1024, seed=0):
+    # k table cells on a jittered grid (clockwise from top-left), with a few duplicated cells
+    rng = np.random.RandomState(seed)
+    cols = int(np.ceil(np.sqrt(k)))
+    step = size / cols
+    idx = np.arange(k)
+    x0 = (idx % cols) * step + rng.uniform(-2, 2, k)
+    y0 = (idx // cols) * step + rng.uniform(-2, 2, k)
+    w = step * rng.uniform(0.8, 1.2, k)
+    h = step * rng.uniform(0.8, 1.2, k)
+    quads = np.stack([x0, y0, x0 + w, y0, x0 + w, y0 + h, x0, y0 + h], axis=1)
+    dup = rng.rand(k) < 0.1
+    quads[dup] = quads[np.roll(np.arange(k), 1)[dup]] + rng.uniform(-3, 3, (dup.sum(), 8))
+    dets = np.zeros((k, 9), dtype=np.float32)
+    dets[:, :8] = quads
+    dets[:, 8] = rng.uniform(0, 1, k)
+    return dets
+
+
+def timeit(func, dets, repeat, thresh_min, thresh_conf):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(dets, thresh_min, thresh_conf)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=str, default='100,500,3000')
+    parser.add_argument('--thresh_min', type=float, default=0.5)
+    parser.add_argument('--thresh_conf', type=float, default=0.1)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print('{:>6} {:>12} {:>12} {:>9}'.format('K', 'dense (ms)', 'pruned (ms)', 'speedup'))
+    for k in [int(k) for k in args.sizes.split(',')]:
+        dets = random_cells(k)
+        dense_time, dense_result = timeit(pnms_dense, dets, args.repeat, args.thresh_min, args.thresh_conf)
+        pruned_time, pruned_result = timeit(pnms, dets, args.repeat, args.thresh_min, args.thresh_conf)
+        assert np.array_equal(dense_result, pruned_result), 'results differ at K={}'.format(k)
+        print('{:>6} {:>12.2f} {:>12.2f} {:>8.1f}x'.format(k, dense_time * 1e3, pruned_time * 1e3,
+                                                          dense_time / pruned_time))
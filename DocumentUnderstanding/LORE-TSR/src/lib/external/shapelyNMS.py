@@ -1,5 +1,10 @@
 import numpy as np
 from shapely.geometry import *
+from shapely.errors import TopologicalError
+try:
+    from shapely.errors import GEOSException  # shapely >= 2.0
+except ImportError:
+    GEOSException = TopologicalError
 
 def delet_min_first(dets,pts,areas,inter_areas,min_areas,scores,thresh_min,thresh_conf):
     choose_dict = {}
@@ -116,7 +121,54 @@ def cross_union(dets,pts,areas,inter_areas,min_areas,scores,thresh_min,thresh_co
     return np.array(keep)#dets
    
 
+def overlap_candidates(dets):
+    # pairs (i < j) whose axis-aligned bounding boxes overlap; all the other pairs have zero intersection area
+    xs = dets[:, 0:8:2]
+    ys = dets[:, 1:8:2]
+    minx, maxx = xs.min(axis=1), xs.max(axis=1)
+    miny, maxy = ys.min(axis=1), ys.max(axis=1)
+    overlap = (minx[:, None] < maxx[None, :]) & (maxx[:, None] > minx[None, :]) & \
+              (miny[:, None] < maxy[None, :]) & (maxy[:, None] > miny[None, :])
+    return np.nonzero(np.triu(overlap, 1))
+
+def cross_union_vectorized(dets,areas,inter_areas,scores,thresh_min):
+    # same decisions as cross_union, taken for all the pairs at once
+    areai = areas[:, None]
+    areaj = areas[None, :]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ovr_union = inter_areas / (areai + areaj - inter_areas)
+    pair = (ovr_union > thresh_min) & ~(scores[:, None] < scores[None, :])
+    np.fill_diagonal(pair, False)
+    larger = areai > areaj
+    choose = (pair & larger).any(axis=0) | (pair & ~larger).any(axis=1)
+    if choose.all():
+        return np.array([])
+    return dets[~choose]
+
 def pnms(dets,thresh_min,thresh_conf):
+    # only pairs with overlapping bounding boxes go through shapely, and each polygon is built once;
+    # the keep/suppress decisions are identical to those of pnms_dense
+    scores = dets[:,-1]
+
+    polys = []
+    for i in range(dets.shape[0]):
+        polys.append(Polygon([dets[i][0:2],dets[i][2:4],dets[i][4:6],dets[i][6:8]]))
+    areas = np.array([poly.area for poly in polys], dtype=np.float64).reshape(scores.shape)
+
+    inter_areas = np.zeros((scores.shape[0],scores.shape[0]))
+    for i, j in zip(*overlap_candidates(dets)):
+        try:
+            inS = polys[i].intersection(polys[j])
+        except (TopologicalError, GEOSException):
+            # invalid (e.g. self-intersecting) polygon: the pair is left with zero intersection
+            continue
+        inter_areas[i][j] = inS.area
+        inter_areas[j][i] = inS.area
+
+    return cross_union_vectorized(dets,areas,inter_areas,scores,thresh_min)
+
+def pnms_dense(dets,thresh_min,thresh_conf):
+    # reference implementation (shapely intersection for every pair), kept for benchmarking
     scores = dets[:,-1]
 
     pts = []
@@ -38,9 +38,10 @@ def _topk(scores, K=40):
       
     topk_scores, topk_inds = torch.topk(scores.view(batch, cat, -1), K)
 
-    topk_inds = topk_inds % (torch.Tensor([height]).to(torch.int64).cuda() * torch.Tensor([width]).to(torch.int64).cuda())
-    topk_ys   = (topk_inds / torch.Tensor([width]).cuda()).int().float()
-    topk_xs   = (topk_inds % torch.Tensor([width]).to(torch.int64).cuda()).int().float()
+    device = topk_inds.device
+    topk_inds = topk_inds % (torch.Tensor([height]).to(torch.int64).to(device) * torch.Tensor([width]).to(torch.int64).to(device))
+    topk_ys   = (topk_inds / torch.Tensor([width]).to(device)).int().float()
+    topk_xs   = (topk_inds % torch.Tensor([width]).to(torch.int64).to(device)).int().float()
       
     topk_score, topk_ind = torch.topk(topk_scores.view(batch, -1), K)
     topk_clses = (topk_ind // K).int()
@@ -277,8 +278,8 @@ def wireless_decode(heat, wh, ax, cr, reg=None, cat_spec_wh=False, K=100):
     return detections, keep, ax, cr_feat
 
 def find4ps(bbox, x, y):
-    xs = torch.Tensor([bbox[0],bbox[2],bbox[4],bbox[6]]).cuda()
-    ys = torch.Tensor([bbox[1],bbox[3],bbox[5],bbox[7]]).cuda()
+    xs = torch.Tensor([bbox[0],bbox[2],bbox[4],bbox[6]]).to(x.device)
+    ys = torch.Tensor([bbox[1],bbox[3],bbox[5],bbox[7]]).to(x.device)
 
     dx = xs - x
     dy = ys - y
@@ -58,8 +58,8 @@ def _get_4ps_feat(cc_match, output):
   dim = feat.size(2)
   cc_match = cc_match.unsqueeze(2).expand(cc_match.size(0), cc_match.size(1), dim, cc_match.size(2))
   if not(isinstance(output, dict)):
-    cc_match = torch.where(cc_match<feat.shape[1], cc_match, (feat.shape[0]-1)* torch.ones(cc_match.shape).to(torch.int64).cuda())
-    cc_match = torch.where(cc_match>=0, cc_match, torch.zeros(cc_match.shape).to(torch.int64).cuda())
+    cc_match = torch.where(cc_match<feat.shape[1], cc_match, (feat.shape[0]-1)* torch.ones(cc_match.shape).to(torch.int64).to(cc_match.device))
+    cc_match = torch.where(cc_match>=0, cc_match, torch.zeros(cc_match.shape).to(torch.int64).to(cc_match.device))
   feat = feat.gather(1, cc_match)
   return feat
 
@@ -79,8 +79,8 @@ def _get_wh_feat(ind, output, ttype):
 
 def _normalized_ps(ps, vocab_size):
   ps = torch.round(ps).to(torch.int64)
-  ps = torch.where(ps < vocab_size, ps, (vocab_size-1) * torch.ones(ps.shape).to(torch.int64).cuda())
-  ps = torch.where(ps >= 0, ps, torch.zeros(ps.shape).to(torch.int64).cuda())
+  ps = torch.where(ps < vocab_size, ps, (vocab_size-1) * torch.ones(ps.shape).to(torch.int64).to(ps.device))
+  ps = torch.where(ps >= 0, ps, torch.zeros(ps.shape).to(torch.int64).to(ps.device))
   return ps
 
 def _tranpose_and_gather_feat(feat, ind):
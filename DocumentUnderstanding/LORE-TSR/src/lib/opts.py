@@ -67,6 +67,10 @@ class opts(object):
                              help='dataloader threads. 0 for single-thread.')
     self.parser.add_argument('--not_cuda_benchmark', action='store_true',
                              help='disable when the input size is not fixed.')
+    self.parser.add_argument('--num_threads', type=int, default=0,
+                             help='intra-op threads for CPU inference. 0 for the PyTorch default.')
+    self.parser.add_argument('--num_interop_threads', type=int, default=0,
+                             help='inter-op threads for CPU inference. 0 for the PyTorch default.')
     self.parser.add_argument('--seed', type=int, default=317, 
                              help='random seed') # from CornerNet
 
@@ -1,32 +1,59 @@
 import os
+import glob
 import pickle
 import numpy as np
 import pdfplumber
 import argparse
+import importlib.util
+from multiprocessing import Pool
 from transformers import AutoTokenizer
 
+# load ditod/grid_store.py (numpy only) by its path: importing it through the ditod package would run
+# ditod/__init__.py, and with it detectron2 and the whole model stack, in the generator and every worker
+_spec = importlib.util.spec_from_file_location(
+    "grid_store", os.path.join(os.path.dirname(os.path.abspath(__file__)), "ditod", "grid_store.py"))
+grid_store = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(grid_store)
+write_grid, grid_path_of = grid_store.write_grid, grid_store.grid_path_of
 
-def return_word_grid(pdf_path):
+
+_pdf = None
+
+
+def _open_pdf_worker(pdf_path):
+    global _pdf
+    _pdf = pdfplumber.open(pdf_path)
+
+
+def _extract_page_words(page_number):
+    return _pdf.pages[page_number].extract_words()
+
+
+def return_word_grid(pdf_path, num_workers=1):
     """Return the word information from a PDF file using pdfplumber.
 
     Parameters
     ----------
     pdf_path : str
         The path to the input PDF file.
+    num_workers : int, optional
+        Number of processes extracting the words of the pages, by default 1
 
     Returns
     -------
     List
         Returns a list of shape (num_pages, num_words, 8)
     """
-    pdf = pdfplumber.open(pdf_path)
-
-    word_data = list()
-    for page in pdf.pages:
-        # extracts words and their bounding boxes
-        word_data.append(page.extract_words())
+    with pdfplumber.open(pdf_path) as pdf:
+        num_pages = len(pdf.pages)
+        if num_workers <= 1 or num_pages <= 1:
+            # extracts words and their bounding boxes
+            return [page.extract_words() for page in pdf.pages]
 
-    return word_data
+    # every process opens the PDF once and extracts the words of a share of the pages
+    with Pool(min(num_workers, num_pages), initializer=_open_pdf_worker, initargs=(pdf_path,)) as pool:
+        return pool.map(_extract_page_words, range(num_pages),
+                        chunksize=max(1, num_pages // (4 * num_workers)))
 
 
 def tokenize(tokenizer, text_body):
@@ -134,6 +161,51 @@ def create_grid_dict(tokenizer, page_data):
     return grid
 
 
+def create_document_grid(tokenizer, word_grid):
+    """Create the grids of all pages of a document, tokenizing the words
+    of all pages at once.
+
+    Parameters
+    ----------
+    tokenizer : HuggingFace Tokenizer
+        The tokenizer to be used.
+    word_grid : List
+        List of the word information from pdfplumber of every page.
+
+    Returns
+    -------
+    Tuple[List, List]
+        Returns the input_ids and the subword bounding boxes
+        (x, y, width, height) of every page.
+    """
+    texts = [ele["text"] for page_data in word_grid for ele in page_data]
+    word_boxes = np.array(
+        [(ele["x0"], ele["top"], ele["x1"] - ele["x0"], ele["bottom"] - ele["top"])
+         for page_data in word_grid for ele in page_data],
+        dtype=np.float64).reshape(-1, 4)
+    input_ids = tokenize(tokenizer, texts) if len(texts) > 0 else []
+
+    # as readjust_bbox_coords: the box of a word is split evenly
+    # between its subwords (words without subwords have no box)
+    lengths = np.array([len(ids) for ids in input_ids], dtype=np.int64)
+    word_idx = np.repeat(np.arange(len(texts)), lengths)
+    subword_idx = np.arange(len(word_idx)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    new_width = word_boxes[word_idx, 2] / lengths[word_idx]
+    bbox = np.stack([word_boxes[word_idx, 0] + subword_idx * new_width,
+                     word_boxes[word_idx, 1],
+                     new_width,
+                     word_boxes[word_idx, 3]], axis=1)
+    input_ids = np.array([_id for ids in input_ids for _id in ids], dtype=np.int64)
+
+    # split back into pages
+    page_num_words = [len(page_data) for page_data in word_grid]
+    word_offsets = np.concatenate([[0], np.cumsum(page_num_words)]).astype(np.int64)
+    subword_offsets = np.concatenate([[0], np.cumsum(lengths)])[word_offsets]
+    pages_input_ids = [input_ids[start:end] for start, end in zip(subword_offsets[:-1], subword_offsets[1:])]
+    pages_bbox = [bbox[start:end] for start, end in zip(subword_offsets[:-1], subword_offsets[1:])]
+    return pages_input_ids, pages_bbox
+
+
 def save_pkl_file(grid, output_dir, output_file, model="doclaynet"):
     """Save the grid dictionary as a pickle file.
 
@@ -166,6 +238,26 @@ def save_pkl_file(grid, output_dir, output_file, model="doclaynet"):
         pickle.dump(grid, handle)
 
 
+def convert_pkl_file(pkl_path):
+    """Convert a grid pickle file into a (single page) grid file
+    next to it, which is then read instead of the pickle file.
+
+    Parameters
+    ----------
+    pkl_path : str
+        The path to the grid pickle file.
+
+    Returns
+    -------
+    None
+    """
+    with open(pkl_path, "rb") as f:
+        sample_inputs = pickle.load(f)
+    write_grid(grid_path_of(pkl_path),
+               [sample_inputs["input_ids"]],
+               [sample_inputs["bbox_subword_list"]])
+
+
 def select_tokenizer(tokenizer):
     """Select the tokenizer to be used.
 
@@ -185,7 +277,7 @@ def select_tokenizer(tokenizer):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--pdf",
-                        required=True,
+                        required=False,
                         help="Path to the PDF file")
     parser.add_argument("--output",
                         required=False,
@@ -199,17 +291,44 @@ if __name__ == "__main__":
                         required=False,
                         default="doclaynet",
                         help="VGT fine-tuned model to use")
+    parser.add_argument("--format",
+                        required=False,
+                        default="grid",
+                        choices=["grid", "pkl"],
+                        help="One grid file for the document, or one pkl file per page")
+    parser.add_argument("--num_workers",
+                        required=False,
+                        type=int,
+                        default=os.cpu_count(),
+                        help="Number of processes")
+    parser.add_argument("--pkl_dir",
+                        required=False,
+                        help="Convert all grid pkl files of this folder into grid files")
 
     args = parser.parse_args()
+    if args.pdf is None and args.pkl_dir is None:
+        parser.error("--pdf or --pkl_dir is required")
+
+    if args.pkl_dir is not None:
+        pkl_files = sorted(glob.glob(os.path.join(args.pkl_dir, "*.pkl")))
+        with Pool(args.num_workers) as pool:
+            pool.map(convert_pkl_file, pkl_files, chunksize=64)
+        print(f"Converted {len(pkl_files)} pkl files in {args.pkl_dir}")
+
+    if args.pdf is not None:
+        # Create the output folder if it doesn't exist
+        if not os.path.exists(args.output):
+            os.makedirs(args.output)
+
+        word_grid = return_word_grid(args.pdf, args.num_workers)
+        tokenizer = select_tokenizer(args.tokenizer)
+
+        if args.format == "grid":
+            pages_input_ids, pages_bbox = create_document_grid(tokenizer, word_grid)
+            pdf_name = os.path.splitext(os.path.basename(args.pdf))[0]
+            write_grid(os.path.join(args.output, f"{pdf_name}.grid"), pages_input_ids, pages_bbox)
+        else:
+            for page in range(len(word_grid)):
 
-    # Create the output folder if it doesn't exist
-    if not os.path.exists(args.output):
-        os.makedirs(args.output)
-
-    word_grid = return_word_grid(args.pdf)
-    tokenizer = select_tokenizer(args.tokenizer)
-
-    for page in range(len(word_grid)):
-
-        grid = create_grid_dict(tokenizer, word_grid[page])
-        save_pkl_file(grid, args.output, f"page_{page}", page, args.model)
+                grid = create_grid_dict(tokenizer, word_grid[page])
+                save_pkl_file(grid, args.output, f"page_{page}", args.model)
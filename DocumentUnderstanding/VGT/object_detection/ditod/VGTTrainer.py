@@ -14,13 +14,15 @@ import logging
 import os
 import sys
 import weakref
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 import torch
 from fvcore.nn.precise_bn import get_bn_modules
 from omegaconf import OmegaConf
 from torch.nn.parallel import DistributedDataParallel
 import numpy as np
+import cv2
 
 import detectron2.data.transforms as T
 from detectron2.checkpoint import DetectionCheckpointer
@@ -53,9 +55,9 @@ from typing import Any, Dict, List, Set
 import itertools
 from detectron2.solver.build import maybe_add_gradient_clipping
 from .dataset_mapper import DetrDatasetMapper
+from .grid_store import load_grid, transform_grid_boxes
 from detectron2.evaluation import COCOEvaluator
 
-import pickle
 from detectron2.data import detection_utils as utils
 from detectron2.structures import (
     BitMasks,
@@ -322,10 +324,12 @@ class DefaultPredictor:
         self.input_format = cfg.INPUT.FORMAT
         assert self.input_format in ["RGB", "BGR"], self.input_format
 
-    def __call__(self, original_image, grid_path):
+    def __call__(self, original_image, grid_path, page=0):
         """
         Args:
             original_image (np.ndarray): an image of shape (H, W, C) (in BGR order).
+            grid_path (str): the grid file of the document (see `grid_store.py`), or the grid pkl of the image.
+            page (int): the page of the image in the grid file.
 
         Returns:
             predictions (dict):
@@ -333,43 +337,99 @@ class DefaultPredictor:
                 See :doc:`/tutorials/models` for details about the format.
         """
         with torch.no_grad():  # https://github.com/sphinx-doc/sphinx/issues/4258
-            # Apply pre-processing to image.
-            
-            # if self.input_format == "RGB":
-            #     # whether the model expects BGR inputs or RGB
-            #     import ipdb;ipdb.set_trace() 
-            #     original_image = original_image[:, :, ::-1]
-            
-            height, width = original_image.shape[:2]
-            image, transforms = T.apply_transform_gens([self.aug], original_image)
-            
-            # add grid    
-            image_shape = image.shape[:2]  # h, w
-            image = torch.as_tensor(image.astype("float32").transpose(2, 0, 1))
-            
-            with open(grid_path, "rb") as f:
-                sample_inputs = pickle.load(f)
-            input_ids = sample_inputs["input_ids"]
-            bbox_subword_list = sample_inputs["bbox_subword_list"]
-                
-            # word bbox
-            bbox = []
-            for bbox_per_subword in bbox_subword_list:
-                text_word = {}
-                text_word['bbox'] = bbox_per_subword.tolist()
-                text_word['bbox_mode'] = BoxMode.XYWH_ABS
-                utils.transform_instance_annotations(text_word, transforms, image_shape)
-                bbox.append(text_word['bbox'])
-                
-            dataset_dict = {}
-            dataset_dict["input_ids"] = input_ids 
-            dataset_dict["bbox"] = bbox
-            dataset_dict["image"] = image 
-            dataset_dict["height"] = height 
-            dataset_dict["width"] = width 
+            dataset_dict = self.prepare_inputs(original_image, grid_path, page)
 
             predictions = self.model([dataset_dict])[0]
             return predictions
+
+    def prepare_inputs(self, original_image, grid_path, page=0):
+        """
+        Resize the image and transform the grid of one page, as the model input.
+
+        Args:
+            original_image (np.ndarray or str): an image of shape (H, W, C) (in BGR order), or its path.
+            grid_path, page: see :meth:`__call__`.
+
+        Returns:
+            dict: the input of the model for one image.
+        """
+        if isinstance(original_image, str):
+            original_image = cv2.imread(original_image)
+
+        # Apply pre-processing to image.
+
+        # if self.input_format == "RGB":
+        #     # whether the model expects BGR inputs or RGB
+        #     import ipdb;ipdb.set_trace() 
+        #     original_image = original_image[:, :, ::-1]
+
+        height, width = original_image.shape[:2]
+        image, transforms = T.apply_transform_gens([self.aug], original_image)
+
+        # add grid    
+        image_shape = image.shape[:2]  # h, w
+        image = torch.as_tensor(image.astype("float32").transpose(2, 0, 1))
+
+        input_ids, bbox_subword_list = load_grid(grid_path, page)
+
+        # word bbox
+        bbox = transform_grid_boxes(bbox_subword_list, transforms, image_shape)
+
+        dataset_dict = {}
+        dataset_dict["input_ids"] = input_ids 
+        dataset_dict["bbox"] = bbox
+        dataset_dict["image"] = image 
+        dataset_dict["height"] = height 
+        dataset_dict["width"] = width 
+        return dataset_dict
+
+    def predict_batch(self, pages, batch_size=4, num_workers=4):
+        """
+        Run the model on many pages, e.g. all pages of a document.
+
+        The images are read and resized, and their grids are prepared, by `num_workers` threads ahead of the model.
+        Pages of the same orientation (landscape or portrait, as in detectron2's `AspectRatioGroupedDataset`) are
+        batched together, so that the images of a batch are padded little, with up to `batch_size` pages per forward pass.
+
+        Args:
+            pages (iterable[tuple]): (original_image, grid_path, page) of every page, see :meth:`prepare_inputs`.
+            batch_size (int): maximal number of pages per forward pass.
+            num_workers (int): number of threads preparing the inputs.
+
+        Yields:
+            (int, dict): the index of a page in `pages` and its predictions (see :meth:`__call__`), as soon as
+                they are computed. The pages of a batch are yielded together, hence not always in order.
+        """
+        buckets = {False: [], True: []}  # portrait, landscape
+
+        def run(bucket):
+            with torch.no_grad():
+                predictions = self.model([dataset_dict for _, dataset_dict in bucket])
+            results = [(index, prediction) for (index, _), prediction in zip(bucket, predictions)]
+            bucket.clear()
+            return results
+
+        def add(index, future):
+            dataset_dict = future.result()
+            _, h, w = dataset_dict["image"].shape
+            bucket = buckets[w > h]
+            bucket.append((index, dataset_dict))
+            return run(bucket) if len(bucket) == batch_size else []
+
+        # at most `prefetch` prepared pages wait for the model
+        prefetch = max(2 * batch_size, num_workers)
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            for index, (original_image, grid_path, page) in enumerate(pages):
+                pending.append((index, executor.submit(self.prepare_inputs, original_image, grid_path, page)))
+                if len(pending) >= prefetch:
+                    yield from add(*pending.popleft())
+            while len(pending) > 0:
+                yield from add(*pending.popleft())
+
+        for bucket in buckets.values():
+            if len(bucket) > 0:
+                yield from run(bucket)
         
 
 class VGTTrainer(TrainerBase):
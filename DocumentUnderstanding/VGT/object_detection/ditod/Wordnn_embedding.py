@@ -53,6 +53,64 @@ class WordnnEmbedding(nn.Module):
             self.embedding = nn.Embedding.from_pretrained(word_embs)
             print("use_pretrain_weight: load model from:", bros_embedding_path)
         
+    def get_projected_embedding(self):
+        """The embedding table projected to embedding_dim, transposed: [embedding_dim x vocab_size].
+
+        Looking up the columns of this table equals the embedding followed by the (linear) projection, without materializing the
+        hidden_size-channel map. It is recomputed at every training step and cached at inference, until the weights change.
+        """
+        if self.training or torch.is_grad_enabled():
+            self._projected_embedding = None
+            return self.embedding_proj.weight @ self.embedding.weight.t()
+
+        weights = (self.embedding.weight, self.embedding_proj.weight)
+        version = tuple((w.data_ptr(), w._version, w.device, w.dtype) for w in weights)
+        if getattr(self, "_projected_embedding", None) is None or self._projected_embedding_version != version:
+            self._projected_embedding = self.embedding_proj.weight @ self.embedding.weight.t()
+            self._projected_embedding_version = version
+        return self._projected_embedding
+
+    def build_chargrid(self, batched_inputs, batch_b, grid_h, grid_w, stride=1):
+        """ Paint the subword ids into their (rounded) boxes on a CPU grid, later boxes overwriting earlier ones.
+        Returns:
+            np.ndarray: int64 in shape of [B x H x W], 0 outside the boxes.
+        """
+        chargrid_map = np.zeros((batch_b, grid_h * grid_w), dtype=np.int64)
+
+        for iter_b in range(batch_b):
+            per_input_ids = batched_inputs[iter_b]["input_ids"]
+            per_input_bbox = batched_inputs[iter_b]["bbox"]
+
+            short_length_w = min(len(per_input_ids), len(per_input_bbox))
+            if short_length_w == 0:
+                continue
+
+            boxes = (np.asarray(per_input_bbox[:short_length_w], dtype=np.float64).reshape(-1, 4) / stride).round().astype(int)
+            # the box edges are clipped like the slices chargrid[h_start:h_end, w_start:w_end]
+            w_start, w_end = _slice_bounds(boxes[:, 0], grid_w), _slice_bounds(boxes[:, 2], grid_w)
+            h_start, h_end = _slice_bounds(boxes[:, 1], grid_h), _slice_bounds(boxes[:, 3], grid_h)
+            box_w = np.maximum(w_end - w_start, 0)
+            box_h = np.maximum(h_end - h_start, 0)
+            areas = box_w * box_h
+            if areas.sum() == 0:
+                continue
+
+            # flat pixel indices of all boxes, in box order
+            box_idx = np.repeat(np.arange(short_length_w), areas)
+            pixel_idx = np.arange(len(box_idx)) - np.repeat(np.cumsum(areas) - areas, areas)
+            pixel_w = box_w[box_idx]
+            flat_idx = (h_start[box_idx] + pixel_idx // pixel_w) * grid_w + w_start[box_idx] + pixel_idx % pixel_w
+
+            # the last box covering a pixel wins
+            flat_idx, last = np.unique(flat_idx[::-1], return_index=True)
+            if self.use_UNK_text:
+                chargrid_map[iter_b, flat_idx] = 100
+            else:
+                per_ids = np.asarray(per_input_ids[:short_length_w], dtype=np.int64)
+                chargrid_map[iter_b, flat_idx] = per_ids[box_idx[::-1][last]]
+
+        return chargrid_map.reshape(batch_b, grid_h, grid_w)
+
     def forward(self, img, batched_inputs, stride = 1):
         """ Forward computation
         Args:
@@ -64,29 +122,19 @@ class WordnnEmbedding(nn.Module):
         device = img.device
         batch_b, _, batch_h, batch_w = img.size()
 
-        chargrid_map = torch.zeros((batch_b, batch_h // stride, batch_w // stride ), dtype=torch.int64).to(device)
-        
-        for iter_b in range(batch_b):
-            per_input_ids = batched_inputs[iter_b]["input_ids"]   
-            per_input_bbox = batched_inputs[iter_b]["bbox"]
-            
-            short_length_w = min(len(per_input_ids), len(per_input_bbox)) 
-            
-            if short_length_w > 0 : 
-                for word_idx in range(short_length_w): 
-                    per_id = per_input_ids[word_idx]
-                    
-                    bbox = per_input_bbox[word_idx] / stride
-                    w_start, h_start, w_end, h_end = bbox.round().astype(int).tolist()
-                            
-                    if self.use_UNK_text:
-                        chargrid_map[iter_b, h_start:h_end, w_start: w_end] = 100
-                    else:
-                        chargrid_map[iter_b, h_start:h_end, w_start: w_end] = per_id
-
-        chargrid_map = self.embedding(chargrid_map)
-        chargrid_map = self.embedding_proj(chargrid_map)
-        
-        return chargrid_map.permute(0, 3, 1, 2).contiguous()
-        
-    
\ No newline at end of file
+        chargrid_map = self.build_chargrid(batched_inputs, batch_b, batch_h // stride, batch_w // stride, stride)
+        chargrid_map_size = chargrid_map.shape
+        chargrid_map = torch.from_numpy(chargrid_map).to(device, non_blocking=True)
+
+        # gathered directly in the channel-first layout, [D x B*H*W] -> [B x D x H x W]
+        projected_embedding = self.get_projected_embedding()
+        chargrid_map = projected_embedding.index_select(1, chargrid_map.view(-1))
+        chargrid_map = chargrid_map.view(-1, *chargrid_map_size)
+
+        return chargrid_map.transpose(0, 1).contiguous()
+
+
+def _slice_bounds(index, size):
+    """Bounds of python slices on an axis of length size (negative indices count from the end)."""
+    index = np.where(index < 0, index + size, index)
+    return np.clip(index, 0, size)
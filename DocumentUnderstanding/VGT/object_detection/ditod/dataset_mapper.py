@@ -12,7 +12,6 @@ from detectron2.data import detection_utils as utils
 from detectron2.data import transforms as T
 
 import json
-import pickle
 
 from detectron2.structures import (
     BitMasks,
@@ -25,6 +24,8 @@ from detectron2.structures import (
     polygons_to_bitmask,
 )
 
+from .grid_store import load_grid, transform_grid_boxes
+
 __all__ = ["DetrDatasetMapper"]
 
 
@@ -136,31 +137,19 @@ class DetrDatasetMapper:
                 if name[-2] == 'val':
                     name[-2] = 'dev'
                 pdf_name = '/'.join(['/VGT_publaynet_grid_pkl'] + name[-2:])
-                with open((root + pdf_name + '.pdf.pkl'), "rb") as f:
-                    sample_inputs = pickle.load(f)
-                input_ids = sample_inputs["input_ids"]
-                bbox_subword_list = sample_inputs["bbox_subword_list"]
+                input_ids, bbox_subword_list = load_grid(root + pdf_name + '.pdf.pkl')
             elif 'DocBank' in name:
                 root = '/'.join(name[:-2])
                 pdf_name = '/'.join(['/VGT_docbank_grid_pkl'] + name[-1:])
-                with open((root + pdf_name + '.pkl'), "rb") as f:
-                    sample_inputs = pickle.load(f)
-                input_ids = sample_inputs["input_ids"]
-                bbox_subword_list = sample_inputs["bbox_subword_list"]
+                input_ids, bbox_subword_list = load_grid(root + pdf_name + '.pkl')
             elif 'D4LA' in name:
                 root = '/'.join(name[:-2])
                 pdf_name = '/'.join(['/VGT_D4LA_grid_pkl'] + name[-1:])
-                with open((root + pdf_name + '.pkl'), "rb") as f:
-                    sample_inputs = pickle.load(f)
-                input_ids = sample_inputs["input_ids"]
-                bbox_subword_list = sample_inputs["bbox_subword_list"]
+                input_ids, bbox_subword_list = load_grid(root + pdf_name + '.pkl')
             elif 'DocLayNet' in name:
                 root = '/'.join(name[:-2])
                 pdf_name = '/'.join(['/VGT_DocLayNet_grid_pkl'] + name[-1:])
-                with open((root + pdf_name + '.pdf.pkl'), "rb") as f:
-                    sample_inputs = pickle.load(f)
-                input_ids = sample_inputs["input_ids"]
-                bbox_subword_list = sample_inputs["bbox_subword_list"]
+                input_ids, bbox_subword_list = load_grid(root + pdf_name + '.pdf.pkl')
             else:
                 input_ids = []
                 bbox_subword_list = []
@@ -196,14 +185,8 @@ class DetrDatasetMapper:
         dataset_dict["image"] = torch.as_tensor(np.ascontiguousarray(image.transpose(2, 0, 1)))
         
         ## 产出 text grid 
-        bbox = []
-        for bbox_per_subword in bbox_subword_list:
-            text_word = {}
-            text_word['bbox'] = bbox_per_subword.tolist()
-            text_word['bbox_mode'] = BoxMode.XYWH_ABS
-            utils.transform_instance_annotations(text_word, transforms, image_shape)
-            bbox.append(text_word['bbox'])
-                
+        bbox = transform_grid_boxes(bbox_subword_list, transforms, image_shape)
+
         dataset_dict["input_ids"] = input_ids 
         dataset_dict["bbox"] = bbox
 
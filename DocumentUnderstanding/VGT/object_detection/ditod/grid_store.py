@@ -0,0 +1,122 @@
+"""
+Columnar grid files of VGT: the subword ids and boxes of all pages of a document in one memory-mappable file.
+
+Layout (little-endian):
+    header        b"VGTGRID1", num_pages (int64), num_subwords (int64)
+    page_offsets  int64[num_pages + 1], the subwords of page i are [page_offsets[i], page_offsets[i + 1])
+    input_ids     int32[num_subwords]
+    bbox          float32[num_subwords, 4], XYWH in the coordinates of the page image (as "bbox_subword_list")
+
+This module depends on numpy only: create_grid_input.py loads it by its path, without the ditod package.
+"""
+
+import os
+import pickle
+from functools import lru_cache
+
+import numpy as np
+
+GRID_MAGIC = b"VGTGRID1"
+GRID_EXTENSION = ".grid"
+_HEADER_SIZE = len(GRID_MAGIC) + 2 * 8
+
+
+def write_grid(path, pages_input_ids, pages_bbox):
+    """
+    Write the grids of the pages of a document.
+    Args:
+        path (str): output file, written atomically.
+        pages_input_ids (list[array]): subword ids of every page.
+        pages_bbox (list[array]): XYWH boxes (num_subwords x 4) of every page.
+    """
+    assert len(pages_input_ids) == len(pages_bbox)
+    lengths = [len(input_ids) for input_ids in pages_input_ids]
+    page_offsets = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]).astype("<i8")
+    input_ids = np.concatenate([np.asarray(ids, dtype="<i4").reshape(-1) for ids in pages_input_ids] + [np.zeros(0, "<i4")])
+    bbox = np.concatenate([np.asarray(b, dtype="<f4").reshape(-1, 4) for b in pages_bbox] + [np.zeros((0, 4), "<f4")])
+    assert len(input_ids) == len(bbox), "every subword needs a box"
+
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp_path, "wb") as f:
+        f.write(GRID_MAGIC)
+        f.write(np.array([len(pages_input_ids), len(input_ids)], dtype="<i8").tobytes())
+        for array in (page_offsets, input_ids, bbox):
+            f.write(np.ascontiguousarray(array).tobytes())
+    os.replace(tmp_path, path)
+
+
+class GridFile:
+    """
+    A memory-mapped grid file. The pages are zero-copy views of the mapping.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        buffer = np.memmap(path, dtype=np.uint8, mode="r")
+        if bytes(buffer[:len(GRID_MAGIC)]) != GRID_MAGIC:
+            raise ValueError("Not a VGT grid file: {}".format(path))
+        num_pages, num_subwords = np.frombuffer(buffer, dtype="<i8", count=2, offset=len(GRID_MAGIC))
+
+        offset = _HEADER_SIZE
+        self.page_offsets = np.frombuffer(buffer, dtype="<i8", count=num_pages + 1, offset=offset)
+        offset += self.page_offsets.nbytes
+        self.input_ids = np.frombuffer(buffer, dtype="<i4", count=num_subwords, offset=offset)
+        offset += self.input_ids.nbytes
+        self.bbox = np.frombuffer(buffer, dtype="<f4", count=num_subwords * 4, offset=offset).reshape(-1, 4)
+
+    def __len__(self):
+        return len(self.page_offsets) - 1
+
+    def page(self, page):
+        """
+        Returns:
+            input_ids (array): int32 [N], bbox (array): float32 [N x 4] XYWH.
+        """
+        start, end = self.page_offsets[page], self.page_offsets[page + 1]
+        return self.input_ids[start:end], self.bbox[start:end]
+
+
+@lru_cache(maxsize=16)
+def _open_grid(path, mtime_ns):
+    return GridFile(path)
+
+
+def open_grid(path):
+    """A cached GridFile, reopened if the file was rewritten."""
+    return _open_grid(path, os.stat(path).st_mtime_ns)
+
+
+def grid_path_of(pkl_path):
+    """The grid file replacing a pickled grid: 1.pdf.pkl -> 1.pdf.grid, 1.pkl -> 1.grid."""
+    return os.path.splitext(pkl_path)[0] + GRID_EXTENSION
+
+
+def load_grid(path, page=0):
+    """
+    Load the grid of a page, from a grid file or a pickled grid (replaced by its grid file if there is one).
+    Returns:
+        input_ids (array or list), bbox_subword_list (array [N x 4] or list of XYWH boxes)
+    """
+    if not path.endswith(GRID_EXTENSION) and os.path.exists(grid_path_of(path)):
+        path = grid_path_of(path)
+    if path.endswith(GRID_EXTENSION):
+        return open_grid(path).page(page)
+
+    with open(path, "rb") as f:
+        sample_inputs = pickle.load(f)
+    return sample_inputs["input_ids"], sample_inputs["bbox_subword_list"]
+
+
+def transform_grid_boxes(bbox_subword_list, transforms, image_shape):
+    """
+    Apply the transforms of the image to all XYWH subword boxes at once, as
+    `detection_utils.transform_instance_annotations` does for one box.
+    Returns:
+        array: float [N x 4] XYXY boxes, clipped to the image.
+    """
+    boxes = np.asarray(bbox_subword_list, dtype=np.float64).reshape(-1, 4)
+    if len(boxes) == 0:
+        return boxes
+    boxes = np.concatenate([boxes[:, :2], boxes[:, :2] + boxes[:, 2:]], axis=1)
+    boxes = transforms.apply_box(boxes).clip(min=0)
+    return np.minimum(boxes, list(tuple(image_shape) * 2)[::-1])
@@ -24,14 +24,37 @@ def main():
         "--grid_root",
         help="Path to input image",
         type=str,
-        required=True,
+    )
+    parser.add_argument(
+        "--grid_file",
+        help="Grid file of the whole document (create_grid_input.py), instead of the pkl in grid_root",
+        type=str,
+    )
+    parser.add_argument(
+        "--page",
+        help="Page of every image in its grid (default: 0, 1, 2, ... with grid_file, 0 otherwise)",
+        type=int,
+        nargs="+",
     )
     parser.add_argument(
         "--image_name",
-        help="Path to input image",
+        help="Name of the input image (several images, e.g. the pages of a document, are processed in batches)",
         type=str,
+        nargs="+",
         required=True,
     )
+    parser.add_argument(
+        "--batch_size",
+        help="Number of images per forward pass",
+        type=int,
+        default=4,
+    )
+    parser.add_argument(
+        "--num_workers",
+        help="Number of threads preparing the images and grids",
+        type=int,
+        default=4,
+    )
     parser.add_argument(
         "--output_root",
         help="Name of the output visualization file.",
@@ -57,22 +80,34 @@ def main():
     )
 
     args = parser.parse_args()
+    if args.page is not None and len(args.page) != len(args.image_name):
+        parser.error("--page needs one page per --image_name")
     
-    if args.dataset in ('D4LA', 'doclaynet'):
-        image_path = args.image_root + args.image_name + ".png"
-    else:
-        image_path = args.image_root + args.image_name + ".jpg"
-    
-    if args.dataset == 'publaynet':
-        grid_path = args.grid_root + args.image_name + ".pdf.pkl"
-    elif args.dataset == 'docbank':
-        grid_path = args.grid_root + args.image_name + ".pkl"
-    elif args.dataset == 'D4LA':
-        grid_path = args.grid_root + args.image_name + ".pkl"
-    elif args.dataset == 'doclaynet':
-        grid_path = args.grid_root + args.image_name + ".pdf.pkl"
-        
-    output_file_name = args.output_root + args.image_name + ".jpg"
+    pages = []
+    for index, image_name in enumerate(args.image_name):
+        if args.dataset in ('D4LA', 'doclaynet'):
+            image_path = args.image_root + image_name + ".png"
+        else:
+            image_path = args.image_root + image_name + ".jpg"
+
+        # the pkl grids (and the .grid files converted from them) hold a single page
+        if args.page is not None:
+            page = args.page[index]
+        elif args.grid_file is not None:
+            page = index
+        else:
+            page = 0
+        if args.grid_file is not None:
+            grid_path = args.grid_file
+        elif args.dataset == 'publaynet':
+            grid_path = args.grid_root + image_name + ".pdf.pkl"
+        elif args.dataset == 'docbank':
+            grid_path = args.grid_root + image_name + ".pkl"
+        elif args.dataset == 'D4LA':
+            grid_path = args.grid_root + image_name + ".pkl"
+        elif args.dataset == 'doclaynet':
+            grid_path = args.grid_root + image_name + ".pdf.pkl"
+        pages.append((image_path, grid_path, page))
     
     # Step 1: instantiate config
     cfg = get_cfg()
@@ -89,9 +124,6 @@ def main():
     # Step 4: define model
     predictor = DefaultPredictor(cfg)
     
-    # Step 5: run inference
-    img = cv2.imread(image_path)
-    
     md = MetadataCatalog.get(cfg.DATASETS.TEST[0])
     if args.dataset == 'publaynet':
         md.set(thing_classes=["text","title","list","table","figure"])
@@ -102,18 +134,22 @@ def main():
     elif args.dataset == 'doclaynet':
         md.set(thing_classes=["Caption","Footnote","Formula","List-item","Page-footer", "Page-header", "Picture", "Section-header", "Table", "Text", "Title"])
 
-    output = predictor(img, grid_path)["instances"]
-    
-    # import ipdb;ipdb.set_trace()
-    v = Visualizer(img[:, :, ::-1],
-                    md,
-                    scale=1.0,
-                    instance_mode=ColorMode.SEGMENTATION)
-    result = v.draw_instance_predictions(output.to("cpu"))
-    result_image = result.get_image()[:, :, ::-1]
+    # Step 5: run inference, the images are read by the predictor
+    for index, predictions in predictor.predict_batch(pages, args.batch_size, args.num_workers):
+        output = predictions["instances"]
+        img = cv2.imread(pages[index][0])
+        output_file_name = args.output_root + args.image_name[index] + ".jpg"
+
+        # import ipdb;ipdb.set_trace()
+        v = Visualizer(img[:, :, ::-1],
+                        md,
+                        scale=1.0,
+                        instance_mode=ColorMode.SEGMENTATION)
+        result = v.draw_instance_predictions(output.to("cpu"))
+        result_image = result.get_image()[:, :, ::-1]
 
-    # step 6: save
-    cv2.imwrite(output_file_name, result_image)
+        # step 6: save
+        cv2.imwrite(output_file_name, result_image)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,68 @@
+# Copyright (2023) Alibaba Group and its affiliates
+
+""" Compare random batches with width-bucketed batches (see `WidthBucketBatchSampler` in dataset/dataset.py):
+ratio of padded pixels and throughput (images/s) of data loading and of the model forward pass.
+Usage: python benchmark_bucketing.py -c=config/lister.yml [--training=True] [--num_batches=100] [--forward=True]
+"""
+
+import time
+import torch
+from torch.utils.data import DataLoader
+
+from utils import get_configs, get_model, default_data
+from dataset.dataset import AlignCollate
+
+
+def main():
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+    config_dict = get_configs(is_training=False)
+    training = config_dict.get('training', False)
+    num_batches = config_dict.get('num_batches', 100)
+    forward = config_dict.get('forward', torch.cuda.is_available())
+    data_path = config_dict['train_data_path'] if training else config_dict['test_data_path']
+
+    # the same datasets for both (an LMDB cannot be opened twice in a process)
+    config_dict['bucket_by_width'] = True
+    dataset, bucketed_dataloader = default_data(config_dict, data_path, training=training, shuffle=True)
+    random_dataloader = DataLoader(dataset, batch_size=config_dict['batch_size'], num_workers=config_dict['workers'],
+        shuffle=True, pin_memory=True, drop_last=training, collate_fn=AlignCollate(dataset))
+    net = None
+    if forward:
+        # throughput only, the weights do not matter
+        config_dict['num_classes'] = len(dataset.charlist)
+        net = get_model(config_dict, device, training=False, blank_id=0)
+
+    for bucket_by_width, dataloader in [(False, random_dataloader), (True, bucketed_dataloader)]:
+        n_images, n_pixels, n_padded = 0, 0, 0
+        t_data, t_model = 0., 0.
+        t0 = time.time()
+        for it, (images, img_masks, labels, lengths, words) in enumerate(dataloader):
+            if it == num_batches:
+                break
+            t_data += time.time() - t0
+            n_images += images.size(0)
+            n_pixels += img_masks.numel()
+            n_padded += (img_masks == 0).sum().item()
+            if net is not None:
+                images, img_masks = images.to(device), img_masks.to(device)
+                t1 = time.time()
+                with torch.no_grad():
+                    if config_dict['model_type'] == 'ctc':
+                        net(images, img_masks)
+                    else:
+                        net(images, img_masks, max_char=labels.size(1))
+                if device.type == 'cuda':
+                    torch.cuda.synchronize()
+                t_model += time.time() - t1
+            t0 = time.time()
+
+        log = f'bucket_by_width={bucket_by_width}: {n_images} images, padded pixels: {n_padded / n_pixels * 100:.1f}%'
+        log += f', data loading: {n_images / t_data:.1f} img/s'
+        if net is not None:
+            log += f', forward: {n_images / t_model:.1f} img/s'
+        print(log, flush=True)
+
+
+if __name__ == "__main__":
+    main()
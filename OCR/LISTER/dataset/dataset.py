@@ -6,10 +6,13 @@ import cv2
 import lmdb
 import six
 import string
+import hashlib
+import multiprocessing
 from fastai.vision import *
 from torchvision import transforms
-from torch.utils.data import ConcatDataset
+from torch.utils.data import ConcatDataset, Sampler
 from torch.utils.data.distributed import DistributedSampler
+import torch.distributed as dist
 import math
 from itertools import chain
 from timm.data.constants import IMAGENET_DEFAULT_MEAN, IMAGENET_DEFAULT_STD
@@ -39,6 +42,7 @@ class ImageDataset(Dataset):
                  data_aug:bool=True,
                  deteriorate_ratio:float=0.,
                  return_idx:bool=False,
+                 scales:list=None,
                  **kwargs):
         self.path, self.name = Path(path), Path(path).name
         assert self.path.is_dir() and self.path.exists(), f"{path} is not a valid directory."
@@ -47,6 +51,9 @@ class ImageDataset(Dataset):
         self.img_w_max = img_w_max
         self.do_resize = do_resize
         self.return_idx = return_idx
+        # (a, b): the short images (width w < 128 after resizing to img_h) are resized to width a * w + b.
+        # With several scales, every image is returned at all of them (multi-scale ensemble).
+        self.scales = [tuple(scale) for scale in scales] if scales else [(0.33, 85)]
         self.char94, self.is_training = char94, is_training
         self.data_aug = data_aug and is_training
         if char94:
@@ -91,13 +98,12 @@ class ImageDataset(Dataset):
         if x.size[0] <= pixels or x.size[1] <= pixels: return False
         else: return True
 
-    def resize(self, img):
+    def resize(self, img, scale=None):
         def _resize_ratio(img, ratio):
             trg_h, trg_w = self.img_h, int(self.img_h * ratio)
             if trg_w < 128:
-                trg_w = int(trg_w * 0.33 + 85)
-                # trg_w = int(trg_w * 0.21 + 121)
-                # trg_w = int(trg_w * 0.26 + 95)
+                a, b = scale or self.scales[0]
+                trg_w = int(trg_w * a + b)
 
             # trg_w = ((trg_w - 1) // 4 + 1) * 4
             trg_w = min(trg_w, self.img_w_max)
@@ -161,9 +167,57 @@ class ImageDataset(Dataset):
                 return self._next_image(idx)
             return image, label, idx
 
+    def image_sizes(self, cache_dir:str=None, workers:int=1):
+        "(w, h) of every image, read from the image headers once and then from a .npy sidecar of the LMDB."
+        stat = os.stat(self.path/'data.mdb')
+        key = '|'.join(map(str, [self.path.resolve(), stat.st_mtime_ns, stat.st_size, len(self)]))
+        cache_fp = Path(cache_dir or self.path)/f'image_sizes_{hashlib.sha1(key.encode()).hexdigest()[:16]}.npy'
+        if cache_fp.exists():
+            return np.load(cache_fp, mmap_mode='r')
+
+        workers = max(1, min(workers, len(self)))
+        if workers > 1:
+            bounds = np.linspace(1, len(self) + 1, workers + 1).astype(np.int64).tolist()
+            ranges = [(str(self.path), start, end) for start, end in zip(bounds[:-1], bounds[1:])]
+            # spawned processes: lmdb cannot open an environment twice in a process, including a forked one
+            with multiprocessing.get_context('spawn').Pool(workers) as pool:
+                sizes = np.concatenate(pool.map(_read_image_sizes_worker, ranges))
+        else:
+            with self.env.begin(write=False) as txn:
+                sizes = _read_image_sizes(txn, 1, len(self) + 1)
+        # write to a temporary file first, so that concurrent launches (e.g. DDP ranks) never read a partial index
+        tmp_fp = cache_fp.with_name(f'{cache_fp.name}.{os.getpid()}.tmp')
+        try:
+            cache_fp.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_fp, 'wb') as f:
+                np.save(f, sizes)
+            os.replace(tmp_fp, cache_fp)
+        except OSError as e:
+            print(f'Cannot write the image size index {cache_fp}: {e}')
+        return sizes
+
+    def target_widths(self, sizes:np.ndarray):
+        "Widths of the images after `resize` (without the random scaling of training), given their (w, h)."
+        if self.do_resize:
+            return np.full(len(sizes), self.img_w_max, dtype=np.int64)
+        w, h = sizes[:, 0].astype(np.int64), sizes[:, 1].astype(np.int64)
+        # unreadable images are replaced by others, consider them as the widest
+        valid = (w > 0) & (h > 0)
+        w, h = np.where(valid, w, self.img_w_max), np.where(valid, h, self.img_h)
+        # rotate vertical ones
+        vertical = h / w > 4.5
+        w, h = np.where(vertical, h, w), np.where(vertical, w, h)
+        trg_w = (self.img_h * (w / h)).astype(np.int64)
+        # the widest of all scales, to which all of them are padded
+        short_w = np.max([(trg_w * a + b).astype(np.int64) for a, b in self.scales], axis=0)
+        trg_w = np.where(trg_w < 128, short_w, trg_w)
+        return np.minimum(trg_w, self.img_w_max)
+
     def _process_image(self, image):
         if self.data_aug:
             image = self.augment_tfs(image)
+        if len(self.scales) > 1:
+            return [self.resize(np.array(image), scale) for scale in self.scales]
         image = self.resize(np.array(image))
         return image
 
@@ -191,6 +245,98 @@ class ImageDataset(Dataset):
         else: return image, label, label_len, word
 
 
+def _read_image_sizes(txn, start, end):
+    "(w, h) of the images of keys [start, end) of an LMDB, from their headers (0 x 0 if unreadable)."
+    sizes = np.zeros((end - start, 2), dtype=np.uint16)
+    end_key = f'image-{end:09d}'.encode()
+    cursor = txn.cursor()
+    # image keys are zero-padded, hence sorted by index: scan them sequentially
+    if cursor.set_range(f'image-{start:09d}'.encode()):
+        for key, imgbuf in cursor:
+            if key >= end_key:
+                break
+            try:
+                w, h = PIL.Image.open(six.BytesIO(imgbuf)).size  # does not decode the image
+                sizes[int(key[len('image-'):]) - start] = min(w, 65535), min(h, 65535)
+            except Exception:
+                pass
+    return sizes
+
+
+def _read_image_sizes_worker(args):
+    "`_read_image_sizes` in a separate process, which opens the LMDB by itself."
+    path, start, end = args
+    env = lmdb.open(path, readonly=True, lock=False, readahead=False, meminit=False)
+    with env.begin(write=False) as txn:
+        sizes = _read_image_sizes(txn, start, end)
+    env.close()
+    return sizes
+
+
+class WidthBucketBatchSampler(Sampler):
+    """Batches of samples with similar target widths, so that `AlignCollate` pads them less.
+
+    With shuffling, the randomly permuted samples of each epoch are split into pools of `bucket_size` global
+    batches, sorted by width within each pool and cut into batches, whose order is then shuffled. Without
+    shuffling, the whole dataset is sorted by width (stable). In distributed mode, a global batch holds the
+    `batch_size * num_replicas` samples of similar widths of all ranks, which take every `num_replicas`-th of
+    them, so that the ranks process batches of the same widths and the same number of batches.
+    """
+    def __init__(self, widths, batch_size:int, shuffle:bool=True, drop_last:bool=False, bucket_size:int=100,
+                 distributed:bool=False, num_replicas:int=None, rank:int=None, seed:int=0):
+        self.widths = np.asarray(widths)
+        self.batch_size, self.shuffle, self.drop_last = batch_size, shuffle, drop_last
+        self.bucket_size = bucket_size
+        self.distributed = distributed
+        if distributed:
+            self.num_replicas = dist.get_world_size() if num_replicas is None else num_replicas
+            self.rank = dist.get_rank() if rank is None else rank
+        else:
+            self.num_replicas, self.rank = 1, 0
+        self.seed, self.epoch = seed, 0
+        self.indices = None  # dataset indices of the last iteration, in the order of the batches
+
+    def set_epoch(self, epoch:int):
+        self.epoch = epoch
+
+    def _num_samples(self):
+        n, global_bs = len(self.widths), self.batch_size * self.num_replicas
+        if self.drop_last:
+            return n // global_bs * global_bs
+        return math.ceil(n / self.num_replicas) * self.num_replicas
+
+    def __len__(self):
+        return math.ceil(self._num_samples() / (self.batch_size * self.num_replicas))
+
+    def __iter__(self):
+        n, num_samples = len(self.widths), self._num_samples()
+        global_bs = self.batch_size * self.num_replicas
+        if self.shuffle:
+            g = torch.Generator()
+            if self.distributed:
+                g.manual_seed(self.seed + self.epoch)  # the same permutation on all ranks
+            else:
+                g.manual_seed(int(torch.empty((), dtype=torch.int64).random_().item()))
+            indices = torch.randperm(n, generator=g).numpy()
+        else:
+            indices = np.arange(n)
+        # drop the tail, or repeat the head so that every rank gets the same number of samples
+        indices = np.resize(indices, num_samples)
+
+        pool = global_bs * self.bucket_size if self.shuffle else max(num_samples, 1)
+        batches = []
+        for start in range(0, num_samples, pool):
+            chunk = indices[start:start + pool]
+            chunk = chunk[np.argsort(self.widths[chunk], kind='stable')]
+            batches.extend(chunk[i:i + global_bs] for i in range(0, len(chunk), global_bs))
+        if self.shuffle:
+            batches = [batches[i] for i in torch.randperm(len(batches), generator=g).tolist()]
+        batches = [batch[self.rank::self.num_replicas].tolist() for batch in batches]
+
+        self.indices = list(chain(*batches))
+        return iter(batches)
+
+
 class AlignCollate(object):
     def __init__(self, dataset):
         self.use_ctc = dataset.use_ctc
@@ -217,11 +363,13 @@ class AlignCollate(object):
             images, labels, lengths, words = zip(*batch)
         elif n_items == 5:
             images, labels, lengths, words, idxes = zip(*batch)
+        if isinstance(images[0], list):
+            # multi-scale: all images of the 1st scale, then all of the 2nd scale, etc., in one batch
+            images = [imgs[k] for k in range(len(images[0])) for imgs in images]
         
         # to know the max length of words and the max width of images
         max_width = 0
-        for img, label in zip(images, labels):
-            # max_length = max(max_length, label.shape[0])
+        for img in images:
             max_width = max(max_width, img.shape[1])
         max_width = ((max_width - 1) // 32 + 1) * 32 # multiple of 32
         # pad
@@ -268,7 +416,8 @@ def merge_all_lmdb_dir(roots:List[str]):
 
 
 def get_data(data_dir, img_h, img_w_max, max_len, batch_size, do_resize=False, data_aug=True, use_ctc=False,
-             char94=False, workers=4, shuffle=False, is_train=False, distributed=False):
+             char94=False, workers=4, shuffle=False, is_train=False, distributed=False,
+             bucket_by_width=False, bucket_size=100, index_cache_dir=None, index_workers=1, seed=0, scales=None):
     if isinstance(data_dir, str):
         data_dir = [data_dir]
     data_dir = merge_all_lmdb_dir(data_dir)
@@ -276,13 +425,22 @@ def get_data(data_dir, img_h, img_w_max, max_len, batch_size, do_resize=False, d
     for data_dir_ in data_dir:
         dataset_list.append(
             ImageDataset(data_dir_, is_train, img_h, img_w_max, do_resize,
-                max_len, use_ctc, char94, convert_mode='RGB', data_aug=data_aug)
+                max_len, use_ctc, char94, convert_mode='RGB', data_aug=data_aug, scales=scales)
         )
     if len(data_dir) > 1:
         dataset = MyConcatDataset(dataset_list)
     else:
         dataset = dataset_list[0]
     # print('total image: ', len(dataset))
+    if bucket_by_width:
+        # group the samples of similar widths into the same batches to reduce padding
+        widths = np.concatenate([d.target_widths(d.image_sizes(index_cache_dir, index_workers)) for d in dataset_list])
+        batch_sampler = WidthBucketBatchSampler(widths, batch_size, shuffle=bool(shuffle), drop_last=is_train,
+            bucket_size=bucket_size, distributed=distributed, seed=seed)
+        data_loader = DataLoader(dataset, batch_sampler=batch_sampler, num_workers=workers,
+            pin_memory=True, collate_fn=AlignCollate(dataset))
+        return dataset, data_loader
+
     if distributed:
         data_sampler = DistributedSampler(dataset=dataset)
         shuffle = None
@@ -59,15 +59,21 @@ def evaluate(dataloader, net, label_cvter, model_type='vit', accountant=None, ne
         else:
             tgt_imgs = None
         ti0 = time.time()
-        if ret_probs:
+        # multi-scale ensemble (`ensemble_scales`): the images at all scales are stacked in the batch
+        num_scales = images.size(0) // len(words)
+        if ret_probs or num_scales > 1:
             # calc prob
             probs = output.softmax(-1).max(-1)[0] # [b, L]
             char_masks = ret_dict['char_masks']
             if isinstance(char_masks, list): char_masks = char_masks[-1]
             probs.masked_fill_((1 - char_masks).round().bool(), 1.0)
             probs = (probs + 1e-10).log().sum(-1).exp() # [b]
-            probs = probs.cpu().tolist()
-            probs_all.extend(probs)
+            if num_scales > 1:
+                # keep the prediction of the most confident scale (the first one in case of a tie)
+                probs, best = probs.view(num_scales, -1).max(0)
+                output = output.view(num_scales, -1, *output.shape[1:])[best, torch.arange(best.size(0), device=best.device)]
+            if ret_probs:
+                probs_all.extend(probs.cpu().tolist())
 
         preds_prob, preds_index = output.max(2)
         preds_str = label_cvter.decode(preds_index.data)
@@ -90,6 +96,14 @@ def evaluate(dataloader, net, label_cvter, model_type='vit', accountant=None, ne
             if isinstance(nb_map, list):
                 nb_map = nb_map[-1]
             debug(preds_str, words, images, tgt_imgs, attn_map, h, nb_map)
+    if isinstance(dataloader.batch_sampler, WidthBucketBatchSampler) and not dataloader.batch_sampler.shuffle \
+            and len(words_all) == len(dataloader.batch_sampler.indices):
+        # results in the order of the dataset (batches are sorted by width), e.g. for multi_size_ensemble.py
+        order = np.argsort(dataloader.batch_sampler.indices, kind='stable')
+        preds_str_all = [preds_str_all[i] for i in order]
+        words_all = [words_all[i] for i in order]
+        if len(probs_all) > 0:
+            probs_all = [probs_all[i] for i in order]
     if test_speed:
         time1 = time.time()
         speed = (time1 - time0) / len(dataloader.dataset)
@@ -81,7 +81,11 @@ def main(config_dict):
     print("Local Rank {}: start training ...".format(local_rank))
     # import ipdb;ipdb.set_trace()
     for epoch in range(start_epoch, config_dict['num_epochs']):
-        train_dataloader.sampler.set_epoch(epoch) # to guarantee different shuffling orders across epochs
+        # to guarantee different shuffling orders across epochs
+        if isinstance(train_dataloader.batch_sampler, WidthBucketBatchSampler):
+            train_dataloader.batch_sampler.set_epoch(epoch)
+        else:
+            train_dataloader.sampler.set_epoch(epoch)
         for it, (images, img_masks, labels, lengths, words_raw) in enumerate(train_dataloader):
             # update lr
             lr = lr_schedule_values[min(i, len(lr_schedule_values) - 1)]
@@ -18,7 +18,7 @@ from typing import List
 from timm.data.constants import IMAGENET_DEFAULT_MEAN, IMAGENET_DEFAULT_STD
 import matplotlib.pyplot as plt
 
-from dataset.dataset import get_data
+from dataset.dataset import get_data, WidthBucketBatchSampler
 from model.model import LISTER, PATModel, CTCModel, RNNAttnSTR
 
 
@@ -108,6 +108,12 @@ def default_data(config_dict:dict, data_path, training=False, shuffle=False, dis
         shuffle=shuffle,
         is_train=training,
         distributed=distributed,
+        bucket_by_width=config_dict.get('bucket_by_width', False),
+        bucket_size=config_dict.get('bucket_size', 100),
+        index_cache_dir=config_dict.get('index_cache_dir', None),
+        index_workers=config_dict.get('index_workers', 1),
+        seed=config_dict['seed'],
+        scales=None if training else config_dict.get('ensemble_scales', None),
     )
     return dataset, dataloader
 
@@ -1,5 +1,7 @@
 import os
 import sys
+import hashlib
+import multiprocessing
 import re
 import six
 import math
@@ -128,6 +130,72 @@ def hierarchical_dataset(root, opt, select_data='/', test_flag=False):
     concatenated_dataset = ConcatDataset(dataset_list)
     return concatenated_dataset, dataset_log
 
+def _filter_label_range(txn, start, end, batch_max_length):
+    """ lmdb indices in [start, end) whose label is not longer than batch_max_length """
+    end_key = 'label-%09d'.encode() % end
+    index_list = []
+    cursor = txn.cursor()
+    # label keys are zero-padded, hence sorted by index: scan them sequentially instead of one lookup per key
+    if cursor.set_range('label-%09d'.encode() % start):
+        for key, label in cursor:
+            if key >= end_key:
+                break
+            if len(label.decode('utf-8')) <= batch_max_length:
+                index_list.append(int(key[len('label-'):]))
+    return np.array(index_list, dtype=np.uint32)
+
+
+def _filter_label_range_worker(args):
+    """ _filter_label_range in a separate process, which opens the lmdb by itself """
+    root, start, end, batch_max_length = args
+    env = lmdb.open(root, max_readers=32, readonly=True, lock=False, readahead=False, meminit=False)
+    with env.begin(write=False) as txn:
+        index_list = _filter_label_range(txn, start, end, batch_max_length)
+    env.close()
+    return index_list
+
+
+def filtered_index_cache_path(root, opt, nSamples):
+    """ the cache is keyed by the lmdb path, the mtime and size of its data file and the filtering options """
+    data_path = os.path.join(root, 'data.mdb')
+    stat = os.stat(data_path if os.path.exists(data_path) else root)
+    key = '|'.join(map(str, [os.path.abspath(root), stat.st_mtime_ns, stat.st_size, nSamples, opt.batch_max_length]))
+    cache_name = 'filtered_index_%s.npy' % hashlib.sha1(key.encode()).hexdigest()[:16]
+    return os.path.join(opt.index_cache_dir or root, cache_name)
+
+
+def load_filtered_index(txn, root, opt, nSamples):
+    """ 1-based indices of the samples whose label is not longer than opt.batch_max_length, as a uint32 array.
+    It is computed once (in parallel over label-key ranges with --index_workers > 1), saved as a .npy sidecar
+    (inside the lmdb directory, or in --index_cache_dir) and memory-mapped on later launches.
+    """
+    cache_path = None if opt.no_index_cache else filtered_index_cache_path(root, opt, nSamples)
+    if cache_path is not None and os.path.exists(cache_path):
+        return np.load(cache_path, mmap_mode='r')
+
+    workers = max(1, min(opt.index_workers, nSamples))
+    if workers > 1:
+        bounds = np.linspace(1, nSamples + 1, workers + 1).astype(np.int64).tolist()
+        ranges = [(root, start, end, opt.batch_max_length) for start, end in zip(bounds[:-1], bounds[1:])]
+        # spawned processes: lmdb cannot open an environment twice in a process, including a forked one
+        with multiprocessing.get_context('spawn').Pool(workers) as pool:
+            filtered_index_list = np.concatenate(pool.map(_filter_label_range_worker, ranges))
+    else:
+        filtered_index_list = _filter_label_range(txn, 1, nSamples + 1, opt.batch_max_length)
+
+    if cache_path is not None:
+        # write to a temporary file first, so that concurrent launches (e.g. DDP ranks) never read a partial cache
+        tmp_path = '%s.%d.tmp' % (cache_path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                np.save(f, filtered_index_list)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            print(f'cannot write the filtered index cache {cache_path}: {e}')
+    return filtered_index_list
+
+
 class LmdbDataset(Dataset):
     def __init__(self, root, opt, test_flag):
 
@@ -162,15 +230,7 @@ class LmdbDataset(Dataset):
                 use --sensitive and --data_filtering_off,
                 see https://github.com/clovaai/deep-text-recognition-benchmark/blob/dff844874dbe9e0ec8c5a52a7bd08c7f20afe704/test.py#L137-L144
                 """
-                self.filtered_index_list = []
-                for index in range(self.nSamples):
-                    index += 1  # lmdb starts with 1
-                    label_key = 'label-%09d'.encode() % index
-                    label = txn.get(label_key).decode('utf-8')
-                    if len(label) > self.opt.batch_max_length:
-                        continue
-                    
-                    self.filtered_index_list.append(index)
+                self.filtered_index_list = load_filtered_index(txn, root, self.opt, self.nSamples)
                 self.nSamples = len(self.filtered_index_list)
         self.test_flag = test_flag
 
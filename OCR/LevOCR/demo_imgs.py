@@ -15,109 +15,10 @@ from utils import get_args
 from levt import utils as utils_levt
 from levt.dictionary import Dictionary
 from abinet.utils import CharsetMapper
+from eval import generate
 
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
-def generate(
-    model, 
-    vision_final_pred, 
-    img_feature, 
-    batch_size, 
-    pad, 
-    eos_penalty=0.0, 
-    max_iter=10,
-    max_ratio=2,
-    decoding_format=None,
-    retain_history=True
-):
-    bsz = batch_size
-    prev_decoder_out = model.module.levt.initialize_output_tokens(vision_final_pred)
-    prev_output_tokens = prev_decoder_out.output_tokens.clone()
-    sent_idxs = torch.arange(bsz)
-    finalized = [[] for _ in range(bsz)]
-
-    def finalized_preds(step, prev_out_token, prev_out_score, prev_out_attn):
-        cutoff = prev_out_token.ne(pad)
-        tokens = prev_out_token[cutoff]
-        if prev_out_score is None:
-            scores, score = None, None
-        else:
-            scores = prev_out_score[cutoff]
-            score = scores.mean()
-
-        if prev_out_attn is None:
-            hypo_attn, alignment = None, None
-        else:
-            hypo_attn = prev_out_attn[cutoff]
-            alignment = hypo_attn.max(dim=1)[1]
-        return {
-            "steps": step,
-            "tokens": tokens,
-            "positional_scores": scores,
-            "score": score,
-            "hypo_attn": hypo_attn,
-            "alignment": alignment,
-        }
-
-    for step in range(max_iter + 1):
-        decoder_options = {
-            "eos_penalty": eos_penalty,
-            "max_ratio": max_ratio,
-            "decoding_format": decoding_format,
-        }
-        prev_decoder_out = prev_decoder_out._replace(
-            step=step,
-            max_step=max_iter + 1,
-        )
-        
-        decoder_out = model.module.levt.forward_decoder(
-            prev_decoder_out, img_feature, **decoder_options
-        )
-
-        # collect finalized sentences
-        finalized_tokens = decoder_out.output_tokens
-        finalized_scores = decoder_out.output_scores
-        finalized_attn = (
-            None
-            if (decoder_out.attn is None or decoder_out.attn.size(0) == 0)
-            else decoder_out.attn
-        )
-
-        finalized_history_tokens = decoder_out.history
-        for i in range(bsz):
-            finalized[i] = [
-                finalized_preds(
-                    step,
-                    finalized_tokens[i],
-                    finalized_scores[i],
-                    None if finalized_attn is None else finalized_attn[i],
-                )
-            ]
-
-            finalized[i][0]["history"] = []
-            for j in range(len(finalized_history_tokens)):
-                finalized[i][0]["history"].append(
-                    finalized_preds(
-                        step, finalized_history_tokens[j][i], None, None
-                    )
-                )
-
-        # for next step
-        prev_decoder_out = decoder_out._replace(
-            output_tokens=decoder_out.output_tokens,
-            output_scores=decoder_out.output_scores,
-            attn=decoder_out.attn
-            if (decoder_out.attn is not None and decoder_out.attn.size(0) > 0)
-            else None,
-            history=decoder_out.history
-            if decoder_out.history is not None
-            else None,
-        )
-        prev_output_tokens = prev_decoder_out.output_tokens.clone()  
-
-    return finalized
-
-
 def test(opt):
     opt.eval = True
     """ model configuration """
@@ -171,7 +72,8 @@ def test(opt):
             vision_final_pred, _ = converter.encode_levt(vision_preds_str, src_dict, device=device, batch_max_length=pred_vision.size(1))
 
             img_feature_new = model.module.extract_img_feature(features)
-            preds = generate(model, vision_final_pred, img_feature_new, batch_size, src_dict.pad(), max_iter=int(opt.max_iter))
+            preds = generate(model, vision_final_pred, img_feature_new, batch_size, src_dict.pad(), max_iter=int(opt.max_iter),
+                             adaptive=not opt.iter_decode_force_max_iter, retain_history=True)
 
             for i in range(batch_size):
                 print('=======================================')
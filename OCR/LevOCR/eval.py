@@ -35,6 +35,7 @@ def benchmark_all_eval(model, criterion, converter, src_dict, opt):
     total_evaluation_data_number = 0
     char_total_correct_number = 0
     vision_total_correct_number = 0
+    total_refine_iterations = 0
     dashed_line = '-' * 80
     print(dashed_line)
     for eval_data in eval_data_list:
@@ -50,7 +51,7 @@ def benchmark_all_eval(model, criterion, converter, src_dict, opt):
             num_workers=int(opt.workers),
             collate_fn=AlignCollate_evaluation, pin_memory=True)
 
-        _, accuracys, _, _, infer_time, length_of_data, accur_numbers = validation(
+        _, accuracys, _, _, infer_time, length_of_data, accur_numbers, refine_iterations = validation(
             model, criterion, evaluation_loader, converter, src_dict, opt)
         char_list_accuracy.append(f'{accuracys[0]:0.3f}')
         vision_list_accuracy.append(f'{accuracys[1]:0.3f}')
@@ -59,7 +60,8 @@ def benchmark_all_eval(model, criterion, converter, src_dict, opt):
         total_evaluation_data_number += len(eval_data)
         char_total_correct_number += accur_numbers[0]
         vision_total_correct_number += accur_numbers[1]
-        print(f'levocr_Acc {accuracys[0]:0.3f}\t vision_Acc {accuracys[1]:0.3f}\t')
+        total_refine_iterations += refine_iterations
+        print(f'levocr_Acc {accuracys[0]:0.3f}\t vision_Acc {accuracys[1]:0.3f}\t avg_iter {refine_iterations / length_of_data:0.2f}\t')
         print(dashed_line)
 
     averaged_forward_time = total_forward_time / total_evaluation_data_number * 1000
@@ -69,7 +71,8 @@ def benchmark_all_eval(model, criterion, converter, src_dict, opt):
 
     evaluation_log = 'accuracy: ' + '\n'
     evaluation_log += 'levocr_total_Acc:'+str(char_total_accuracy)+'\t' + 'vision_total_Acc:'+str(vision_total_accuracy)+'\t'+'th:'+str(opt.th)+'\n'
-    evaluation_log += f'averaged_infer_time: {averaged_forward_time:0.3f}\t# parameters: {params_num/1e6:0.3f}'
+    evaluation_log += f'averaged_infer_time: {averaged_forward_time:0.3f}\t# parameters: {params_num/1e6:0.3f}\n'
+    evaluation_log += f'averaged_refine_iterations: {total_refine_iterations / total_evaluation_data_number:0.3f}\t(max: {int(opt.max_iter) + 1})'
     print(evaluation_log)
     return [char_total_accuracy, vision_total_accuracy]
 
@@ -80,6 +83,7 @@ def validation(model, criterion, evaluation_loader, converter, src_dict, opt):
 
     length_of_data = 0
     infer_time = 0
+    refine_iterations = 0  # number of refinement iterations actually run, summed over the samples
     valid_loss_avg = Averager()
 
     for i, (image_tensors, labels, _) in enumerate(evaluation_loader):
@@ -106,7 +110,9 @@ def validation(model, criterion, evaluation_loader, converter, src_dict, opt):
 
         img_feature_new = model.module.extract_img_feature(features)
         
-        preds = generate(model, vision_final_pred, img_feature_new, batch_size, src_dict.pad(), max_iter=int(opt.max_iter))
+        preds = generate(model, vision_final_pred, img_feature_new, batch_size, src_dict.pad(), max_iter=int(opt.max_iter),
+                         adaptive=not opt.iter_decode_force_max_iter)
+        refine_iterations += sum([hypos[0]["steps"] + 1 for hypos in preds])
 
         char_preds_str = []
         for i in range(batch_size):
@@ -134,7 +140,7 @@ def validation(model, criterion, evaluation_loader, converter, src_dict, opt):
 
     char_accuracy = char_n_correct/float(length_of_data) * 100
     vision_accuracy = vision_n_correct/float(length_of_data) * 100
-    return valid_loss_avg.val(), [char_accuracy, vision_accuracy], char_preds_str, labels, infer_time, length_of_data, [char_n_correct, vision_n_correct]
+    return valid_loss_avg.val(), [char_accuracy, vision_accuracy], char_preds_str, labels, infer_time, length_of_data, [char_n_correct, vision_n_correct], refine_iterations
 
 def generate(
     model, 
@@ -146,13 +152,27 @@ def generate(
     max_iter=10,
     max_ratio=2,
     decoding_format=None,
+    adaptive=True,
+    retain_history=False,
 ):
+    # iterative refinement as fairseq's IterativeRefinementGenerator: with adaptive, a sample is finalized as soon as
+    # its output tokens stop changing (a refinement step is a deterministic function of the tokens, so the following
+    # steps would not change them either) and removed from the batch; "steps" of a hypothesis is the index of its last step
     bsz = batch_size
     prev_decoder_out = model.module.levt.initialize_output_tokens(vision_final_pred)
     prev_output_tokens = prev_decoder_out.output_tokens.clone()
     sent_idxs = torch.arange(bsz)
     finalized = [[] for _ in range(bsz)]
 
+    def is_a_loop(x, y):
+        # rows of y (new tokens) equal to those of x (previous tokens), ignoring the padding
+        b, l_x, l_y = x.size(0), x.size(1), y.size(1)
+        if l_x > l_y:
+            y = torch.cat([y, x.new_zeros(b, l_x - l_y).fill_(pad)], 1)
+        elif l_x < l_y:
+            x = torch.cat([x, y.new_zeros(b, l_y - l_x).fill_(pad)], 1)
+        return (x == y).all(1)
+
     def finalized_preds(step, prev_out_token, prev_out_score, prev_out_attn):
         cutoff = prev_out_token.ne(pad)
         tokens = prev_out_token[cutoff]
@@ -191,18 +211,16 @@ def generate(
             prev_decoder_out, img_feature, **decoder_options
         )
 
-        # for next step
-        prev_decoder_out = decoder_out._replace(
-            output_tokens=decoder_out.output_tokens,
-            output_scores=decoder_out.output_scores,
-            attn=decoder_out.attn
-            if (decoder_out.attn is not None and decoder_out.attn.size(0) > 0)
-            else None,
-        )
-        prev_output_tokens = prev_decoder_out.output_tokens.clone()  
-
+        if adaptive:
+            terminated = is_a_loop(prev_output_tokens, decoder_out.output_tokens)
+        else:
+            terminated = decoder_out.output_tokens.new_zeros(decoder_out.output_tokens.size(0)).bool()
         if step == max_iter:  # reach last iteration
-            # collect finalized sentences
+            terminated.fill_(1)
+
+        # collect finalized sentences
+        terminated_rows = terminated.nonzero().squeeze(1).tolist()
+        if len(terminated_rows) > 0:
             finalized_tokens = decoder_out.output_tokens
             finalized_scores = decoder_out.output_scores
             finalized_attn = (
@@ -210,8 +228,10 @@ def generate(
                 if (decoder_out.attn is None or decoder_out.attn.size(0) == 0)
                 else decoder_out.attn
             )
-            for i in range(bsz):
-                finalized[i] = [
+            finalized_history_tokens = decoder_out.history
+            for i in terminated_rows:
+                finalized_idx = int(sent_idxs[i])
+                finalized[finalized_idx] = [
                     finalized_preds(
                         step,
                         finalized_tokens[i],
@@ -219,6 +239,35 @@ def generate(
                         None if finalized_attn is None else finalized_attn[i],
                     )
                 ]
+
+                if retain_history:
+                    finalized[finalized_idx][0]["history"] = []
+                    for j in range(len(finalized_history_tokens)):
+                        finalized[finalized_idx][0]["history"].append(
+                            finalized_preds(
+                                step, finalized_history_tokens[j][i], None, None
+                            )
+                        )
+
+        if len(terminated_rows) == terminated.size(0):
+            break
+
+        # for next step: keep the samples that are still being refined
+        not_terminated = ~terminated
+        prev_decoder_out = decoder_out._replace(
+            output_tokens=decoder_out.output_tokens[not_terminated],
+            output_scores=decoder_out.output_scores[not_terminated],
+            attn=decoder_out.attn[not_terminated]
+            if (decoder_out.attn is not None and decoder_out.attn.size(0) > 0)
+            else None,
+            history=[h[not_terminated] for h in decoder_out.history]
+            if decoder_out.history is not None
+            else None,
+        )
+        img_feature = img_feature[not_terminated]
+        sent_idxs = sent_idxs[not_terminated.cpu()]
+        prev_output_tokens = prev_decoder_out.output_tokens.clone()  
+
     return finalized
 
 
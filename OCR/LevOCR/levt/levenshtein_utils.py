@@ -8,26 +8,82 @@ from levt.utils import new_arange
 
 
 def load_libnat():
+    # only the CUDA extension of fairseq is used; on CPU, the alignments are computed in PyTorch (see _suggested_ed2_path)
     try:
         from fairseq import libnat_cuda
 
         return libnat_cuda, True
 
-    except ImportError as e:
-        #print(str(e) + "... fall back to CPU version")
+    except ImportError:
+        return None, False
 
-        try:
-            from fairseq import libnat
 
-            return libnat, False
+def _suggested_ed2_path(in_tokens, out_tokens, padding_idx):
+    """
+    Batched PyTorch equivalent of libnat.suggested_ed2_path (edit distance with insertions and deletions only,
+    same dynamic programming and same backtracking order), on padded token tensors instead of lists.
+
+    The DP table is filled one input token (row) at a time for the whole batch: within a row,
+    d[i][j] = min(a[j], d[i][j - 1] + 1) with a[j] = min(d[i - 1][j] + 1, d[i - 1][j - 1] + 2 * (x[i - 1] != y[j - 1]))
+    is a running minimum, d[i][j] = j + cummin(a[k] - k). The backtracking then walks all the paths in parallel.
+
+    Returns:
+        ins_counts: B x (Lx + 1), number of tokens inserted before the first input token (slot 0), after the k-th
+            input token (slot k), ..., after the last one (slot lx); 0 beyond lx
+        del_labels: B x Lx, 1 for the input tokens to delete; 0 beyond lx
+        in_lengths: B, number of (non-padding) input tokens
+    """
+    # move the padding to the end (as the token lists of libnat)
+    in_masks = in_tokens.ne(padding_idx)
+    out_masks = out_tokens.ne(padding_idx)
+    x = in_tokens.gather(1, (~in_masks).long().sort(dim=1, stable=True)[1])
+    y = out_tokens.gather(1, (~out_masks).long().sort(dim=1, stable=True)[1])
+    in_lengths, out_lengths = in_masks.sum(1), out_masks.sum(1)
+
+    bsz, in_len, out_len = x.size(0), x.size(1), y.size(1)
+    cols = torch.arange(out_len + 1, device=x.device)
+
+    # dynamic programming, B x (Lx + 1) x (Ly + 1) (the cells beyond the lengths are never read)
+    d = x.new_zeros(bsz, in_len + 1, out_len + 1)
+    d[:, 0] = cols
+    for i in range(1, in_len + 1):
+        cost = (x[:, i - 1 : i] != y).long() * 2
+        a = torch.cat(
+            [
+                d.new_full((bsz, 1), i),
+                torch.min(d[:, i - 1, 1:] + 1, d[:, i - 1, :-1] + cost),
+            ],
+            1,
+        )
+        d[:, i] = (a - cols).cummin(1)[0] + cols
+
+    # backtracking from (lx, ly) to (0, 0), all the samples at once: insertion if d[i][j - 1] < d[i][j],
+    # else deletion if d[i - 1][j] < d[i][j], else keep
+    d = d.view(bsz, -1)
+    i, j = in_lengths.clone(), out_lengths.clone()
+    ins_counts = x.new_zeros(bsz, in_len + 1)
+    del_labels = x.new_zeros(bsz, in_len + 1)
+    row_size = out_len + 1
+    for _ in range(int((in_lengths + out_lengths).max()) if bsz > 0 else 0):
+        active = (i > 0) | (j > 0)
+        cur = d.gather(1, (i * row_size + j)[:, None])[:, 0]
+        left = d.gather(1, (i * row_size + (j - 1).clamp(min=0))[:, None])[:, 0]
+        up = d.gather(1, ((i - 1).clamp(min=0) * row_size + j)[:, None])[:, 0]
+
+        ins = active & (j > 0) & (left < cur)
+        dele = active & ~ins & (i > 0) & (up < cur)
+        keep = active & ~ins & ~dele
+
+        # an insertion at (i, j) goes after the i-th input token, a deletion or a keep consumes the i-th input token
+        # (the last column of del_labels collects the samples that do not consume any)
+        ins_counts.scatter_add_(1, i[:, None], ins.long()[:, None])
+        consumed = dele | keep
+        del_labels.scatter_(1, torch.where(consumed, i - 1, in_len)[:, None], dele.long()[:, None])
 
-        except ImportError as e:
-            import sys
+        j = j - (ins | keep).long()
+        i = i - consumed.long()
 
-            sys.stderr.write(
-                "ERROR: missing libnat_cuda. run `python setup.py build_ext --inplace`\n"
-            )
-            raise e
+    return ins_counts, del_labels[:, :in_len], in_lengths
 
 
 def _get_ins_targets(in_tokens, out_tokens, padding_idx, unk_idx):
@@ -55,57 +111,27 @@ def _get_ins_targets(in_tokens, out_tokens, padding_idx, unk_idx):
     def _get_ins_targets_cpu(in_tokens, out_tokens, padding_idx, unk_idx):
         in_seq_len, out_seq_len = in_tokens.size(1), out_tokens.size(1)
 
-        in_tokens_list = [
-            [t for t in s if t != padding_idx] for i, s in enumerate(in_tokens.tolist())
-        ]
-        out_tokens_list = [
-            [t for t in s if t != padding_idx]
-            for i, s in enumerate(out_tokens.tolist())
-        ]
-
-        full_labels = libnat.suggested_ed2_path(
-            in_tokens_list, out_tokens_list, padding_idx
+        ins_counts, _, in_lengths = _suggested_ed2_path(
+            in_tokens, out_tokens, padding_idx
         )
-        mask_inputs = [
-            [len(c) if c[0] != padding_idx else 0 for c in a[:-1]] for a in full_labels
-        ]
-
-        # generate labels
-        masked_tgt_masks = []
-        for mask_input in mask_inputs:
-            mask_label = []
-            for beam_size in mask_input[1:-1]:  # HACK 1:-1
-            #for beam_size in mask_input:
-                mask_label += [0] + [1 for _ in range(beam_size)]
-            masked_tgt_masks.append(
-                mask_label + [0 for _ in range(out_seq_len - len(mask_label))]
-            )
-        mask_ins_targets = [
-            mask_input[1:-1]
-            #mask_input
-            + [0 for _ in range(in_seq_len - 1 - len(mask_input[1:-1]))]
-            for mask_input in mask_inputs
-        ]
-        
-        try:
-            # transform to tensor
-            masked_tgt_masks = torch.tensor(
-                masked_tgt_masks, device=out_tokens.device
-            ).bool()
-        except Exception as e:
-            #print(e)
-            len_ = out_tokens.size(1)          
-            masked_tgt_masks = [
-                mask_input
-                if len(mask_input) == len_ 
-                else mask_input[:len_]
-                for mask_input in masked_tgt_masks                
-            ]
-            masked_tgt_masks = torch.tensor(
-                masked_tgt_masks, device=out_tokens.device
-            ).bool()
-                
-        mask_ins_targets = torch.tensor(mask_ins_targets, device=in_tokens.device)
+
+        # insertion labels of the slots between two input tokens (HACK 1:-1, i.e., slots 1 to lx - 1)
+        slots = new_arange(ins_counts, in_seq_len - 1)[None, :] + 1
+        valid_slots = slots < in_lengths[:, None]
+        mask_ins_targets = ins_counts[:, 1:in_seq_len].masked_fill(~valid_slots, 0)
+
+        # masked target: for each of these slots, one kept token (0) followed by its inserted tokens (1),
+        # padded (or truncated) to the length of the output
+        spans = (mask_ins_targets + 1).masked_fill(~valid_slots, 0)
+        mask_lengths = spans.sum(1)
+        mask_len = max(out_seq_len, int(mask_lengths.max()) if spans.size(0) > 0 else 0)
+        starts = (spans.cumsum(1) - spans).masked_fill(~valid_slots, mask_len)  # extra column for the invalid slots
+        masked_tgt_masks = new_arange(spans, mask_len + 1)[None, :] < mask_lengths[:, None]
+        masked_tgt_masks.scatter_(1, starts, False)
+        masked_tgt_masks = masked_tgt_masks[:, :out_seq_len]
+
+        mask_ins_targets = mask_ins_targets.to(in_tokens.device)
+        masked_tgt_masks = masked_tgt_masks.to(out_tokens.device)
         masked_tgt_tokens = out_tokens.masked_fill(masked_tgt_masks, unk_idx)
         return masked_tgt_masks, masked_tgt_tokens, mask_ins_targets
 
@@ -137,27 +163,21 @@ def _get_del_targets(in_tokens, out_tokens, padding_idx):
 
     def _get_del_targets_cpu(in_tokens, out_tokens, padding_idx):
         out_seq_len = out_tokens.size(1)
-        with torch.cuda.device_of(in_tokens):
-            in_tokens_list = [
-                [t for t in s if t != padding_idx]
-                for i, s in enumerate(in_tokens.tolist())
-            ]
-            out_tokens_list = [
-                [t for t in s if t != padding_idx]
-                for i, s in enumerate(out_tokens.tolist())
-            ]
-
-        full_labels = libnat.suggested_ed2_path(
-            in_tokens_list, out_tokens_list, padding_idx
+
+        _, word_del_targets, in_lengths = _suggested_ed2_path(
+            in_tokens, out_tokens, padding_idx
         )
-        word_del_targets = [b[-1] for b in full_labels]
-        word_del_targets = [
-            labels + [0 for _ in range(out_seq_len - len(labels))]
-            for labels in word_del_targets
-        ]
+        # libnat returns [padding_idx] as the deletion labels of an empty input
+        word_del_targets[:, :1].masked_fill_(in_lengths[:, None].eq(0), padding_idx)
+
+        # padded to the length of the output
+        width = max(out_seq_len, int(in_lengths.max()) if in_lengths.size(0) > 0 else 0)
+        word_del_targets = torch.cat(
+            [word_del_targets, word_del_targets.new_zeros(word_del_targets.size(0), width)], 1
+        )[:, :width]
 
         # transform to tensor
-        word_del_targets = torch.tensor(word_del_targets, device=out_tokens.device)
+        word_del_targets = word_del_targets.to(out_tokens.device)
         return word_del_targets
 
     if use_cuda:
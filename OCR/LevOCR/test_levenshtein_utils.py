@@ -0,0 +1,171 @@
+import random
+
+import torch
+
+from levt import levenshtein_utils
+from levt.levenshtein_utils import _get_del_targets, _get_ins_targets
+
+# Equivalence of the PyTorch insertion/deletion targets (levt/levenshtein_utils.py) with those computed from
+# fairseq's libnat.suggested_ed2_path (or, without fairseq, from a line-by-line Python port of its C++ code).
+# python -m pytest test_levenshtein_utils.py
+
+PAD, UNK = 1, 3
+
+
+def _ed2_path(x, y, terminal_symbol):
+    # Python port of edit_distance2_with_dp + edit_distance2_backtracking (fairseq/clib/libnat/edit_dist.cpp)
+    lx, ly = len(x), len(y)
+    d = [[0] * (ly + 1) for _ in range(lx + 1)]
+    for i in range(lx + 1):
+        d[i][0] = i
+    for j in range(ly + 1):
+        d[0][j] = j
+    for i in range(1, lx + 1):
+        for j in range(1, ly + 1):
+            d[i][j] = min(min(d[i - 1][j], d[i][j - 1]) + 1, d[i - 1][j - 1] + 2 * (0 if x[i - 1] == y[j - 1] else 1))
+
+    edit_seqs = [[] for _ in range(lx + 2)]
+    if lx == 0:
+        edit_seqs[0] = list(y)
+    else:
+        seq = []
+        i, j = lx, ly
+        while not (i == 0 and j == 0):
+            if j > 0 and d[i][j - 1] < d[i][j]:
+                seq.append((1, y[j - 1]))
+                j -= 1
+            elif i > 0 and d[i - 1][j] < d[i][j]:
+                seq.append((2, x[i - 1]))
+                i -= 1
+            else:
+                seq.append((3, x[i - 1]))
+                i -= 1
+                j -= 1
+
+        prev_op, s = 0, 0
+        for op, word in reversed(seq):
+            if prev_op != 1:
+                s += 1
+            if op == 1:
+                edit_seqs[s - 1].append(word)
+            elif op == 2:
+                edit_seqs[lx + 1].append(1)
+            else:
+                edit_seqs[lx + 1].append(0)
+            prev_op = op
+
+    for k in range(len(edit_seqs)):
+        if len(edit_seqs[k]) == 0:
+            edit_seqs[k].append(terminal_symbol)
+    return edit_seqs
+
+
+def suggested_ed2_path(xs, ys, terminal_symbol):
+    try:
+        from fairseq import libnat
+
+        return libnat.suggested_ed2_path(xs, ys, terminal_symbol)
+    except ImportError:
+        return [_ed2_path(x, y, terminal_symbol) for x, y in zip(xs, ys)]
+
+
+def reference_ins_targets(in_tokens, out_tokens, padding_idx, unk_idx):
+    # list-based label generation of the former CPU path
+    in_seq_len, out_seq_len = in_tokens.size(1), out_tokens.size(1)
+    in_tokens_list = [[t for t in s if t != padding_idx] for s in in_tokens.tolist()]
+    out_tokens_list = [[t for t in s if t != padding_idx] for s in out_tokens.tolist()]
+    full_labels = suggested_ed2_path(in_tokens_list, out_tokens_list, padding_idx)
+    mask_inputs = [[len(c) if c[0] != padding_idx else 0 for c in a[:-1]] for a in full_labels]
+
+    masked_tgt_masks = []
+    for mask_input in mask_inputs:
+        mask_label = []
+        for beam_size in mask_input[1:-1]:
+            mask_label += [0] + [1 for _ in range(beam_size)]
+        mask_label = mask_label + [0 for _ in range(out_seq_len - len(mask_label))]
+        masked_tgt_masks.append(mask_label[:out_seq_len])
+    mask_ins_targets = [
+        mask_input[1:-1] + [0 for _ in range(in_seq_len - 1 - len(mask_input[1:-1]))] for mask_input in mask_inputs
+    ]
+
+    masked_tgt_masks = torch.tensor(masked_tgt_masks).bool()
+    mask_ins_targets = torch.tensor(mask_ins_targets)
+    masked_tgt_tokens = out_tokens.masked_fill(masked_tgt_masks, unk_idx)
+    return masked_tgt_masks, masked_tgt_tokens, mask_ins_targets
+
+
+def reference_del_targets(in_tokens, out_tokens, padding_idx):
+    out_seq_len = out_tokens.size(1)
+    in_tokens_list = [[t for t in s if t != padding_idx] for s in in_tokens.tolist()]
+    out_tokens_list = [[t for t in s if t != padding_idx] for s in out_tokens.tolist()]
+    full_labels = suggested_ed2_path(in_tokens_list, out_tokens_list, padding_idx)
+    word_del_targets = [b[-1] for b in full_labels]
+    word_del_targets = [labels + [0 for _ in range(out_seq_len - len(labels))] for labels in word_del_targets]
+    return torch.tensor(word_del_targets)
+
+
+def random_batch(rng, bsz, vocab, max_len, noise):
+    # targets <bos> ... <eos> and noisy versions of them (random deletions, insertions and substitutions), padded
+    def pad(seqs):
+        width = max(len(s) for s in seqs)
+        return torch.tensor([s + [PAD] * (width - len(s)) for s in seqs])
+
+    out_seqs, in_seqs = [], []
+    for _ in range(bsz):
+        target = [0] + [rng.randrange(4, 4 + vocab) for _ in range(rng.randint(0, max_len))] + [2]
+        noisy = [target[0]]
+        for token in target[1:-1]:
+            r = rng.random()
+            if r < noise:
+                continue
+            if r < 2 * noise:
+                noisy.append(rng.randrange(4, 4 + vocab))
+            noisy.append(token)
+            if rng.random() < noise:
+                noisy.append(rng.randrange(4, 4 + vocab))
+        noisy.append(target[-1])
+        out_seqs.append(target)
+        in_seqs.append(noisy)
+    return pad(in_seqs), pad(out_seqs)
+
+
+def _without_libnat(monkeypatch):
+    monkeypatch.setattr(levenshtein_utils, "load_libnat", lambda: (None, False))
+
+
+def test_ins_targets(monkeypatch):
+    _without_libnat(monkeypatch)
+    rng = random.Random(0)
+    for vocab, noise in [(2, 0.3), (5, 0.2), (36, 0.1), (36, 0.5)]:
+        for _ in range(50):
+            in_tokens, out_tokens = random_batch(rng, rng.randint(1, 16), vocab, 25, noise)
+            expected = reference_ins_targets(in_tokens, out_tokens, PAD, UNK)
+            actual = _get_ins_targets(in_tokens, out_tokens, PAD, UNK)
+            for a, e in zip(actual, expected):
+                assert torch.equal(a, e)
+
+
+def test_del_targets(monkeypatch):
+    _without_libnat(monkeypatch)
+    rng = random.Random(1)
+    for vocab, noise in [(2, 0.3), (5, 0.2), (36, 0.1), (36, 0.5)]:
+        for _ in range(50):
+            in_tokens, out_tokens = random_batch(rng, rng.randint(1, 16), vocab, 25, noise)
+            # as in training: the deletion targets of the word predictions, which have the width of the targets
+            width = max(in_tokens.size(1), out_tokens.size(1))
+            in_tokens = torch.cat([in_tokens, in_tokens.new_full((in_tokens.size(0), width - in_tokens.size(1)), PAD)], 1)
+            out_tokens = torch.cat([out_tokens, out_tokens.new_full((out_tokens.size(0), width - out_tokens.size(1)), PAD)], 1)
+            expected = reference_del_targets(in_tokens, out_tokens, PAD)
+            actual = _get_del_targets(in_tokens, out_tokens, PAD)
+            assert torch.equal(actual, expected)
+
+
+def test_identical_and_empty(monkeypatch):
+    _without_libnat(monkeypatch)
+    tokens = torch.tensor([[0, 5, 6, 2], [0, 2, PAD, PAD], [0, 7, 2, PAD]])
+    empty = torch.tensor([[0, 2], [0, 2], [0, 2]])
+    for in_tokens, out_tokens in [(tokens, tokens), (empty, tokens), (tokens, empty)]:
+        for a, e in zip(_get_ins_targets(in_tokens, out_tokens, PAD, UNK), reference_ins_targets(in_tokens, out_tokens, PAD, UNK)):
+            assert torch.equal(a, e)
+    assert torch.equal(_get_del_targets(tokens, tokens, PAD), reference_del_targets(tokens, tokens, PAD))
+    assert not _get_del_targets(tokens, tokens, PAD).any()
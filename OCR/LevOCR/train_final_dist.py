@@ -171,7 +171,7 @@ def train(opt):
                 model.eval()
                 
                 with torch.no_grad():
-                    valid_loss, current_accuracys, char_preds, labels, infer_time, _, _ = validation(
+                    valid_loss, current_accuracys, char_preds, labels, infer_time, _, _, _ = validation(
                         model, criterion, valid_loader, converter, src_dict, opt)
                     char_accuracy = current_accuracys[0]
                 model.train()
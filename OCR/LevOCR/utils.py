@@ -127,6 +127,9 @@ def get_args(is_train=True):
                         default='0123456789abcdefghijklmnopqrstuvwxyz', help='character label')
     parser.add_argument('--sensitive', action='store_true', help='for sensitive character mode')
     parser.add_argument('--data_filtering_off', action='store_true', help='for data_filtering_off mode')
+    parser.add_argument('--index_cache_dir', default='', help='where to save the filtered index caches (default: inside each lmdb directory)')
+    parser.add_argument('--no_index_cache', action='store_true', help='filter the labels at every launch without caching the filtered index')
+    parser.add_argument('--index_workers', type=int, default=1, help='number of processes to build the filtered index of an lmdb')
     
     """ Model Architecture """
     parser.add_argument('--input_channel', type=int, default=3,
@@ -185,6 +188,7 @@ def get_args(is_train=True):
     parser.add_argument('--levt_model', default='') 
     parser.add_argument('--device', default='cuda:0') 
     parser.add_argument('--max_iter', default=2)
+    parser.add_argument('--iter_decode_force_max_iter', action='store_true', help='run all the refinement iterations, even for the samples whose tokens stopped changing')
     parser.add_argument('--post_process', default='subword_nmt')
     parser.add_argument('--th', type=float, default=0.5)
     
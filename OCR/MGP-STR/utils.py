@@ -161,6 +161,9 @@ def get_args(is_train=True):
     parser.add_argument('--sensitive', action='store_true', help='for sensitive character mode')
     parser.add_argument('--PAD', action='store_true', help='whether to keep ratio then pad for image resize')
     parser.add_argument('--data_filtering_off', action='store_true', help='for data_filtering_off mode')
+    parser.add_argument('--index_cache_dir', default='', help='where to save the filtered index caches (default: inside each lmdb directory)')
+    parser.add_argument('--no_index_cache', action='store_true', help='filter the labels at every launch without caching the filtered index')
+    parser.add_argument('--index_workers', type=int, default=1, help='number of processes to build the filtered index of an lmdb')
     
     """ Model Architecture """
     parser.add_argument('--Transformer', type=str, required=True, help='Transformer stage. mgp-str|char-str')
@@ -1,6 +1,7 @@
 import os
 import cv2
 import json
+import time
 import torch
 from tqdm import tqdm
 import numpy as np
@@ -11,15 +12,17 @@ from utils.visualize import visualize_decoded_result
 @torch.no_grad()
 def validate(model, dataloader, epoch, args):
     model.eval()
-    device = torch.device('cuda')
+    device = next(model.parameters()).device
     output_folder = os.path.join(args.output_folder, 'results', f'ep{epoch:03d}')
 
     results = []
     step = 0
+    num_images = 0
+    start_time = time.time()
     for samples, targets in tqdm(dataloader):
 
         step += 1
-        assert(len(targets) == 1) # Only support inference with batch size = 1
+        num_images += len(targets)
         samples = samples.to(device)
  
         if args.use_char_window_prompt:
@@ -30,35 +33,44 @@ def validate(model, dataloader, epoch, args):
         poly_seq = torch.ones(1, 1, dtype=torch.long).to(device) * args.poly_sos_index
         rec_seq = torch.ones(1, 1, dtype=torch.long).to(device) * args.rec_sos_index
 
-        seqs = [pt_seq, poly_seq, rec_seq, targets[0]['orig_size']]
-
-        output = model(samples, seqs)
-        if not output:
-            continue
-
-        if args.vie_categories > 0:
-            json_path = os.path.join(output_folder, targets[0]['file_name'] +'.json')
-            os.makedirs(os.path.dirname(json_path), exist_ok=True)
-            with open(json_path, 'w') as f:
-                json.dump(output, f)
+        # batch size > 1: the images are decoded together (the prompts are shared), one output per image
+        if len(targets) == 1:
+            seqs = [pt_seq, poly_seq, rec_seq, targets[0]['orig_size']]
+            outputs = [model(samples, seqs)]
         else:
-            pred_seqs, probs = output
-
-            pred_seqs = [pred_seq[0].cpu() for pred_seq in pred_seqs]
-            probs = probs[0].cpu()
-            
-            result = decode_pred_seq(pred_seqs, probs, targets[0], args)
-            results.extend(result)
-
-            if args.visualize:
-                image = cv2.imread(os.path.join(targets[0]['image_folder'], targets[0]['file_name']))
-                if 'polygons' in targets[0].keys():
-                    image = visualize_decoded_result(image, result, targets[0]['polygons'])
-                else:
-                    image = visualize_decoded_result(image, result, None)
-                save_path = os.path.join(output_folder, 'vis', targets[0]['file_name'])
-                os.makedirs(os.path.dirname(save_path), exist_ok=True)
-                cv2.imwrite(save_path, image)
+            seqs = [pt_seq, poly_seq, rec_seq, [target['orig_size'] for target in targets]]
+            outputs = model(samples, seqs)
+
+        for output, target in zip(outputs, targets):
+            if not output:
+                continue
+
+            if args.vie_categories > 0:
+                json_path = os.path.join(output_folder, target['file_name'] +'.json')
+                os.makedirs(os.path.dirname(json_path), exist_ok=True)
+                with open(json_path, 'w') as f:
+                    json.dump(output, f)
+            else:
+                pred_seqs, probs = output
+
+                pred_seqs = [pred_seq[0].cpu() for pred_seq in pred_seqs]
+                probs = probs[0].cpu()
+                
+                result = decode_pred_seq(pred_seqs, probs, target, args)
+                results.extend(result)
+
+                if args.visualize:
+                    image = cv2.imread(os.path.join(target['image_folder'], target['file_name']))
+                    if 'polygons' in target.keys():
+                        image = visualize_decoded_result(image, result, target['polygons'])
+                    else:
+                        image = visualize_decoded_result(image, result, None)
+                    save_path = os.path.join(output_folder, 'vis', target['file_name'])
+                    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+                    cv2.imwrite(save_path, image)
+
+    elapsed = time.time() - start_time
+    print(f'{num_images} images in {elapsed:.1f}s, {num_images / elapsed:.2f} images/sec')
 
     if args.vie_categories == 0:
         json_path = os.path.join(output_folder, targets[0]['dataset_name']+'.json')
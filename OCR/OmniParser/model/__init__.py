@@ -11,7 +11,7 @@ def build_model(args):
     transformer = build_transformer(args)
     model = OmniParser(backbone, transformer, args.num_classes, args.use_fpn)
 
-    device = torch.device('cuda')
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
     model = model.to(device)
     if args.distributed:
         model = torch.nn.SyncBatchNorm.convert_sync_batchnorm(model)
@@ -71,8 +71,53 @@ class Transformer(nn.Module):
             if p.dim() > 1:
                 nn.init.xavier_uniform_(p)
 
-    def decode(self, input_seq, memory, mask, pos_embed, input_type):
-        
+    def init_decode_state(self, memory, mask, pos_embed, input_type, memory_cache=None, memory_rows=None):
+        """
+        State of the incremental decoding of one batch of sequences (see decode): the self-attention keys/values
+        of each layer for the tokens decoded so far, and the cross-attention keys/values of the memory. The latter
+        are projected once per batch of images and decoder, and shared through memory_cache (a dict) by all the states.
+        The memory of one image is broadcast to all the sequences, the memories of several images are either aligned
+        with the sequences (one per sequence) or, if memory_rows is given, looked up by image index (sorted) per sequence.
+        Returns None (i.e., the whole prefix is re-decoded at every step) with --no_kv_cache.
+        """
+        if self.args.no_kv_cache:
+            return None
+
+        decoder = self.get_decoder(input_type)
+        if memory_cache is None:
+            memory_cache = {}
+        if input_type not in memory_cache:
+            memory_cache[input_type] = decoder.project_memory(memory, pos_embed)
+
+        memory_mask = torch.zeros(mask.shape, dtype=memory.dtype, device=memory.device).masked_fill(mask, float('-inf'))
+        return {'input_type': input_type, 'length': 0, 'memory_kv': memory_cache[input_type],
+                'memory_mask': memory_mask[:, None, None, :], 'self_kv': [None] * decoder.num_layers,
+                'memory_rows': memory_rows, 'memory_groups': _row_groups(memory_rows)}
+
+    def select_decode_rows(self, state, keep):
+        # drop the finished sequences from the batch of an incremental decoding state (keep: boolean mask over the sequences)
+        if state is None:
+            return
+        state['self_kv'] = [(k[:, keep], v[:, keep]) for k, v in state['self_kv']]
+        if state['memory_rows'] is not None:
+            state['memory_rows'] = state['memory_rows'][keep]
+            state['memory_groups'] = _row_groups(state['memory_rows'])
+        elif state['memory_mask'].shape[0] > 1:  # one memory per sequence
+            state['memory_kv'] = [(k[:, keep], v[:, keep]) for k, v in state['memory_kv']]
+            state['memory_mask'] = state['memory_mask'][keep]
+
+    def get_decoder(self, input_type):
+        if input_type == 'pt':
+            return self.pt_decoder
+        elif input_type == 'poly':
+            return self.poly_decoder
+        elif input_type == 'rec':
+            return self.rec_decoder
+
+    def decode(self, input_seq, memory, mask, pos_embed, input_type, state=None):
+        if state is not None:
+            return self.decode_incremental(input_seq, state)
+
         tgt, query_pos = self.embedding(input_seq, input_type)
         tgt = tgt.permute(1, 0, 2)
         query_pos = query_pos.permute(1, 0, 2)
@@ -98,12 +143,45 @@ class Transformer(nn.Module):
             pred = self.rec_pred_layer(hs[-1].transpose(0, 1))
 
         return pred
+
+    def decode_incremental(self, input_seq, state):
+        # inference only: only the tokens that are not in the cache yet (the whole prompt at the first step, then the last token) go through
+        # the decoder, the keys/values of the previous tokens are read from the cache; same predictions as decode() for these tokens
+        past_length = state['length']
+        tgt, query_pos = self.embedding(input_seq[:, past_length:], state['input_type'], past_length)
+        tgt = tgt.permute(1, 0, 2)
+        query_pos = query_pos.permute(1, 0, 2)
+
+        tgt_mask = None
+        if len(tgt) > 1:
+            tgt_mask = torch.full((len(tgt), past_length + len(tgt)), float('-inf'), device=tgt.device).triu(past_length + 1)
+
+        hs = self.get_decoder(state['input_type']).forward_incremental(tgt, state['memory_kv'], state['self_kv'], state['memory_mask'],
+                                                                     query_pos=query_pos, tgt_mask=tgt_mask,
+                                                                     memory_groups=state['memory_groups'])
+        state['length'] = input_seq.shape[1]
+
+        if state['input_type'] == 'pt':
+            pred = self.pt_pred_layer(hs[-1].transpose(0, 1))
+        elif state['input_type'] == 'poly':
+            pred = self.poly_pred_layer(hs[-1].transpose(0, 1))
+        elif state['input_type'] == 'rec':
+            pred = self.rec_pred_layer(hs[-1].transpose(0, 1))
+
+        return pred
     
-    def decode_pt_seq(self, input_seq, memory, mask, pos_embed):
+    def decode_pt_seq(self, input_seq, memory, mask, pos_embed, memory_cache=None):
+        # input_seq: one prompt per image (bs x prompt length); the sequences of all the images are decoded in one batch,
+        # and those that emit pt_eos_index are removed from the batch. Returns the point sequences and probabilities of each image.
+        bs = input_seq.shape[0]
         pt_seq = input_seq
-        pt_probs = []
+        pt_probs = torch.zeros(bs, 0, dtype=memory.dtype, device=memory.device)
+        rows = list(range(bs))  # image of each sequence in the batch
+        pt_seqs = [None] * bs
+        image_pt_probs = [None] * bs
+        state = self.init_decode_state(memory, mask, pos_embed, 'pt', memory_cache)
         for i in range(self.args.pt_seq_length):
-            pt_hs = self.decode(pt_seq, memory, mask, pos_embed, 'pt')
+            pt_hs = self.decode(pt_seq, memory, mask, pos_embed, 'pt', state)
             pt_out = pt_hs[:, -1, :]
             pt_out = pt_out.softmax(-1)
 
@@ -123,99 +201,167 @@ class Transformer(nn.Module):
                     pt_out[:, :-self.args.vie_categories] = 0
 
             pt_prob, pt_extra_seq = pt_out.topk(dim=-1, k=1)
-            if pt_extra_seq[0] == self.args.pt_eos_index:
-                break
+            finished = pt_extra_seq[:, 0] == self.args.pt_eos_index
+            if finished.any():
+                for row in finished.nonzero()[:, 0].tolist():
+                    pt_seqs[rows[row]] = pt_seq[row]
+                    image_pt_probs[rows[row]] = pt_probs[row]
+                keep = ~finished
+                rows = [image for image, done in zip(rows, finished.tolist()) if not done]
+                if len(rows) == 0:
+                    break
+                pt_seq, pt_probs, pt_prob, pt_extra_seq = pt_seq[keep], pt_probs[keep], pt_prob[keep], pt_extra_seq[keep]
+                self.select_decode_rows(state, keep)
             
             pt_seq = torch.cat([pt_seq, pt_extra_seq], dim=-1)
-            pt_probs.append(pt_prob)                
+            pt_probs = torch.cat([pt_probs, pt_prob], dim=-1)
 
-         # remove input prompt
-        if self.args.use_char_window_prompt:
-            pt_seq = pt_seq[:, 7:]
-        else:
-            pt_seq = pt_seq[:, 5:]
+        for row, image in enumerate(rows):
+            pt_seqs[image] = pt_seq[row]
+            image_pt_probs[image] = pt_probs[row]
 
-        if pt_seq.shape[1] % 2 != 0:
-            pt_seq = pt_seq[:, :-1]
-        
-        return pt_seq[0], pt_probs
+        for image in range(bs):
+            # remove input prompt
+            if self.args.use_char_window_prompt:
+                pt_seqs[image] = pt_seqs[image][7:]
+            else:
+                pt_seqs[image] = pt_seqs[image][5:]
 
-    def decode_vie_pt_poly_rec_seq(self, pt_seq, pt_probs, poly_prompt, rec_prompt, image_size, memory, mask, pos_embed):
+            if pt_seqs[image].shape[0] % 2 != 0:
+                pt_seqs[image] = pt_seqs[image][:-1]
+        
+        return pt_seqs, image_pt_probs
+
+    def split_vie_pt_seq(self, pt_seq):
+        # a VIE point sequence is made of text instances (two coordinates) followed by the class of their entity;
+        # returns the position of the first coordinate of each instance, and for each entity the position of its class
+        # and the number of instances up to it (the instances of an entity are those since the previous entity)
+        tokens = pt_seq.tolist()
+        instances = []
+        entities = []
         i = 0
-        result = []
-        tmp_recog = []
-        tmp_rect = []
-        while i < len(pt_seq):
-            if pt_seq[i].item() < self.args.num_bins:
-                if i + 1 <= len(pt_seq) - 1:
-                    if pt_seq[i+1].item() < self.args.num_bins:
-                        # decode poly
-                        poly_seq = torch.cat((pt_seq[i:i+2].unsqueeze(0), poly_prompt.repeat(1, 1)), dim=-1)
-                        for j in range(32):
-                            poly_hs = self.decode(poly_seq, memory, mask, pos_embed, 'poly')
-                            poly_out = poly_hs[:, -1, :-self.args.vie_categories]
-                            poly_out = poly_out.softmax(-1)
-                            poly_out = poly_out[:, :self.args.num_bins]
-
-                            poly_prob, poly_extra_seq = poly_out.topk(dim=-1, k=1)
-                            poly_seq = torch.cat([poly_seq, poly_extra_seq], dim=-1)
-
-                        image_h, image_w = image_size
-                        # remove prompt
-                        poly_seq = poly_seq[0,3:35].reshape(-1,2)
-                        min_x = image_w.item() * poly_seq[:,0].min().item() / self.args.num_bins
-                        min_y = image_h.item() * poly_seq[:,1].min().item() / self.args.num_bins
-                        max_x = image_w.item() * poly_seq[:,0].max().item() / self.args.num_bins
-                        max_y = image_h.item() * poly_seq[:,1].max().item() / self.args.num_bins
-
-                        # decode rec
-                        rec_seq = torch.cat((pt_seq[i:i+2].unsqueeze(0), rec_prompt.repeat(1, 1)), dim=-1)
-                        for j in range(self.args.rec_length):
-                            rec_hs = self.decode(rec_seq, memory, mask, pos_embed, 'rec')
-                            
-                            rec_out = rec_hs[:, -1, :-self.args.vie_categories]
-                            rec_out = rec_out.softmax(-1)
-
-                            rec_out[:, :self.args.num_bins] = 0
-                            rec_out[:, self.args.pt_eos_index] = 0
-                            rec_out[:, self.args.poly_eos_index] = 0
-                            rec_out[:, self.args.rec_eos_index+1:] = 0
-
-                            rec_prob, rec_extra_seq = rec_out.topk(dim=-1, k=1)
-                            rec_seq = torch.cat([rec_seq, rec_extra_seq], dim=-1)
-
-                        # remove start prompt
-                        rec_seq = rec_seq[0,3:]
-
-                        recog = []
-                        for k in range(len(rec_seq)):
-                            if rec_seq[k] == self.args.recog_pad_index:
-                                break 
-                            if rec_seq[k] == self.args.rec_eos_index:
-                                break
-                            if rec_seq[k] == self.args.recog_pad_index - 1:
-                                continue
-                            
-                            recog.append(self.args.chars[rec_seq[k] - self.args.num_bins])
-
-                        recog = ''.join(recog)
-                        tmp_recog.append(recog)
-                        tmp_rect.append([min_x, min_y, max_x, max_y])
-                        i += 2
-                    else:
-                        i += 1
-                        continue
+        while i < len(tokens):
+            if tokens[i] < self.args.num_bins:
+                if i + 1 <= len(tokens) - 1 and tokens[i+1] < self.args.num_bins:
+                    instances.append(i)
+                    i += 2
                 else:
                     i += 1
-                    continue
             else:
-                result.append((' '.join(tmp_recog), self.index2class[pt_seq[i].item()], pt_probs[i].item(), tmp_rect))
+                entities.append((i, len(instances)))
                 i += 1
-                tmp_recog = []
-                tmp_rect = []
+
+        return instances, entities
+
+    def assemble_vie_result(self, pt_seq, pt_probs, entities, output, image_size):
+        # output: polygons and texts of the instances of the image (see decode_poly_rec_seq), None if there are none
+        texts = []
+        rects = []
+        if output is not None:
+            image_h, image_w = image_size
+            polys = output[0][1].reshape(-1, 16, 2).double()
+            scale = torch.tensor([image_w.item(), image_h.item()], dtype=torch.float64, device=polys.device)
+            # bounding rectangles of the polygons, in pixels
+            rects = torch.cat([polys.min(1)[0] * scale, polys.max(1)[0] * scale], dim=-1) / self.args.num_bins
+            rects = rects.tolist()
+
+            for rec_seq in output[0][2][0].tolist():
+                recog = []
+                for index in rec_seq:
+                    if index == self.args.recog_pad_index:
+                        break 
+                    if index == self.args.rec_eos_index:
+                        break
+                    if index == self.args.recog_pad_index - 1:
+                        continue
+                    recog.append(self.args.chars[index - self.args.num_bins])
+                texts.append(''.join(recog))
+
+        tokens = pt_seq.tolist()
+        pt_probs = pt_probs.tolist()
+        result = []
+        start = 0
+        for i, end in entities:
+            result.append((' '.join(texts[start:end]), self.index2class[tokens[i]], pt_probs[i], rects[start:end]))
+            start = end
         
         return result
 
+    def decode_poly_rec_seq(self, pt_seqs, poly_prompt, rec_prompt, memory, mask, pos_embed, memory_cache=None, vie=False):
+        # the polygons and the texts of the instances of all the images are decoded in one batch, the instances are
+        # grouped by image and attend to the memory of their image; an instance leaves the batch of the recognition
+        # decoder as soon as it emits rec_eos_index (or recog_pad_index), its remaining tokens are filled with rec_eos_index
+        bs = len(pt_seqs)
+        pt_seqs = [pt_seq.reshape(-1, 2) for pt_seq in pt_seqs]
+        text_nums = [pt_seq.shape[0] for pt_seq in pt_seqs]
+        num_logits = -self.args.vie_categories if vie else None  # the entity classes are not predicted by the polygon and text decoders
+        pt_seq = torch.cat(pt_seqs)
+        pred_text_nums = pt_seq.shape[0]
+        if pred_text_nums == 0:
+            return [None] * bs
+
+        memory_rows = None
+        if bs > 1:
+            memory_rows = torch.repeat_interleave(torch.arange(bs, device=pt_seq.device), torch.tensor(text_nums, device=pt_seq.device))
+
+        # decode polygons
+        poly_seq = torch.cat((pt_seq, poly_prompt.repeat(pred_text_nums, 1)), dim=-1)
+        poly_probs = []
+        state = self.init_decode_state(memory, mask, pos_embed, 'poly', memory_cache, memory_rows)
+        for i in range(32):
+            poly_hs = self.decode(poly_seq, memory, mask, pos_embed, 'poly', state)
+            
+            poly_out = poly_hs[:, -1, :num_logits]
+            poly_out = poly_out.softmax(-1)
+            poly_out = poly_out[:, :self.num_bins]
+
+            poly_prob, poly_extra_seq = poly_out.topk(dim=-1, k=1)
+            poly_seq = torch.cat([poly_seq, poly_extra_seq], dim=-1)
+            poly_probs.append(poly_prob) 
+
+        poly_seq = poly_seq[:,3:35]
+
+        # decode rec
+        rec_seq = torch.cat((pt_seq, rec_prompt.repeat(pred_text_nums, 1)), dim=-1)
+        rec_seqs = torch.full((pred_text_nums, self.args.rec_length), self.args.rec_eos_index, dtype=torch.long, device=pt_seq.device)
+        rec_probs = torch.zeros(pred_text_nums, self.args.rec_length, dtype=memory.dtype, device=memory.device)
+        rows = torch.arange(pred_text_nums, device=pt_seq.device)  # instance of each sequence in the batch
+        state = self.init_decode_state(memory, mask, pos_embed, 'rec', memory_cache, memory_rows)
+        for i in range(self.args.rec_length):
+            rec_hs = self.decode(rec_seq, memory, mask, pos_embed, 'rec', state)
+            
+            rec_out = rec_hs[:, -1, :num_logits]
+            rec_out = rec_out.softmax(-1)
+            rec_out[:, :self.num_bins] = 0
+            rec_out[:, self.args.pt_eos_index] = 0
+            rec_out[:, self.args.poly_eos_index] = 0
+            rec_out[:, self.args.rec_eos_index+1:] = 0
+
+            rec_prob, rec_extra_seq = rec_out.topk(dim=-1, k=1)
+            rec_seqs[rows, i] = rec_extra_seq[:, 0]
+            rec_probs[rows, i] = rec_prob[:, 0]
+
+            # early termination: the tokens after the end of a text are ignored by decode_seq
+            unfinished = (rec_extra_seq[:, 0] != self.args.rec_eos_index) & (rec_extra_seq[:, 0] != self.args.recog_pad_index)
+            if not unfinished.all():
+                if not unfinished.any():
+                    break
+                rows, rec_seq, rec_extra_seq = rows[unfinished], rec_seq[unfinished], rec_extra_seq[unfinished]
+                self.select_decode_rows(state, unfinished)
+            rec_seq = torch.cat([rec_seq, rec_extra_seq], dim=-1)
+
+        results = []
+        start = 0
+        for text_num in text_nums:
+            if text_num == 0:
+                results.append(None)
+                continue
+            index = slice(start, start + text_num)
+            results.append([[pt_seq[index].reshape(1,-1), poly_seq[index].reshape(1,-1), rec_seqs[index].unsqueeze(0)], [rec_probs[index]]])
+            start += text_num
+
+        return results
+
     def forward(self, src, mask, pos_embed, seq):
         # flatten NxCxHxW to HWxNxC
         bs, c, h, w = src.shape
@@ -232,58 +378,31 @@ class Transformer(nn.Module):
 
             return pred_pt, pred_poly, pred_rec
         else:
-            pt_prompt = seq[0]
+            # batched inference: the images of the batch are decoded together and one output (None: no text) is returned per image;
+            # with a single image, its output is returned directly
+            assert bs == 1 or not self.args.no_kv_cache, 'inference with batch size > 1 requires the key/value cache'
+            pt_prompt = seq[0].expand(bs, -1)
             poly_prompt = seq[1]
             rec_prompt = seq[2]
-            pt_seq, pt_probs = self.decode_pt_seq(pt_prompt, memory, mask, pos_embed)
+            memory_cache = {}  # cross-attention keys/values of the memory, projected once per decoder
+            pt_seqs, pt_probs = self.decode_pt_seq(pt_prompt, memory, mask, pos_embed, memory_cache)
 
-            if pt_seq.numel() == 0:
-                return None
-                
             if self.args.infer_vie:
-                image_size = seq[3]
-                result = self.decode_vie_pt_poly_rec_seq(pt_seq, pt_probs, poly_prompt, rec_prompt, image_size, memory, mask, pos_embed)
-                return result
+                # the instances of all the entities (and images) are decoded in one batch, then grouped into entities
+                image_sizes = [seq[3]] if bs == 1 else seq[3]
+                splits = [self.split_vie_pt_seq(pt_seq) for pt_seq in pt_seqs]
+                instance_pts = [pt_seq[torch.tensor(instances, dtype=torch.long, device=pt_seq.device).reshape(-1, 1) + torch.arange(2, device=pt_seq.device)]
+                                for pt_seq, (instances, _) in zip(pt_seqs, splits)]
+                outputs = self.decode_poly_rec_seq(instance_pts, poly_prompt, rec_prompt, memory, mask, pos_embed, memory_cache, vie=True)
+                results = [None if pt_seq.numel() == 0 else self.assemble_vie_result(pt_seq, probs, entities, output, image_size)
+                           for pt_seq, probs, (_, entities), output, image_size in zip(pt_seqs, pt_probs, splits, outputs, image_sizes)]
             else:
-                # decode polygons
-                pt_seq = pt_seq.reshape(-1, 2)
-                pred_text_nums = pt_seq.shape[0]
-                print('pred_text_nums', pred_text_nums)
-                poly_seq = torch.cat((pt_seq, poly_prompt.repeat(pred_text_nums, 1)), dim=-1)
-                poly_probs = []
-                for i in range(32):
-                    poly_hs = self.decode(poly_seq, memory, mask, pos_embed, 'poly')
-                    
-                    poly_out = poly_hs[:, -1, :]
-                    poly_out = poly_out.softmax(-1)
-                    poly_out = poly_out[:, :self.num_bins]
-
-                    poly_prob, poly_extra_seq = poly_out.topk(dim=-1, k=1)
-                    poly_seq = torch.cat([poly_seq, poly_extra_seq], dim=-1)
-                    poly_probs.append(poly_prob) 
-
-                poly_seq = poly_seq[:,3:35]
-
-                # decode rec
-                rec_seq = torch.cat((pt_seq, rec_prompt.repeat(pred_text_nums, 1)), dim=-1)
-                rec_probs = []
-                for i in range(self.args.rec_length):
-                    rec_hs = self.decode(rec_seq, memory, mask, pos_embed, 'rec')
-                    
-                    rec_out = rec_hs[:, -1, :]
-                    rec_out = rec_out.softmax(-1)
-                    rec_out[:, :self.num_bins] = 0
-                    rec_out[:, self.args.pt_eos_index] = 0
-                    rec_out[:, self.args.poly_eos_index] = 0
-                    rec_out[:, self.args.rec_eos_index+1:] = 0
-
-                    rec_prob, rec_extra_seq = rec_out.topk(dim=-1, k=1)
-                    rec_seq = torch.cat([rec_seq, rec_extra_seq], dim=-1)
-                    rec_probs.append(rec_prob)        
-
-                rec_seq = rec_seq[:,3:].unsqueeze(0)
-
-                return [pt_seq.reshape(1,-1), poly_seq.reshape(1,-1), rec_seq], [torch.cat(rec_probs, dim=-1)]
+                for pt_seq in pt_seqs:
+                    if pt_seq.numel() > 0:
+                        print('pred_text_nums', pt_seq.numel() // 2)
+                results = self.decode_poly_rec_seq(pt_seqs, poly_prompt, rec_prompt, memory, mask, pos_embed, memory_cache)
+
+            return results[0] if bs == 1 else results
 
 
 class DecoderEmbeddings(nn.Module):
@@ -299,13 +418,14 @@ class DecoderEmbeddings(nn.Module):
         self.LayerNorm = torch.nn.LayerNorm(hidden_dim)
         self.dropout = nn.Dropout(dropout)
 
-    def forward(self, x, input_type):
+    def forward(self, x, input_type, past_length=0):
         input_shape = x.size()
         seq_length = input_shape[1]
         batch_size = input_shape[0]
         device = x.device
 
-        position_ids = torch.arange(seq_length, dtype=torch.long, device=device)
+        # past_length: number of tokens preceding x (incremental decoding)
+        position_ids = torch.arange(past_length, past_length + seq_length, dtype=torch.long, device=device)
         
         input_word_embeddings = []
         input_pos_embeddings = []
@@ -377,6 +497,26 @@ class TransformerDecoder(nn.Module):
 
         return output.unsqueeze(0)
 
+    def project_memory(self, memory, pos):
+        return [layer.project_memory(memory, pos) for layer in self.layers]
+
+    def forward_incremental(self, tgt, memory_kv, self_kv, memory_mask,
+                            query_pos: Optional[Tensor] = None,
+                            tgt_mask: Optional[Tensor] = None,
+                            memory_groups=None):
+        # self_kv is updated in place with the keys/values of tgt; only the output of the last layer is returned
+        output = tgt
+
+        for i, layer in enumerate(self.layers):
+            output, self_kv[i] = layer.forward_incremental(output, memory_kv[i], self_kv[i], memory_mask,
+                                                           query_pos=query_pos, tgt_mask=tgt_mask,
+                                                           memory_groups=memory_groups)
+
+        if self.norm is not None:
+            output = self.norm(output)
+
+        return output.unsqueeze(0)
+
 
 class TransformerDecoderLayer(nn.Module):
 
@@ -467,6 +607,85 @@ class TransformerDecoderLayer(nn.Module):
                                  tgt_key_padding_mask, memory_key_padding_mask, pos, query_pos)
 
 
+    def project_memory(self, memory, pos: Optional[Tensor] = None):
+        # cross-attention keys/values of the memory (the same for all the decoding steps)
+        return (_in_projection(self.multihead_attn, self.with_pos_embed(memory, pos), 1),
+                _in_projection(self.multihead_attn, memory, 2))
+
+    def self_attention_incremental(self, tgt, self_kv, query_pos: Optional[Tensor] = None, tgt_mask: Optional[Tensor] = None):
+        q = k = self.with_pos_embed(tgt, query_pos)
+        q = _in_projection(self.self_attn, q, 0)
+        k = _in_projection(self.self_attn, k, 1)
+        v = _in_projection(self.self_attn, tgt, 2)
+        if self_kv is not None:
+            k = torch.cat([self_kv[0], k])
+            v = torch.cat([self_kv[1], v])
+        return _multi_head_attention(self.self_attn, q, k, v, tgt_mask), (k, v)
+
+    def cross_attention_incremental(self, tgt, memory_kv, memory_mask, query_pos: Optional[Tensor] = None, memory_groups=None):
+        q = _in_projection(self.multihead_attn, self.with_pos_embed(tgt, query_pos), 0)
+        if memory_groups is None:
+            return _multi_head_attention(self.multihead_attn, q, memory_kv[0], memory_kv[1], memory_mask)
+
+        # sequences of several images (see _row_groups): each group attends to the memory of its image
+        return torch.cat([_multi_head_attention(self.multihead_attn, q[:, start:end], memory_kv[0][:, image:image+1],
+                                                memory_kv[1][:, image:image+1], memory_mask[image:image+1])
+                          for image, start, end in memory_groups], dim=1)
+
+    def forward_incremental(self, tgt, memory_kv, self_kv, memory_mask,
+                            query_pos: Optional[Tensor] = None,
+                            tgt_mask: Optional[Tensor] = None,
+                            memory_groups=None):
+        # same as forward() in eval mode for the new tokens tgt, given the keys/values of the previous tokens (self_kv)
+        # and of the memory (memory_kv, see project_memory); returns the output and the updated self_kv
+        if self.normalize_before:
+            tgt2 = self.norm1(tgt)
+            tgt2, self_kv = self.self_attention_incremental(tgt2, self_kv, query_pos, tgt_mask)
+            tgt = tgt + tgt2
+            tgt2 = self.norm2(tgt)
+            tgt = tgt + self.cross_attention_incremental(tgt2, memory_kv, memory_mask, query_pos, memory_groups)
+            tgt2 = self.norm3(tgt)
+            tgt = tgt + self.linear2(self.activation(self.linear1(tgt2)))
+        else:
+            tgt2, self_kv = self.self_attention_incremental(tgt, self_kv, query_pos, tgt_mask)
+            tgt = self.norm1(tgt + tgt2)
+            tgt = self.norm2(tgt + self.cross_attention_incremental(tgt, memory_kv, memory_mask, query_pos, memory_groups))
+            tgt2 = self.linear2(self.activation(self.linear1(tgt)))
+            tgt = self.norm3(tgt + tgt2)
+        return tgt, self_kv
+
+
+def _in_projection(attn, x, index):
+    # index 0/1/2: query/key/value input projection of nn.MultiheadAttention
+    d_model = attn.embed_dim
+    return F.linear(x, attn.in_proj_weight[index * d_model:(index + 1) * d_model],
+                    attn.in_proj_bias[index * d_model:(index + 1) * d_model])
+
+
+def _multi_head_attention(attn, q, k, v, mask=None):
+    # q: L x N x E, k/v: S x N' x E (projected; N' = 1 is broadcast over the batch), mask: additive, broadcastable to N x nhead x L x S
+    tgt_len, batch_size, d_model = q.shape
+    head_dim = d_model // attn.num_heads
+    q = q.reshape(tgt_len, batch_size, attn.num_heads, head_dim).permute(1, 2, 0, 3) * (head_dim ** -0.5)
+    k = k.reshape(k.shape[0], k.shape[1], attn.num_heads, head_dim).permute(1, 2, 3, 0)
+    v = v.reshape(v.shape[0], v.shape[1], attn.num_heads, head_dim).permute(1, 2, 0, 3)
+    weights = torch.matmul(q, k)
+    if mask is not None:
+        weights = weights + mask
+    output = torch.matmul(weights.softmax(dim=-1), v)
+    output = output.permute(2, 0, 1, 3).reshape(tgt_len, batch_size, d_model)
+    return attn.out_proj(output)
+
+
+def _row_groups(memory_rows):
+    # memory_rows: image index of each sequence (sorted) -> [(image, first sequence, last sequence + 1)] for each image
+    if memory_rows is None:
+        return None
+    images, counts = torch.unique_consecutive(memory_rows, return_counts=True)
+    ends = counts.cumsum(0).tolist()
+    return [(image, end - count, end) for image, count, end in zip(images.tolist(), counts.tolist(), ends)]
+
+
 def _get_clones(module, N):
     return nn.ModuleList([copy.deepcopy(module) for i in range(N)])
 
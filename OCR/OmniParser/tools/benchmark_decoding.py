@@ -0,0 +1,122 @@
+import sys
+sys.path.append('.')
+
+import time
+import torch
+
+from model.transformer import build_transformer
+
+# Decoding throughput (tokens/sec) of the pt/poly/rec decoders with and without the key/value cache, on a random memory
+# (or on the transformer weights of a checkpoint with --resume), and check that both produce the same sequences.
+# With --batch_size > 1, also compare the throughput (images/sec) of batched inference with one image at a time.
+# python tools/benchmark_decoding.py --tfm_pre_norm --use_char_window_prompt [--resume ckpt_path] [--infer_vie --vie_categories 29 --val_dataset cord_val] [--batch_size 8]
+
+def count_tokens(transformer):
+    # wrap decode() to count the number of tokens generated by the decoding loops (one per sequence and call)
+    counter = {'tokens': 0}
+    decode = transformer.decode
+
+    def counting_decode(input_seq, *args, **kwargs):
+        counter['tokens'] += input_seq.shape[0]
+        return decode(input_seq, *args, **kwargs)
+
+    transformer.decode = counting_decode
+    return counter
+
+
+def build_inputs(args, device, bs=1):
+    memory = torch.randn(bs, args.tfm_hidden_dim, args.memory_h, args.memory_w, device=device)
+    pos_embed = torch.randn(bs, args.tfm_hidden_dim, args.memory_h, args.memory_w, device=device)
+    mask = torch.zeros(bs, args.memory_h, args.memory_w, dtype=torch.bool, device=device)
+    for i in range(bs):
+        mask[i, :, args.memory_w * (3 + i % 2) // 5:] = True  # padded area, of a different width for every other image
+
+    if args.use_char_window_prompt:
+        pt_seq = torch.tensor([[0, 0, args.num_bins - 1, args.num_bins - 1, args.num_bins, args.num_bins + len(args.chars), args.pt_sos_index]], dtype=torch.long, device=device)
+    else:
+        pt_seq = torch.tensor([[0, 0, args.num_bins - 1, args.num_bins - 1, args.pt_sos_index]], dtype=torch.long, device=device)
+    poly_seq = torch.ones(1, 1, dtype=torch.long, device=device) * args.poly_sos_index
+    rec_seq = torch.ones(1, 1, dtype=torch.long, device=device) * args.rec_sos_index
+    image_size = torch.tensor([args.memory_h * 32, args.memory_w * 32], device=device)
+    if bs > 1:
+        image_size = [image_size] * bs
+
+    return memory, mask, pos_embed, [pt_seq, poly_seq, rec_seq, image_size]
+
+
+def same_outputs(output_a, output_b, infer_vie):
+    if output_a is None or output_b is None:
+        return output_a is None and output_b is None
+    # decoded sequences must be identical, probabilities may differ in the last bits (different summation orders)
+    if infer_vie:
+        return len(output_a) == len(output_b) and \
+            all(a[0:2] == b[0:2] and a[3] == b[3] and abs(a[2] - b[2]) <= 1e-5 * abs(a[2]) for a, b in zip(output_a, output_b))
+    return all(torch.equal(a, b) for a, b in zip(output_a[0], output_b[0]))
+
+
+@torch.no_grad()
+def main(args):
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    torch.manual_seed(args.seed)
+
+    transformer = build_transformer(args)
+    if args.resume != '':
+        state_dict = torch.load(args.resume, map_location='cpu')
+        state_dict = state_dict.get('model', state_dict)
+        transformer.load_state_dict({k[len('transformer.'):]: v for k, v in state_dict.items() if k.startswith('transformer.')})
+    transformer = transformer.to(device).eval()
+    counter = count_tokens(transformer)
+
+    memory, mask, pos_embed, seqs = build_inputs(args, device)
+
+    outputs = {}
+    for no_kv_cache in [True, False]:
+        args.no_kv_cache = no_kv_cache
+        name = 'no cache' if no_kv_cache else 'kv cache'
+
+        transformer(memory, mask, pos_embed, seqs)  # warm up
+        counter['tokens'] = 0
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        start = time.time()
+        outputs[name] = transformer(memory, mask, pos_embed, seqs)
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        elapsed = time.time() - start
+        print(f'{name}: {counter["tokens"]} tokens in {elapsed:.3f}s, {counter["tokens"] / elapsed:.1f} tokens/sec')
+
+    print('same outputs:', same_outputs(outputs['no cache'], outputs['kv cache'], args.infer_vie))
+
+    if args.batch_size > 1:
+        args.no_kv_cache = False
+        memory, mask, pos_embed, seqs = build_inputs(args, device, args.batch_size)
+        image_seqs = seqs[:3] + [seqs[3][0]]
+
+        def one_by_one():
+            return [transformer(memory[i:i+1], mask[i:i+1], pos_embed[i:i+1], image_seqs) for i in range(args.batch_size)]
+
+        def batched():
+            return transformer(memory, mask, pos_embed, seqs)
+
+        outputs = {}
+        for name, run in [('one by one', one_by_one), (f'batch of {args.batch_size}', batched)]:
+            if device.type == 'cuda':
+                torch.cuda.synchronize()
+            start = time.time()
+            outputs[name] = run()
+            if device.type == 'cuda':
+                torch.cuda.synchronize()
+            elapsed = time.time() - start
+            print(f'{name}: {args.batch_size} images in {elapsed:.3f}s, {args.batch_size / elapsed:.2f} images/sec')
+
+        print('same outputs:', all(same_outputs(a, b, args.infer_vie) for a, b in zip(*outputs.values())))
+
+if __name__ == '__main__':
+    from utils.parser import DefaultParser
+
+    parser = DefaultParser()
+    parser.add_argument('--memory_h', type=int, default=30)
+    parser.add_argument('--memory_w', type=int, default=30)
+    args = parser.parse_args()
+
+    main(args)
@@ -76,6 +76,7 @@ class DefaultParser(object):
         # Inference Parameters
         parser.add_argument('--visualize', action='store_true')
         parser.add_argument('--infer_vie', action='store_true')
+        parser.add_argument('--no_kv_cache', action='store_true') # re-decode the whole prefix at every step instead of caching the keys/values
 
         # Distributed Parameters 
         parser.add_argument('--local_rank', type=int, default=0)
@@ -1,8 +1,10 @@
 import random
 import torch
-import io
+import hashlib
+import numpy as np
 import pyarrow as pa
 import os
+from glob import glob
 from PIL import Image
 
 from torchvision import transforms
@@ -60,10 +62,26 @@ class SynthTextDataset(torch.utils.data.Dataset):
             tokenizer=self.tokenizer, mlm=True, mlm_probability=_config["mlm_prob"]
         )
 
-        self.table = pa.ipc.RecordBatchFileReader(
-                pa.memory_map(f"{self.data_dir}/synthtext_{self.split}.arrow", "r")
-            ).read_all()
+        # a single file, or the shards written by write_synthtext_pyarrow.py --shard_size
+        paths = sorted(glob(f"{self.data_dir}/synthtext_{self.split}_*.arrow")) or \
+            [f"{self.data_dir}/synthtext_{self.split}.arrow"]
+        self.table = pa.concat_tables([
+            pa.ipc.RecordBatchFileReader(pa.memory_map(path, "r")).read_all() for path in paths
+        ])
         self.all_texts = self.table[self.text_column_name].to_pandas().tolist()
+        self.binary_indices = dict()
+
+        # the captions are tokenized once (in batches) and cached next to the arrow files
+        key = "|".join([self.tokenizer.name_or_path, str(self.max_text_len)] +
+                       [f"{os.path.abspath(path)}:{os.stat(path).st_mtime_ns}:{os.stat(path).st_size}" for path in paths])
+        cache_path = f"{self.data_dir}/synthtext_{self.split}_tokens_{hashlib.sha1(key.encode()).hexdigest()[:16]}"
+        if not torch.distributed.is_initialized() or torch.distributed.get_rank() == 0:
+            if not os.path.exists(f"{cache_path}_ids.npy"):
+                self.tokenize_captions(cache_path)
+        if torch.distributed.is_initialized():
+            torch.distributed.barrier()
+        self.text_ids = np.load(f"{cache_path}_ids.npy", mmap_mode="r")
+        self.text_lens = np.load(f"{cache_path}_lens.npy", mmap_mode="r")
 
     @property
     def corpus(self):
@@ -72,9 +90,52 @@ class SynthTextDataset(torch.utils.data.Dataset):
     def __len__(self):
         return len(self.all_texts)
 
+    def tokenize_captions(self, cache_path, batch_size=10000):
+        ids = np.zeros((len(self.all_texts), self.max_text_len), dtype=np.int32)
+        lens = np.zeros(len(self.all_texts), dtype=np.int16)
+        for start in range(0, len(self.all_texts), batch_size):
+            encodings = self.tokenizer(
+                [texts[0] for texts in self.all_texts[start:start + batch_size]],
+                padding="max_length",
+                truncation=True,
+                max_length=self.max_text_len,
+            )
+            ids[start:start + batch_size] = encodings["input_ids"]
+            lens[start:start + batch_size] = np.sum(encodings["attention_mask"], axis=1)
+
+        # write to temporary files first, so that concurrent launches never read a partial cache
+        for name, array in [("lens", lens), ("ids", ids)]:
+            tmp_path = f"{cache_path}_{name}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp_path, f"{cache_path}_{name}.npy")
+
+    def get_binary_index(self, key):
+        # O(1) row lookup in the chunked column: chunk of every row, row within the chunk,
+        # and per chunk the value offsets and the data buffer (memory-mapped, not copied)
+        if key not in self.binary_indices:
+            chunks = self.table[key].chunks
+            lengths = [len(chunk) for chunk in chunks]
+            row_chunks = np.repeat(np.arange(len(chunks), dtype=np.int32), lengths)
+            row_offsets = np.arange(len(row_chunks), dtype=np.int64) - np.repeat(np.cumsum([0] + lengths[:-1]), lengths)
+            buffers = []
+            for chunk in chunks:
+                offset_type = np.int64 if pa.types.is_large_binary(chunk.type) else np.int32
+                _, offsets, data = chunk.buffers()
+                offsets = np.frombuffer(offsets, dtype=offset_type)[chunk.offset:chunk.offset + len(chunk) + 1] \
+                    if offsets is not None else None
+                buffers.append((offsets, memoryview(data) if data is not None else None))
+            self.binary_indices[key] = (row_chunks, row_offsets, buffers)
+        return self.binary_indices[key]
+
+    def get_image_bytes(self, index, image_key="image"):
+        row_chunks, row_offsets, buffers = self.get_binary_index(image_key)
+        offsets, data = buffers[row_chunks[index]]
+        row = row_offsets[index]
+        return data[offsets[row]:offsets[row + 1]]
+
     def get_image(self, index, image_key="image"):
-        image_bytes = io.BytesIO(self.table[image_key][index].as_py())
-        image_bytes.seek(0)
+        image_bytes = pa.BufferReader(self.get_image_bytes(index, image_key))
         image = Image.open(image_bytes).convert("RGB")
         image_tensor = self.transforms(image)
         return {
@@ -84,13 +145,16 @@ class SynthTextDataset(torch.utils.data.Dataset):
 
     def get_text(self, index):
         text = self.all_texts[index][0]
-        encoding = self.tokenizer(
-            text,
-            padding="max_length",
-            truncation=True,
-            max_length=self.max_text_len,
-            return_special_tokens_mask=True,
-        )
+        # same as self.tokenizer(text, padding="max_length", truncation=True, max_length=self.max_text_len,
+        # return_special_tokens_mask=True), from the cached token ids: [CLS] tokens [SEP] [PAD]...
+        length = int(self.text_lens[index])
+        attention_mask = [1] * length + [0] * (self.max_text_len - length)
+        encoding = {
+            "input_ids": self.text_ids[index].tolist(),
+            "token_type_ids": [0] * self.max_text_len,
+            "attention_mask": attention_mask,
+            "special_tokens_mask": [1] + [0] * (length - 2) + [1] * (self.max_text_len - length + 1),
+        }
         return {
             "text": (text, encoding),
             "index": index,
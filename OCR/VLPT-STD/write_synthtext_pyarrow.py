@@ -1,58 +1,140 @@
-import json
+import argparse
 import os
-import pandas as pd
 import pyarrow as pa
 import scipy.io as sio
 import random
 
-from tqdm import tqdm
 from glob import glob
-from collections import defaultdict
+from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor
 
 
-dataset_root = './data'
+# same columns as the former pandas DataFrame, read by SynthTextDataset
+schema = pa.schema([
+    ("image", pa.binary()),
+    ("caption", pa.list_(pa.string())),
+    ("image_id", pa.string()),
+    ("split", pa.string()),
+])
 
-gts = sio.loadmat(f"{dataset_root}/SynthText/gt.mat")
-img_names = gts['imnames'][0]
 
-bs = []
-for i in tqdm(range(len(img_names))):
-    if i > 1000:
-        break
-    img_name = img_names[i][0]
-    
+def get_caption(txt_ann):
     word_ann = []
-    txt_ann = gts['txt'][0][i]
-
     for j in range(len(txt_ann)):
         bbox_ann = txt_ann[j].split('\n')
         for k in range(len(bbox_ann)):
             word_ann.extend(bbox_ann[k].strip().split(' '))
-    
-    word_ann = ' '.join(word_ann)
-
-    # 4% for val
-    if random.uniform(0,1) > 0.04:
-        split = 'train'
-    else:
-        split = 'val'
-
-    with open(f"{dataset_root}/SynthText/{img_name}", "rb") as fp:
-        binary = fp.read()
-    
-    bs.append([binary, [word_ann], img_name, split])
-
-for split in ["train", "val"]:
-    batches = [b for b in bs if b[-1] == split]
-
-    dataframe = pd.DataFrame(
-        batches, columns=["image", "caption", "image_id", "split"],
-    )
-
-    table = pa.Table.from_pandas(dataframe)
-    os.makedirs(dataset_root, exist_ok=True)
-    with pa.OSFile(
-        f"{dataset_root}/synthtext_{split}.arrow", "wb"
-    ) as sink:
-        with pa.RecordBatchFileWriter(sink, table.schema) as writer:
-            writer.write_table(table)
+
+    return ' '.join(word_ann)
+
+
+def read_binary(path):
+    with open(path, "rb") as fp:
+        return fp.read()
+
+
+class ShardedWriter:
+    """Writes the record batches of a split to synthtext_{split}.arrow, or to synthtext_{split}_{shard:03d}.arrow
+    files of at most shard_size images each if shard_size > 0. The files of the split written by a former run are
+    removed first, since SynthTextDataset loads all shards of a split (and prefers them to the single file)."""
+
+    def __init__(self, dataset_root, split, shard_size=0):
+        self.dataset_root = dataset_root
+        self.split = split
+        self.shard_size = shard_size
+        self.shard = 0
+        self.rows_in_shard = 0
+        self.sink = None
+        self.writer = None
+        for path in glob(f"{dataset_root}/synthtext_{split}_*.arrow") + glob(f"{dataset_root}/synthtext_{split}.arrow"):
+            os.remove(path)
+
+    def _open(self):
+        if self.shard_size > 0:
+            path = f"{self.dataset_root}/synthtext_{self.split}_{self.shard:03d}.arrow"
+        else:
+            path = f"{self.dataset_root}/synthtext_{self.split}.arrow"
+        self.sink = pa.OSFile(path, "wb")
+        self.writer = pa.RecordBatchFileWriter(self.sink, schema)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.sink.close()
+            self.writer = None
+            self.shard += 1
+            self.rows_in_shard = 0
+
+    def finish(self):
+        if self.shard == 0 and self.writer is None:
+            self._open()  # an empty file for a split without images
+        self.close()
+
+    def write(self, rows):
+        while len(rows) > 0:
+            if self.writer is None:
+                self._open()
+            n = len(rows) if self.shard_size <= 0 else min(len(rows), self.shard_size - self.rows_in_shard)
+            batch = pa.record_batch([pa.array(column, type=field.type) for column, field in zip(zip(*rows[:n]), schema)], schema=schema)
+            self.writer.write_batch(batch)
+            self.rows_in_shard += n
+            rows = rows[n:]
+            if self.shard_size > 0 and self.rows_in_shard == self.shard_size:
+                self.close()
+
+
+def main(args):
+    # the word boxes are not needed, only load the image names and texts
+    gts = sio.loadmat(f"{args.dataset_root}/SynthText/gt.mat", variable_names=["imnames", "txt"])
+    img_names = gts['imnames'][0]
+    num_images = len(img_names) if args.max_images <= 0 else min(len(img_names), args.max_images)
+
+    rng = random.Random(args.seed)
+    os.makedirs(args.dataset_root, exist_ok=True)
+    writers = {split: ShardedWriter(args.dataset_root, split, args.shard_size) for split in ["train", "val"]}
+
+    def read_batch(start):
+        indices = range(start, min(start + args.batch_size, num_images))
+        paths = [f"{args.dataset_root}/SynthText/{img_names[i][0]}" for i in indices]
+        return indices, executor.map(read_binary, paths)
+
+    # the images of a record batch are read by the thread pool while the previous batch is written,
+    # so that at most two batches of images are in memory
+    with ThreadPoolExecutor(max_workers=args.num_threads) as executor, tqdm(total=num_images) as pbar:
+        starts = range(0, num_images, args.batch_size)
+        pending = read_batch(starts[0]) if len(starts) > 0 else None
+        for k in range(len(starts)):
+            indices, binaries = pending
+            binaries = list(binaries)
+            if k + 1 < len(starts):
+                pending = read_batch(starts[k + 1])
+
+            rows = {"train": [], "val": []}
+            for i, binary in zip(indices, binaries):
+                img_name = img_names[i][0]
+                # 4% for val
+                if rng.uniform(0, 1) > args.val_ratio:
+                    split = 'train'
+                else:
+                    split = 'val'
+                rows[split].append([binary, [get_caption(gts['txt'][0][i])], img_name, split])
+
+            for split, split_rows in rows.items():
+                writers[split].write(split_rows)
+            pbar.update(len(binaries))
+
+    for writer in writers.values():
+        writer.finish()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert SynthText to the arrow files read by SynthTextDataset")
+    parser.add_argument("--dataset_root", default="./data")
+    parser.add_argument("--max_images", type=int, default=0, help="number of images to convert (0: all)")
+    parser.add_argument("--batch_size", type=int, default=1000, help="number of images per record batch")
+    parser.add_argument("--num_threads", type=int, default=16, help="number of threads reading the images")
+    parser.add_argument("--shard_size", type=int, default=0,
+                        help="maximal number of images per arrow file (0: a single file per split)")
+    parser.add_argument("--val_ratio", type=float, default=0.04)
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())